@@ -1,21 +1,32 @@
 import os
+import asyncio
+import tempfile
+import hashlib
+import sqlite3
+import subprocess
+import numpy as np
 import pandas as pd
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from yaml import CLoader as Loader, load
 
-from script_utils import run_cmd, show_output, show_cmd
+from script_utils import show_output, show_cmd
+from table_cache import read_cached, has_arrow
+from variant_key import build_key_table, variant_keys, merge_on_key, variant_cols
+from interval_index import chrom_names
+from anno_cache import open_anno_cache, set_protocol, get_annotations, put_annotations
+from native_anno import annotate_native, is_snv
+from vcf_utils import is_vcf, iter_vcf
 
 
-def get_anno_params(config_file, threads=4):
+def get_anno_dbs(config_file, verbose=0):
     '''
-    helper function to create full annovar parameters from configs and threads
-    the actual file will be included by replacing the <file> placeholder
+    returns the config, the humandb path and the available anno dbs of the config with their annovar operation
+    with verbose, dbs missing in humandb are reported (only once per run, see annotate_variants)
     '''
 
     # load annovar configs
-    with open(config_file, "r") as stream:
-        config = load(stream, Loader=Loader)
-    config
+    config = load_anno_config(config_file)
     
     # get the full path to humandb
     humandb = os.path.join(os.environ['STATIC'], config['humandb'])
@@ -42,11 +53,9 @@ def get_anno_params(config_file, threads=4):
         else:
             missing_list.append(anno)
 
-    # create the protocol string
-    protocol = ','.join(anno_list)
-    if missing_list:
+    if missing_list and verbose:
         show_output(f"{' '.join(missing_list)} not found for {build}! Doing without.. ", color="warning")
-    # create the operation string 'g,r,f,f,f,f' assuming all but the first three dbs (ref, cytoBand, superDups) in config to be filter-based
+    # create the operation list 'g,r,f,f,f,f' assuming all but the first three dbs (ref, cytoBand, superDups) in config to be filter-based
     operation_list = []
     for anno in anno_list:
         if "Gene" in anno:
@@ -55,71 +64,414 @@ def get_anno_params(config_file, threads=4):
             operation_list.append('r')
         else:
             operation_list.append('f')
-    operation = ','.join(operation_list)
+    return config, humandb, anno_list, operation_list
+
+
+def get_native_dbs(config_file, verbose=0):
+    '''
+    returns the gene- and filter-based dbs listed under native in the config as list of (db, humandb file, operation)
+    these dbs are annotated in-process (see native_anno) instead of by annovar
+    '''
+
+    config, humandb, anno_list, operation_list = get_anno_dbs(config_file, verbose=verbose)
+    native = config.get('native', None) or []
+    operations = ['g', 'f']
+    if native and not has_arrow():
+        if verbose:
+            show_output("Native annotation of filter-based dbs needs pyarrow - using annovar for them", color="warning")
+        operations = ['g']
+    return [
+        (anno, os.path.join(humandb, f"{config['build']}_{anno}.txt"), operation) for anno, operation in zip(anno_list, operation_list)
+        if operation in operations and anno in native
+    ]
+
+
+def get_anno_params(config_file, threads=4, dbs=[]):
+    '''
+    helper function to create full annovar parameters from configs and threads
+    the actual file will be included by replacing the <file> placeholder
+    native dbs (see get_native_dbs) are left out; returns "" if no dbs are left for annovar
+    with dbs, the command is built for only these dbs (native or not)
+    '''
+
+    config, humandb, anno_list, operation_list = get_anno_dbs(config_file)
+    if dbs:
+        anno_ops = [(anno, operation) for anno, operation in zip(anno_list, operation_list) if anno in dbs]
+    else:
+        native = [db for db, _, _ in get_native_dbs(config_file)]
+        anno_ops = [(anno, operation) for anno, operation in zip(anno_list, operation_list) if anno not in native]
+    if not anno_ops:
+        return ""
+
+    # create the protocol and operation string
+    protocol = ','.join(anno for anno, _ in anno_ops)
+    operation = ','.join(operation for _, operation in anno_ops)
     
     # now build the command
     c_anno = f"perl {config['annovar_path']}/table_annovar.pl"
     c_fix = '-nastring "." --remove'
     c_thread = f"--maxgenethread {threads} --thread {threads}"
-    full_cmd = f'{c_anno} -buildver {build} {c_thread} --protocol {protocol} --operation {operation} {c_fix} --outfile <out_file> <in_file> {humandb}'
+    full_cmd = f'{c_anno} -buildver {config["build"]} {c_thread} --protocol {protocol} --operation {operation} {c_fix} --outfile <out_file> <in_file> {humandb}'
     return full_cmd
 
 
-def run_annovar(file, annovar_config={}, threads=6, temp_folder="", cleanup=True):
+def load_anno_config(config_file):
+    '''
+    loads the annovar config yaml
+    '''
+
+    with open(config_file, "r") as stream:
+        return load(stream, Loader=Loader)
+
+
+def split_shards(df, shards=1, shard_by="chrom"):
+    '''
+    splits the rows of df into shards of row positions for parallel annotation
+        - shard_by="chrom": one shard per chromosome (largest first)
+        - shard_by="blocks": shards balanced blocks of adjacent positions
+    '''
+
+    if shards <= 1:
+        return [np.arange(len(df.index))]
+    if shard_by == "chrom":
+        chrom_ids = pd.factorize(df['Chr'])[0]
+        order = np.argsort(chrom_ids, kind="mergesort")
+        bounds = np.r_[0, np.flatnonzero(np.diff(chrom_ids[order])) + 1, len(order)]
+        parts = [order[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+        return sorted(parts, key=len, reverse=True)
+    order = np.argsort(variant_keys(df)[0], kind="mergesort")
+    return [part for part in np.array_split(order, shards) if len(part)]
+
+
+def annotate_shard(shard_df, shard_folder, anno_cmd, out_name):
+    '''
+    runs table_annovar.pl on the variants of shard_df in shard_folder
+    returns the annotations aligned to the rows of shard_df (column anno_row holds the row positions in shard_df)
+    '''
+
+    os.makedirs(shard_folder, exist_ok=True)
+    in_file = os.path.join(shard_folder, "anno_file.csv")
+    out_file = os.path.join(shard_folder, "annovar_out")
+    shard_df.loc[:, variant_cols].to_csv(in_file, sep="\t", index=False, header=False)
+    with open(os.path.join(shard_folder, "annovar.log"), "w") as log:
+        process = subprocess.run(anno_cmd.replace("<out_file>", out_file).replace("<in_file>", in_file), shell=True, stdout=log, stderr=subprocess.STDOUT)
+    if process.returncode:
+        raise RuntimeError(f"table_annovar.pl failed with exit code {process.returncode} (see {shard_folder}/annovar.log)")
+    anno_df = pd.read_csv(f"{out_file}.{out_name}", sep="\t")
+    # annovar keeps the input order, so the rows line up unless annovar skipped variants
+    key_table = build_key_table(anno_df, shard_df)
+    anno_keys = variant_keys(anno_df, key_table)[0]
+    if len(anno_keys) == len(shard_df.index) and (anno_keys == variant_keys(shard_df, key_table)[0]).all():
+        return anno_df.assign(anno_row=np.arange(len(anno_df.index)))
+    return merge_on_key(anno_df, shard_df.loc[:, variant_cols].assign(anno_row=np.arange(len(shard_df.index))), one_to_one=True)
+
+
+def anno_protocol(annovar_config):
+    '''
+    returns a hash of everything that determines the annotations of a variant:
+    the annovar commands (build, protocol, operations, paths), the config file and the humandb files of the build
+    '''
+
+    config = load_anno_config(annovar_config)
+    humandb = os.path.join(os.environ['STATIC'], config['humandb'])
+    sha = hashlib.sha1(get_anno_params(annovar_config, threads=1).encode())
+    # the indels of native gene-based dbs are annotated by annovar
+    gene_dbs = [db for db, _, operation in get_native_dbs(annovar_config) if operation == 'g']
+    if gene_dbs:
+        sha.update(get_anno_params(annovar_config, threads=1, dbs=gene_dbs).encode())
+    with open(annovar_config, "rb") as stream:
+        sha.update(stream.read())
+    for file in sorted(os.listdir(humandb)):
+        if file.startswith(config['build']):
+            stat = os.stat(os.path.join(humandb, file))
+            sha.update(f"{file}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return sha.hexdigest()
+
+
+def variant_ids(df):
+    '''
+    returns the variants of df as strings Chr:Start:End:Ref:Alt (normalized chromosome names)
+    '''
+
+    ids = pd.Series(chrom_names(df['Chr']), index=df.index)
+    for col in variant_cols[1:]:
+        ids = ids + ":" + df[col].astype(str)
+    return ids.values
+
+
+def annotate_variants(df, annovar_config, threads=6, temp_folder="", shards=1, shard_by="chrom", retries=1):
+    '''
+    annotates the variants of df (Chr, Start, End, Ref, Alt) in shards (see run_annovar)
+    returns the annotations with the column anno_row holding the row positions in df (in input order)
+    '''
+
+    # the annovar output is named after the configured genome build
+    out_name = f"{load_anno_config(annovar_config)['build']}_multianno.txt"
+    parts = split_shards(df, shards=shards, shard_by=shard_by)
+    workers = min(max(shards, 1), len(parts))
+    anno_cmd = get_anno_params(annovar_config, threads=max(threads // workers, 1))
+    native_dbs = get_native_dbs(annovar_config, verbose=1)
+    if not anno_cmd:
+        # all dbs are annotated natively
+        anno_df = df.loc[:, variant_cols].reset_index(drop=True).assign(anno_row=np.arange(len(df.index)))
+        parts = []
+    elif workers > 1:
+        show_output(f"Annotating {len(df.index)} variants in {len(parts)} shards using {workers} concurrent annovar runs")
+        show_cmd(anno_cmd, multi=False)
+    else:
+        show_cmd(anno_cmd.replace("<out_file>", os.path.join(temp_folder, "shard0", "annovar_out")).replace("<in_file>", os.path.join(temp_folder, "shard0", "anno_file.csv")), multi=False)
+
+    # run the shards (failed shards are rerun)
+    results = {}
+    pending = list(range(len(parts)))
+    for attempt in range(retries + 1):
+        if not pending:
+            break
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            jobs = {i: executor.submit(annotate_shard, df.iloc[parts[i]], os.path.join(temp_folder, f"shard{i}"), anno_cmd, out_name) for i in pending}
+        errors = {}
+        for i, job in jobs.items():
+            try:
+                results[i] = job.result()
+            except Exception as error:
+                errors[i] = error
+        pending = list(errors)
+        for i, error in errors.items():
+            show_output(f"Annotation of shard{i} failed: {error}", color="warning")
+    if pending:
+        raise RuntimeError(f"Annotation failed for {len(pending)} of {len(parts)} shards - see the logs in {temp_folder}")
+
+    # restore the input order
+    if parts:
+        anno_df = pd.concat([results[i].assign(anno_row=parts[i][results[i]['anno_row'].values]) for i in range(len(parts))])
+        anno_df = anno_df.sort_values("anno_row", kind="mergesort").reset_index(drop=True)
+    # add the natively annotated dbs
+    if native_dbs:
+        anno_rows = anno_df.pop("anno_row")
+        anno_df = pd.concat([anno_df, annotate_native(anno_df, native_dbs), anno_rows], axis=1)
+        # native gene-based annotation only covers SNVs, so the indels are annotated by annovar
+        gene_dbs = [db for db, _, operation in native_dbs if operation == 'g']
+        indel_rows = np.flatnonzero(~is_snv(anno_df)) if gene_dbs else []
+        if len(indel_rows):
+            show_output(f"Annotating {len(indel_rows)} indels with annovar for {', '.join(gene_dbs)}")
+            gene_cmd = get_anno_params(annovar_config, threads=threads, dbs=gene_dbs)
+            indel_df = annotate_shard(anno_df.iloc[indel_rows], os.path.join(temp_folder, "indels"), gene_cmd, out_name)
+            gene_cols = [col for col in indel_df.columns if col.rsplit(".", 1)[-1] in gene_dbs and col in anno_df.columns]
+            anno_df.iloc[indel_rows[indel_df['anno_row'].values], [anno_df.columns.get_loc(col) for col in gene_cols]] = indel_df.loc[:, gene_cols].values
+    return anno_df
+
+
+def annotate_cached(df, annovar_config, cache_file="", cache_rows=2000000, **kwargs):
+    '''
+    annotates the variants of df using the persistent annotation cache (see anno_cache)
+    only the variants missing in the cache are annotated with annotate_variants and then added to the cache
+    (variants dropped by annovar are cached without annotation)
+    returns the annotations with the column anno_row like annotate_variants
+    '''
+
+    if not cache_file:
+        humandb = load_anno_config(annovar_config)['humandb']
+        cache_file = os.path.join(os.environ['STATIC'], os.path.dirname(humandb.rstrip("/")), "anno_cache.sqlite")
+    config = os.path.abspath(annovar_config)
+    protocol = anno_protocol(annovar_config)
+    try:
+        conn = open_anno_cache(cache_file)
+    except (sqlite3.Error, OSError) as error:
+        show_output(f"Annotation cache {cache_file} could not be opened ({error}) - annotating without cache", color="warning")
+        return annotate_variants(df, annovar_config, **kwargs)
+    try:
+        columns = set_protocol(conn, config, protocol)
+        ids = variant_ids(df)
+        hits = get_annotations(conn, protocol, pd.unique(ids)) if columns else {}
+        is_miss = ~pd.Series(ids).isin(hits).values
+        show_output(f"{len(df.index) - is_miss.sum()} of {len(df.index)} variants found in annotation cache {cache_file}")
+        if is_miss.any():
+            # every new variant is annotated only once
+            new_ids, first_rows = np.unique(ids[is_miss], return_index=True)
+            new_rows = np.flatnonzero(is_miss)[first_rows]
+            new_df = annotate_variants(df.iloc[new_rows].loc[:, variant_cols], annovar_config, **kwargs)
+            columns = [col for col in new_df.columns if col not in variant_cols + ["anno_row"]]
+            # variants that annovar could not annotate are cached as None and not sent again
+            new_hits = dict.fromkeys(new_ids)
+            new_hits.update(zip(new_ids[new_df['anno_row'].values], new_df.loc[:, columns].astype(object).values.tolist()))
+            put_annotations(conn, protocol, config, columns, new_hits, max_rows=cache_rows)
+            show_output(f"Added {len(new_hits)} variants to annotation cache {cache_file}")
+            hits.update(new_hits)
+    finally:
+        conn.close()
+    # variants that annovar could not annotate are dropped like in annotate_variants
+    rows = np.flatnonzero(pd.Series(ids).isin([variant for variant, values in hits.items() if values is not None]).values)
+    anno_df = pd.DataFrame([hits[variant] for variant in ids[rows]], columns=columns)
+    anno_df = pd.concat([df.iloc[rows].loc[:, variant_cols].reset_index(drop=True), anno_df], axis=1)
+    return anno_df.assign(anno_row=rows)
+
+
+def annotate_df(df, annovar_config, use_cache=True, cache_file="", cache_rows=2000000, **kwargs):
+    '''
+    annotates the variants of df (cached or uncached, see run_annovar) and reattaches the other columns of df
+    '''
+
+    for col in ["Start", "End"]:
+        df[col] = df[col].astype(int)
+    df = df.reset_index(drop=True)
+    # keep other columns in other_df
+    other_cols = [col for col in df.columns if not col in variant_cols]
+
+    if use_cache:
+        anno_df = annotate_cached(df, annovar_config, cache_file=cache_file, cache_rows=cache_rows, **kwargs)
+    else:
+        anno_df = annotate_variants(df, annovar_config, **kwargs)
+    # remerge other_df
+    if other_cols:
+        anno_df = pd.concat([anno_df, df.loc[anno_df['anno_row'].values, other_cols].reset_index(drop=True)], axis=1)
+    return anno_df.drop(columns="anno_row")
+
+
+def run_annovar(file, annovar_config={}, threads=6, temp_folder="", cleanup=True, shards=1, shard_by="chrom", retries=1, use_cache=True, cache_file="", cache_rows=2000000, vcf_chunksize=200000):
     '''
     runs the annovar command from a tab_separated file or a df using an annovar_config yaml and returning a df with the annotations attached
-    if temp_folder is not provided, a temp folder is created (and deleted) 
+    if temp_folder is not provided, a unique temp folder anno_temp_* is created (and deleted) 
         - either at the basedir of the file
         - or at the execution dir if df was provided
     data frame or file is expected to have Chr, Start, End, Ref, Alt columns
+    vcf files (.vcf, .vcf.gz, .vcf.bgz) are converted directly (see vcf_utils) with the vcf fields kept as extra columns
+    and annotated in chunks of vcf_chunksize records, so only one chunk of vcf records is held in memory besides the annotations
+    with shards > 1, the variants are split by chromosome (shard_by="chrom") or into balanced position blocks (shard_by="blocks")
+    and annotated by up to shards concurrent table_annovar.pl runs sharing the threads
+    failed shards are rerun up to retries times, the result is returned in the input order
+    with use_cache, annotations are reused from (and stored in) a persistent variant cache (default next to humandb)
+    holding up to cache_rows variants (the cache file is reported in the output)
     '''
     
     is_df = isinstance(file, pd.DataFrame)
 
-    ## create temp folder and load file or df
+    ## create temp folder
+    # unique default folders keep concurrent runs apart
     if not temp_folder:
-        if is_df:
-            temp_folder = os.path.join(os.getcwd(), "anno_temp")    
-        else:
-            temp_folder = os.path.join(os.path.dirname(file), "anno_temp")
+        temp_folder = tempfile.mkdtemp(prefix="anno_temp_", dir=os.getcwd() if is_df else os.path.dirname(os.path.abspath(file)))
     # create the temp folder
     if not os.path.exists(temp_folder):
         try:
             os.makedirs(temp_folder)
-        except:
+        except OSError as error:
             show_output(f"Temp folder {temp_folder} could not be created. Please check permissions!", color="warning")
-            exit()
+            raise error
             
-    # store file as df to better handle headers and extra columns
-    df = file if is_df else pd.read_csv(file, sep="\t")
-    for col in ["Start", "End"]:
-        df.loc[:, col] = df[col].astype(int)
-    # keep other columns in other_df
-    other_cols = [col for col in df.columns if not col in ["Chr", "Start", "End", "Ref", "Alt"]]
-    
-    
-    # store headerless file for annovar computation
-    file = os.path.join(temp_folder, "anno_file.csv")
-    df.loc[:,["Chr", "Start", "End", "Ref", "Alt"]].to_csv(file, sep="\t", index=False, header=False)
-    
-    out_file = os.path.join(temp_folder, "annovar_out")
-    
-    # remove header because otherwise annovar will use header as first row
-    # i_nohead = f"{output_base}.nohead.csv"
-    # run_cmd(f"mawk 'NR > 1 {{print}}' < {i} > {i_nohead}")
-
-    anno_cmd = get_anno_params(annovar_config, threads=threads).replace("<out_file>", out_file).replace("<in_file>", file)
-    run_cmd(anno_cmd, multi=False)
-
-    # reload the file 
-    anno_df = pd.read_csv(os.path.join(temp_folder, "annovar_out.hg38_multianno.txt"), sep="\t")
-    # format_cmd = f"cat {output_base}.*.txt | {annoinfo} > {o}"
-    # run_cmd(format_cmd)
-    # remerge other_df
-    if other_cols:
-        anno_df = anno_df.merge(df, on=["Chr", "Start", "End", "Ref", "Alt"])
+    anno_kwargs = dict(threads=threads, shards=shards, shard_by=shard_by, retries=retries, use_cache=use_cache, cache_file=cache_file, cache_rows=cache_rows)
+    if is_df or not is_vcf(file):
+        # store file as df to better handle headers and extra columns
+        df = file if is_df else pd.read_csv(file, sep="\t")
+        anno_df = annotate_df(df, annovar_config, temp_folder=temp_folder, **anno_kwargs)
+    else:
+        # stream the vcf chunk by chunk (every chunk in its own subfolder)
+        parts = [
+            annotate_df(chunk, annovar_config, temp_folder=os.path.join(temp_folder, f"chunk{i}"), **anno_kwargs)
+            for i, chunk in enumerate(iter_vcf(file, chunksize=vcf_chunksize))
+        ]
+        anno_df = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=variant_cols)
+        show_output(f"Annotated {len(anno_df.index)} variants from {os.path.basename(file)} in {len(parts)} chunks")
     
     # cleanup
     if cleanup:
         shutil.rmtree(temp_folder)
-    return anno_df
\ No newline at end of file
+    return anno_df
+
+
+def annovar_jobs(files):
+    '''
+    returns the batch jobs as dict name --> file or df
+    files can be a dict or a list of files (named by path) and dfs (named df<i>)
+    '''
+
+    if isinstance(files, dict):
+        return files
+    return {(file if isinstance(file, str) else f"df{i}"): file for i, file in enumerate(files)}
+
+
+async def annotate_batch(files, annovar_config={}, max_jobs=0, threads=6, temp_folder="", cleanup=True, **kwargs):
+    '''
+    annotates many files or dfs (see annovar_jobs) with run_annovar as concurrent jobs
+    yields (name, anno_df) as soon as a job finishes (anno_df is the exception for failed jobs)
+    at most max_jobs (default: cores // threads) jobs run at once, each in its own temp folder within temp_folder
+    (default: a unique anno_batch_* folder in the execution dir)
+    kwargs are passed to run_annovar
+    '''
+
+    jobs = annovar_jobs(files)
+    max_jobs = max_jobs or max((os.cpu_count() or 1) // threads, 1)
+    batch_folder = temp_folder or tempfile.mkdtemp(prefix="anno_batch_", dir=os.getcwd())
+    os.makedirs(batch_folder, exist_ok=True)
+    semaphore = asyncio.Semaphore(max_jobs)
+    stopped = False
+    show_output(f"Annotating {len(jobs)} jobs with up to {max_jobs} concurrent runs using {threads} threads each")
+
+    async def run_job(i, name, file):
+        async with semaphore:
+            if stopped:
+                return name, None
+            show_output(f"Starting annotation of {name}")
+            job_folder = tempfile.mkdtemp(prefix=f"job{i}_", dir=batch_folder)
+            try:
+                anno_df = await asyncio.to_thread(
+                    run_annovar, file, annovar_config=annovar_config, threads=threads, temp_folder=job_folder, cleanup=cleanup, **kwargs
+                )
+            except Exception as error:
+                anno_df = error
+            return name, anno_df
+
+    tasks = [asyncio.create_task(run_job(i, name, file)) for i, (name, file) in enumerate(jobs.items())]
+    try:
+        for done, task in enumerate(asyncio.as_completed(tasks)):
+            name, anno_df = await task
+            if isinstance(anno_df, Exception):
+                show_output(f"[{done + 1}/{len(jobs)}] Annotation of {name} failed: {anno_df}", color="warning")
+            else:
+                show_output(f"[{done + 1}/{len(jobs)}] Annotation of {name} finished ({len(anno_df.index)} variants)", color="success")
+            yield name, anno_df
+    finally:
+        # jobs not yet started are dropped if the consumer stops early
+        # running jobs cannot be cancelled (threads) and are awaited before their folders are removed
+        stopped = True
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if cleanup and not temp_folder:
+            shutil.rmtree(batch_folder, ignore_errors=True)
+
+
+def run_annovar_batch(files, annovar_config={}, callback=None, **kwargs):
+    '''
+    runs annotate_batch for many files or dfs and returns a dict name --> anno_df of the successful jobs
+    callback(name, anno_df) is called as soon as a job finishes
+    works in scripts and within a running event loop (like in notebooks), where the batch gets its own loop in a thread
+    '''
+
+    async def collect():
+        results = {}
+        async for name, anno_df in annotate_batch(files, annovar_config=annovar_config, **kwargs):
+            if isinstance(anno_df, Exception):
+                continue
+            if callback:
+                callback(name, anno_df)
+            results[name] = anno_df
+        return results
+
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(collect())
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, collect()).result()
+
+
+def load_humandb(db, annovar_config, columns=[], chroms=[], names=[], cache_folder="", verbose=1):
+    '''
+    loads a humandb table (like cosmic95 --> <build>_cosmic95.txt) of the annovar_config through the table cache
+    only the columns in columns and the chromosomes in chroms (all if empty) are read
+    tables without header line need the column names in names
+    '''
+
+    config = load_anno_config(annovar_config)
+    db_file = os.path.join(os.environ['STATIC'], config['humandb'], f"{config['build']}_{db}.txt")
+    if not os.path.isfile(db_file):
+        show_output(f"{db_file} not found!", color="warning")
+        return None
+    return read_cached(db_file, columns=columns, chroms=chroms, names=names, cache_folder=cache_folder, verbose=verbose)
@@ -0,0 +1,94 @@
+import os
+import json
+import time
+import sqlite3
+from script_utils import show_output
+
+
+def open_anno_cache(cache_file):
+    '''
+    opens (or creates) the sqlite annotation cache
+        - annotations: the annotation values (json list) per protocol and variant
+        - protocols: the protocol hash and annotation columns per annovar config
+    '''
+
+    os.makedirs(os.path.dirname(os.path.abspath(cache_file)), exist_ok=True)
+    # concurrent runs (see annotate_batch) wait for each other's writes
+    conn = sqlite3.connect(cache_file, timeout=120)
+    conn.executescript('''
+        CREATE TABLE IF NOT EXISTS annotations (
+            protocol TEXT, variant TEXT, data TEXT, last_used INTEGER, PRIMARY KEY (protocol, variant)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS annotations_last_used ON annotations (last_used);
+        CREATE TABLE IF NOT EXISTS protocols (config TEXT PRIMARY KEY, protocol TEXT, columns TEXT);
+    ''')
+    return conn
+
+
+def set_protocol(conn, config, protocol):
+    '''
+    registers the current protocol hash of an annovar config
+    if the config has changed, the annotations of the old protocol are removed (unless used by another config)
+    returns the annotation columns stored for the protocol (empty list if unknown)
+    '''
+
+    row = conn.execute("SELECT protocol FROM protocols WHERE config = ?", (config,)).fetchone()
+    if row and row[0] != protocol:
+        show_output(f"Annovar config {os.path.basename(config)} has changed - invalidating cached annotations", color="warning")
+        conn.execute("DELETE FROM protocols WHERE config = ?", (config,))
+        if not conn.execute("SELECT 1 FROM protocols WHERE protocol = ?", (row[0],)).fetchone():
+            conn.execute("DELETE FROM annotations WHERE protocol = ?", (row[0],))
+    columns = conn.execute("SELECT columns FROM protocols WHERE protocol = ? AND columns != '[]'", (protocol,)).fetchone()
+    columns = json.loads(columns[0]) if columns else []
+    conn.execute("INSERT OR REPLACE INTO protocols VALUES (?, ?, ?)", (config, protocol, json.dumps(columns)))
+    conn.commit()
+    return columns
+
+
+def get_annotations(conn, protocol, variants):
+    '''
+    returns a dict variant --> annotation values for the cached variants (None for variants without annotation)
+    the hits are marked as recently used
+    '''
+
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS lookup (variant TEXT PRIMARY KEY)")
+    conn.execute("DELETE FROM lookup")
+    conn.executemany("INSERT OR IGNORE INTO lookup VALUES (?)", ((variant,) for variant in variants))
+    hits = {
+        variant: json.loads(data) for variant, data in
+        conn.execute("SELECT a.variant, a.data FROM annotations a JOIN lookup l ON a.variant = l.variant WHERE a.protocol = ?", (protocol,))
+    }
+    conn.execute("UPDATE annotations SET last_used = ? WHERE protocol = ? AND variant IN (SELECT variant FROM lookup)", (time.time_ns(), protocol))
+    conn.commit()
+    return hits
+
+
+def put_annotations(conn, protocol, config, columns, annotations, max_rows=2000000):
+    '''
+    stores a dict variant --> annotation values (in the order of columns) for the protocol
+    variants annovar could not annotate are stored with None (json null) to skip them in later runs
+    the least recently used annotations beyond max_rows are evicted
+    '''
+
+    now = time.time_ns()
+    conn.executemany(
+        "INSERT OR REPLACE INTO annotations VALUES (?, ?, ?, ?)",
+        ((protocol, variant, json.dumps(values), now) for variant, values in annotations.items())
+    )
+    conn.execute("UPDATE protocols SET columns = ? WHERE config = ?", (json.dumps(columns), config))
+    excess = conn.execute("SELECT COUNT(*) FROM annotations").fetchone()[0] - max_rows
+    if excess > 0:
+        conn.execute("DELETE FROM annotations WHERE (protocol, variant) IN (SELECT protocol, variant FROM annotations ORDER BY last_used LIMIT ?)", (excess,))
+    conn.commit()
+
+
+def clear_anno_cache(cache_file):
+    '''
+    removes all cached annotations
+    '''
+
+    conn = open_anno_cache(cache_file)
+    conn.executescript("DELETE FROM annotations; DELETE FROM protocols;")
+    conn.commit()
+    conn.execute("VACUUM")
+    conn.close()
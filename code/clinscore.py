@@ -1,8 +1,12 @@
+import os
+import hashlib
 from yaml import CLoader as Loader, load
 import pandas as pd
 import numpy as np
 from script_utils import show_output
-from multiprocessing import Pool
+from pyseq_utils import partition_bounds
+from pool_utils import get_pool, map_df_parts
+from variant_key import variant_keys, dedup_by_key, position_groups
 from functools import partial
 
 def load_weights(clinscore_file):
@@ -15,46 +19,218 @@ def load_weights(clinscore_file):
     return cosmic_weights
 
 
+cosmic90_pattern = (r"(?P<count>[0-9]+)x\((?P<types>[^@)]+)(?:@(?P<location>[^0-9@)]+))?\)")
+
+
+def parse_cosmic_types(type_col):
+    '''
+    parses a cosmic "type" column into a columnar token index
+    every distinct type string is only parsed once and each token is stored as
+    (string-id, count, type-id, location-id) with the distinct types and locations as lookups
+    '''
+
+    # code the (cleaned) type strings so that recurring strings are parsed only once
+    type_col = type_col.str.replace("_(sclerosing_haemangioma)", "", regex=False)
+    row_ids, type_strings = pd.factorize(type_col)
+    tokens = pd.Series(type_strings, dtype=object).str.extractall(cosmic90_pattern)
+    # missing locations are coded as -1 and will point to a zero weight
+    type_ids, types = pd.factorize(tokens['types'])
+    loc_ids, locations = pd.factorize(tokens['location'])
+    return dict(
+        row_ids=row_ids,
+        string_ids=tokens.index.get_level_values(0).values,
+        count=tokens['count'].astype(np.int64).values,
+        type_ids=type_ids,
+        loc_ids=loc_ids,
+        types=list(types),
+        locations=list(locations),
+        string_n=len(type_strings)
+    )
+
+
+def weight_array(keys, weights, default=0):
+    '''
+    translates a weights dictionary into an array aligned to keys
+    an extra trailing default is added as target for missing (-1) ids
+    '''
+
+    return np.array([weights.get(key, default) for key in keys] + [default])
+
+
+def score_type_index(type_index, clinscore_weights={}, missing=0):
+    '''
+    computes the row-wise cosmic scores from a token index created by parse_cosmic_types
+    score per token is (1 + type_weight * location_weight) * count
+    rows without tokens (or without type) get the missing score
+    '''
+
+    type_w = weight_array(type_index['types'], clinscore_weights['type'])
+    loc_w = weight_array(type_index['locations'], clinscore_weights['location'])
+    token_scores = (1 + type_w[type_index['type_ids']] * loc_w[type_index['loc_ids']]) * type_index['count']
+    # sum up the tokens per type string and map the strings back to the rows
+    string_scores = np.bincount(type_index['string_ids'], weights=token_scores, minlength=type_index['string_n']).astype(int)
+    if missing == 0:
+        return np.append(string_scores, 0)[type_index['row_ids']]
+    has_tokens = np.bincount(type_index['string_ids'], minlength=type_index['string_n']) > 0
+    return np.append(np.where(has_tokens, string_scores, missing), missing)[type_index['row_ids']]
+
+
+def type_count_matrix(type_index):
+    '''
+    condenses a type index into a sparse (COO) count matrix of type strings x (type, location) pairs
+    '''
+
+    # combine type and location ids into pair ids (location -1 is shifted to 0)
+    pair_codes = type_index['type_ids'].astype(np.int64) * (len(type_index['locations']) + 1) + type_index['loc_ids'] + 1
+    pair_ids, pairs = pd.factorize(pair_codes)
+    # sum up the counts of identical pairs within the same string
+    cells = type_index['string_ids'].astype(np.int64) * len(pairs) + pair_ids
+    cells, cell_ids = np.unique(cells, return_inverse=True)
+    return dict(
+        string_ids=cells // len(pairs),
+        pair_ids=cells % len(pairs),
+        count=np.bincount(cell_ids.ravel(), weights=type_index['count'], minlength=len(cells)),
+        pair_type_ids=pairs // (len(type_index['locations']) + 1),
+        pair_loc_ids=pairs % (len(type_index['locations']) + 1) - 1,
+        string_n=type_index['string_n']
+    )
+
+
+def score_type_matrix(count_matrix, type_index, weights_list):
+    '''
+    computes the type string scores for a list of weights dictionaries in one pass
+    by multiplying the count matrix with a (type, location) pairs x weights matrix
+    returns a type strings x weights array
+    '''
+
+    pair_w = np.column_stack([
+        1 + weight_array(type_index['types'], w['type'])[count_matrix['pair_type_ids']] * weight_array(type_index['locations'], w['location'])[count_matrix['pair_loc_ids']]
+        for w in weights_list
+    ])
+    cell_scores = pair_w[count_matrix['pair_ids']] * count_matrix['count'][:, None]
+    return np.column_stack([
+        np.bincount(count_matrix['string_ids'], weights=cell_scores[:, i], minlength=count_matrix['string_n'])
+        for i in range(len(weights_list))
+    ])
+
+
+def gene_factors(gene_col, gene_weights):
+    '''
+    returns the gene-wise multiplication factors for a gene column (1 for genes without weight)
+    '''
+
+    gene_ids, genes = pd.factorize(gene_col)
+    return weight_array(genes, gene_weights, default=1)[gene_ids]
+
+
+def type_fingerprint(type_col):
+    '''
+    returns a hash of a type column to check whether a stored type index still fits the data
+    '''
+
+    return hashlib.sha1(pd.util.hash_pandas_object(type_col, index=False).values.tobytes()).hexdigest()
+
+
+def save_type_index(type_index, index_file):
+    '''
+    stores a type index as compressed numpy archive
+    '''
+
+    arrays = {key: np.asarray(value) for key, value in type_index.items() if key not in ["types", "locations"]}
+    np.savez_compressed(
+        index_file,
+        types=np.array(type_index['types'], dtype=str),
+        locations=np.array(type_index['locations'], dtype=str),
+        **arrays
+    )
+
+
+def load_type_index(index_file):
+    '''
+    loads a type index stored with save_type_index
+    '''
+
+    with np.load(index_file) as data:
+        type_index = {key: data[key] for key in data.files}
+    type_index['types'] = list(type_index['types'])
+    type_index['locations'] = list(type_index['locations'])
+    type_index['string_n'] = int(type_index['string_n'])
+    type_index['fingerprint'] = str(type_index['fingerprint'])
+    return type_index
+
+
+def get_type_index(cosmic_df, index_file, verbose=1):
+    '''
+    loads the type index for the "type" column of cosmic_df from index_file
+    if the file does not exist or belongs to different data, the type column is parsed and the index (re-)stored
+    '''
+
+    fingerprint = type_fingerprint(cosmic_df['type'])
+    if os.path.isfile(index_file):
+        type_index = load_type_index(index_file)
+        if type_index['fingerprint'] == fingerprint:
+            if verbose:
+                show_output(f"Using stored type index {index_file}")
+            return type_index
+        show_output(f"Type index {index_file} does not match the data and will be rebuilt!", color="warning")
+    if verbose:
+        show_output(f"Parsing types for {len(cosmic_df.index)} mutations into type index {index_file}")
+    type_index = parse_cosmic_types(cosmic_df['type'])
+    type_index['fingerprint'] = fingerprint
+    save_type_index(type_index, index_file)
+    return type_index
+
+
+def score_types(type_col, clinscore_weights={}, missing=0):
+    '''
+    parses and scores a type column
+    '''
+
+    return score_type_index(parse_cosmic_types(type_col), clinscore_weights=clinscore_weights, missing=missing)
+
+
 def cosmic_score_proc(df, clinscore_weights={}, verbose=2):
     '''
     computes the clinscore from a clinscore YAML file
+    types without any Nx(type@loc) token are scored NaN
     '''
-    
-    type_weights, loc_weights = clinscore_weights['type'], clinscore_weights['location']
+
     if verbose > 1:
         show_output(
             f"Computing cosmic score for {len(df.index)} mutations", multi=True)
 
-    def compute_cosmic_score(row):
-        """
-        row-wise computation of cosmic90 scores
-        """
-        cos_score = 1 + type_weights.get(row["types"], 0) * loc_weights.get(row["location"], 0)
-    
-        return cos_score* int(row["count"])
-    
-    cosmic90_pattern = (r"(?P<count>[0-9]+)x\((?P<types>[^@)]+)(?:@(?P<location>[^0-9@)]+))?\)")
-    # df = df['type'].str.replace("_(sclerosing_haemangioma)", "", regex=False).str.extractall(cosmic90_pattern)
-    df["cosmic_score"]= df['type'].str.replace("_(sclerosing_haemangioma)", "", regex=False).str.extractall(cosmic90_pattern).apply(compute_cosmic_score, axis=1).reset_index().drop(columns="match").groupby("level_0").sum().fillna(0).astype(int)
+    df["cosmic_score"] = score_types(df['type'], clinscore_weights=clinscore_weights, missing=np.nan)
     if verbose > 1:
         show_output("Finished", multi=True)
     return df
 
 
-def get_cosmic_score(cosmic_df, cosmic_weights_file="", threads=2, verbose=1):
+def get_cosmic_score(cosmic_df, cosmic_weights_file="", threads=2, verbose=1, type_index=""):
     '''
     computes the clinscore file for a "type" column using multicore processing
+    if a type_index file is provided, the parsed types are loaded from (or stored to) that file
+    and rescoring with different weights files only needs a lookup
     '''
 
     # load the weights
     w= load_weights(cosmic_weights_file)
-    # split the data 
-    cosmic_split = np.array_split(cosmic_df, threads)
-    if verbose:
-        show_output(f"Computing cosmic score using {threads} threads.")
-    pool = Pool(threads)
-    dfs = pool.map(partial(cosmic_score_proc, clinscore_weights=w, verbose=verbose), cosmic_split)
-    df = pd.concat(dfs)
+    if type_index:
+        df = cosmic_df.copy()
+        df['cosmic_score'] = score_type_index(get_type_index(df, type_index, verbose=verbose), clinscore_weights=w)
+    else:
+        # only the distinct type strings are sent to the workers
+        row_ids, type_strings = pd.factorize(cosmic_df['type'])
+        type_strings = pd.Series(type_strings, dtype=object)
+        bounds = np.linspace(0, len(type_strings), threads + 1).astype(int)
+        type_split = [type_strings.iloc[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+        if verbose:
+            show_output(f"Computing cosmic score using {threads} threads.")
+        if threads > 1:
+            string_scores = get_pool(threads).map(partial(score_types, clinscore_weights=w), type_split)
+        else:
+            string_scores = [score_types(type_strings, clinscore_weights=w)]
+        df = cosmic_df.copy()
+        df['cosmic_score'] = np.append(np.concatenate(string_scores), 0)[row_ids]
 
     #### DEBUG
     # print(df.query("cosmic_score != cosmic_score"))
@@ -65,14 +241,61 @@ def get_cosmic_score(cosmic_df, cosmic_weights_file="", threads=2, verbose=1):
 
     if "genes" in w.keys():
         show_output(f'Inflating gene-wise scores for the following genes:\n{",".join(w["genes"].keys())}')
-        for gene in w['genes']:
-            df.loc[df[gene_col] == gene, "cosmic_score"] = df['cosmic_score'] * w['genes'][gene]
-    
+        df['cosmic_score'] = df['cosmic_score'] * gene_factors(df[gene_col], w['genes'])
+
+
     if verbose:
         show_output(f"Cosmic score finished.")
     return df
 
 
+def get_cosmic_scores(cosmic_df, cosmic_weights_files=[], verbose=1, type_index=""):
+    '''
+    computes the cosmic scores for a list of weights files in one pass
+    returns a df with one cosmic_score column per weights file (named after the file) aligned to cosmic_df
+    if a type_index file is provided, the parsed types are loaded from (or stored to) that file
+    '''
+
+    weights_list = [load_weights(weights_file) for weights_file in cosmic_weights_files]
+    if type_index:
+        type_index = get_type_index(cosmic_df, type_index, verbose=verbose)
+    else:
+        if verbose:
+            show_output(f"Parsing types for {len(cosmic_df.index)} mutations")
+        type_index = parse_cosmic_types(cosmic_df['type'])
+    if verbose:
+        show_output(f"Computing cosmic scores for {len(weights_list)} weights files.")
+    string_scores = score_type_matrix(type_count_matrix(type_index), type_index, weights_list)
+    # map the type strings back to the rows (missing types get 0)
+    scores = np.vstack([string_scores, np.zeros(len(weights_list))])[type_index['row_ids']].astype(int)
+
+    # include the gene-wise multiplication factors if applicable
+    gene_col = [col for col in cosmic_df.columns if col.startswith("Gene")][0]
+    columns = {}
+    for i, (weights_file, w) in enumerate(zip(cosmic_weights_files, weights_list)):
+        col = f"cosmic_score_{os.path.splitext(os.path.basename(weights_file))[0]}"
+        if col in columns:
+            col = f"{col}_{i}"
+        columns[col] = scores[:, i] * gene_factors(cosmic_df[gene_col], w['genes']) if "genes" in w.keys() else scores[:, i]
+    if verbose:
+        show_output(f"Cosmic scores finished.")
+    return pd.DataFrame(columns, index=cosmic_df.index)
+
+
+def join_groups(values, group_ids, ranks, sep):
+    '''
+    joins the string values of each group with sep in a vectorized way
+    values have to be sorted by group and ranks are the positions of the values within their group
+    '''
+
+    joined = values[ranks == 0].astype(object)
+    # append the n-th members of all groups in one go
+    for rank in range(1, ranks.max() + 1 if len(ranks) else 0):
+        is_rank = ranks == rank
+        joined[group_ids[is_rank]] = joined[group_ids[is_rank]] + sep + values[is_rank]
+    return joined
+
+
 def condense_muts_proc(df):
     '''
     takes a data frame with 'Chr', 'Start', 'End', 'Ref', 'Alt' and cosmic type and score and 
@@ -80,36 +303,44 @@ def condense_muts_proc(df):
     other columns are just reduced to the first occurrence (might not be what you want), so..
     ... to save what you need, implement a sorting that keeps the keepers on top
     '''
-    # first, remove duplicate exact mutations
-    df = df.drop_duplicates(['Chr', 'Start', 'End', 'Ref', 'Alt'])   
+    # first, remove duplicate exact mutations (and mutations without coords) on the packed variant key
+    keys, key_table = variant_keys(df)
+    df, keys = dedup_by_key(df, keys)
     org_cols = df.columns
     # then, in one big swoop, keep the positions and the keepers of the other data columns
     # ..and combine with the aggregated data per mutations
-    
-    df = df.groupby(['Chr', 'Start', 'End']).first().reset_index().drop(['Ref', 'Alt', 'type', 'cosmic_score'], axis=1).merge(df.groupby(['Chr', 'Start', 'End']).agg({
-    'Ref': lambda x: "/".join(x),
-    'Alt': lambda x: "/".join(x),
-    'type': lambda x: "+".join(x),
-    'cosmic_score': 'sum' 
-    }).reset_index()).loc[:, org_cols]  # restore original columns
-    return df
+    positions = position_groups(keys, key_table)
+    order = np.argsort(positions, kind="mergesort")
+    df, positions = df.iloc[order], positions[order]
+    is_first = np.r_[True, positions[1:] != positions[:-1]]
+    group_ids = np.cumsum(is_first) - 1
+    ranks = np.arange(len(df.index)) - np.flatnonzero(is_first)[group_ids]
+
+    condensed = df.groupby(group_ids, sort=False).agg({
+        **{col: 'first' for col in org_cols if col not in ['Ref', 'Alt', 'type']},
+        'cosmic_score': 'sum'
+    })
+    for col, sep in [('Ref', "/"), ('Alt', "/"), ('type', "+")]:
+        condensed[col] = join_groups(df[col].values, group_ids, ranks, sep)
+    return condensed.reset_index(drop=True).loc[:, org_cols]  # restore original columns
 
 
 def condense_muts_clinscore(df, threads, verbose=1):
     '''
     condenses the mutations to single hits per coord using condense_muts_proc
+    the data is split at position boundaries so that every position is condensed within one chunk
     '''
 
     if threads > 1:
-        cosmic_split = np.array_split(df, threads)
+        df, bounds = partition_bounds(df, ['Chr', 'Start', 'End'], threads)
         if verbose:
             show_output(f"Condensing cosmic scores using {threads} threads.")
-        pool = Pool(threads)
-        dfs = pool.map(condense_muts_proc, cosmic_split)    
-        df = pd.concat(dfs)
+        # positions and scores reach the workers via shared memory
+        dfs = map_df_parts(condense_muts_proc, df, bounds, threads)
+        df = pd.concat(dfs).reset_index(drop=True)
 
     else:
         show_output(f"Condensing cosmic scores  on a single thread.")
         df = condense_muts_proc(df)
     show_output(f"Finished condensing cosmic scores.", color="success")
-    return df
\ No newline at end of file
+    return df
@@ -1,45 +1,94 @@
+import os
 import pandas as pd
+import numpy as np
+from functools import lru_cache
 from script_utils import show_output
-from pyseq_utils import full_collapse, remove_gene_dups, pos2bed
+from pyseq_utils import full_collapse, remove_gene_dups, pos2bed, position_keys, load_anno, anno_chroms, chrom_categories, anno_categories
 from clinscore import get_cosmic_score
 from clinscore import condense_muts_clinscore
+from export_utils import export_sheets, export_background
+from panel_cache import cached_stage, stage_key, hash_df, hash_file
+from fasta_utils import fetch_regions
+from pool_utils import map_chroms
 
 
-def roll(chrom_df, window_size):
+def sliding_max(values, window_size):
+    '''
+    returns the maxima of all windows of window_size consecutive values in O(n) (van Herk/Gil-Werman)
+    the values are cut into blocks of window_size, so every window is the suffix of one block plus the prefix of the next
+    '''
+
+    n = len(values)
+    blocks = -(-n // window_size)
+    padded = np.full(blocks * window_size, values.min(), dtype=values.dtype)
+    padded[:n] = values
+    padded = padded.reshape(blocks, window_size)
+    prefix = np.maximum.accumulate(padded, axis=1).ravel()
+    suffix = np.maximum.accumulate(padded[:, ::-1], axis=1)[:, ::-1].ravel()
+    return np.maximum(suffix[:n - window_size + 1], prefix[window_size - 1:n])
+
+
+def roll(df, window_size):
     '''
     performs a rolling window computation for cosmic_score density and adds the results to the df
+    expects a df sorted by Chr and Start (all chromosomes are computed at once)
+    the density of each mutation is the summed cosmic_score of the window_size mutations starting at that mutation
+    divided by the window span, the last mutations of a chromosome get the density of the last full window
+    '''
+
+    chrom_ids = pd.factorize(df['Chr'])[0]
+    start = df['Start'].values.astype(np.int64)
+    end = df['End'].values.astype(np.int64)
+    density = np.full(len(start), np.nan)
+    if len(start) >= window_size:
+        # window sums from the prefix sums and the window span from the sliding maximum of End
+        score_sums = np.r_[0, np.cumsum(df['cosmic_score'].values)]
+        win_score = score_sums[window_size:] - score_sums[:-window_size]
+        win_end = sliding_max(end, window_size)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            win_density = win_score / (win_end - start[:len(win_end)])
+        # windows reaching into the next chromosome are dropped
+        is_full = chrom_ids[window_size - 1:] == chrom_ids[:len(win_end)]
+        density[:len(win_end)][is_full] = win_density[is_full]
+    df = df.assign(cosmic_density=density)
+    # fill the overhangs via ffill
+    df['cosmic_density'] = df.groupby(chrom_ids)['cosmic_density'].ffill()
+    return df
+
+
+def roll_bp(df, window_bp):
+    '''
+    computes the cosmic_score density within +-window_bp around each mutation and adds the results to the df
+    expects a df sorted by Chr and Start (all chromosomes are computed at once)
+    the density is the summed cosmic_score of all mutations starting within the window divided by the window length
     '''
-    
-    # perform the rolling computation
-    # Chr, Start, End are kept for computation as well as re-merging
-    roll = chrom_df.rolling(window_size).agg({"Chr": "mean", "Start": min, "End":max, "cosmic_score": sum}).fillna(0).astype(int)
-    # compute the density
-    roll.loc[:, "cosmic_density"] = roll['cosmic_score'] / (roll['End'] - roll['Start'])
-    # remerge (and drop preexising cosmic_density columns if any)
-    chrom_df = chrom_df.drop(["cosmic_density"], axis=1, errors="ignore").merge(roll.drop(["End", "cosmic_score"], axis=1), on=['Chr', 'Start'], how="left")
-    # fill NA overhangs via ffill
-    chrom_df.loc[:, "cosmic_density"] = chrom_df["cosmic_density"].fillna(method="ffill")
-    return chrom_df
 
+    # combine chromosome and position into one sortable key
+    pos_key = pd.factorize(df['Chr'])[0].astype(np.int64) * 2**32 + df['Start'].values.astype(np.int64)
+    score_sums = np.r_[0, np.cumsum(df['cosmic_score'].values)]
+    win_score = score_sums[np.searchsorted(pos_key, pos_key + window_bp, side="right")] - score_sums[np.searchsorted(pos_key, pos_key - window_bp, side="left")]
+    return df.assign(cosmic_density=win_score / (2 * window_bp + 1))
 
-def compute_cosmic_density(df, filter_setting={}, verbose=1):
+
+def compute_cosmic_density(df, filter_setting={}, verbose=1, threads=1):
     '''
-    cycles through chromosomes and returns df with cosmic_density
+    computes the cosmic_density for all chromosomes at once and returns df with cosmic_density
+    the density is computed over windows of rolling_window_size mutations
+    or (if rolling_window_bp is set in filter_setting) within +-rolling_window_bp around each mutation
+    with threads > 1, the chromosomes are computed in parallel (see pool_utils.map_chroms)
     '''
-    chrom_dfs = []
     if verbose:
         show_output("Computing mutation density")
     # remove background mutations
     cosmin = filter_setting['cosmic_rolling_min']
-    df = df.query('cosmic_score >= @cosmin')
-    # cycle through chromosomes
-    for chrom in df['Chr'].unique():
-        if verbose > 1:
-            show_output(f"Rolling on chromosome {chrom}")
-        chrom_df = roll(df.query("Chr == @chrom"), window_size=filter_setting['rolling_window_size'])
-        chrom_dfs.append(chrom_df)
-
-    df = pd.concat(chrom_dfs)
+    df = df.query('cosmic_score >= @cosmin').sort_values(['Chr', 'Start', 'cosmic_score'], ascending=[True, True, False], kind="mergesort").reset_index(drop=True)
+    window_bp = filter_setting.get('rolling_window_bp', 0)
+    roll_func, window = (roll_bp, dict(window_bp=window_bp)) if window_bp else (roll, dict(window_size=filter_setting['rolling_window_size']))
+    if threads > 1:
+        df = pd.concat(map_chroms(roll_func, df, threads, **window), ignore_index=True)
+    else:
+        df = roll_func(df, **window)
+
     df.loc[:, 'cosmic_density'] = df['cosmic_density'].round(1)
     df.loc[:, "cosmic_score"] = df['cosmic_score'].astype(int)
     return df
@@ -60,46 +109,130 @@ def filter_cosmic(df, filter_setting={}, verbose=1):
     return df
 
 
-def cosmic_panel_master(cosmic_df, cosmic_weights_file="", filter_setting={}, threads=10, verbose=1, condense_mut_positions=True):
+def sequence_qc(seq, offsets, lengths, min_entropy=1.5, max_homopolymer=10):
     '''
-    takes an annovar annotated mutation list and returns the collapsed mutation list based on filter list
+    computes the sequence metrics of regions in a concatenated sequence (see fasta_utils.fetch_regions)
+        - gc: GC fraction of the called bases (A, C, G, T)
+        - n_frac: fraction of uncalled bases (N and others)
+        - entropy: shannon entropy (bits) of the base composition
+        - max_homopolymer: longest run of one base
+        - low_complexity: entropy < min_entropy or max_homopolymer >= max_homopolymer
+    regions without sequence (e.g. on sequences missing in the fasta) get NaN and are not flagged
+    returns the metrics as df (one row per region)
     '''
-    
-    filter_info = "".join([f"\n\t[{col}:\t{filter_setting[col]}]" for col in ["cosmic_rolling_min", "rolling_window_size", "cosmic_min", "cosmic_density_min", "padding"]])
-    show_output(f"Creating custom panel based on limits set in filter settings.{filter_info}")
+
+    codes = np.full(256, 4, dtype=np.int64)
+    for i, base in enumerate(b"ACGT"):
+        codes[base] = i
+    seq_codes = codes[seq]
+    region_ids = np.repeat(np.arange(len(lengths)), lengths)
+    counts = np.bincount(region_ids * 5 + seq_codes, minlength=len(lengths) * 5).reshape(-1, 5)
+    called = counts[:, :4].sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        gc = (counts[:, 1] + counts[:, 2]) / called
+        n_frac = counts[:, 4] / lengths
+        p = counts[:, :4] / called[:, None]
+        entropy = np.where(called > 0, -np.nansum(np.where(p > 0, p * np.log2(p), 0), axis=1), np.nan)
+    # runs end where the base or the region changes (runs of N are not counted)
+    is_run_start = np.r_[True, (seq_codes[1:] != seq_codes[:-1]) | (region_ids[1:] != region_ids[:-1])] if len(seq) else np.zeros(0, dtype=bool)
+    run_starts = np.flatnonzero(is_run_start)
+    run_lengths = np.diff(np.r_[run_starts, len(seq)])
+    run_lengths = np.where(seq_codes[run_starts] < 4, run_lengths, 0)
+    homopolymer = np.zeros(len(lengths), dtype=np.int64)
+    np.maximum.at(homopolymer, region_ids[run_starts], run_lengths)
+    return pd.DataFrame(dict(
+        gc=np.round(gc, 3),
+        n_frac=np.round(n_frac, 3),
+        entropy=np.round(entropy, 3),
+        max_homopolymer=homopolymer,
+        low_complexity=(entropy < min_entropy) | (homopolymer >= max_homopolymer)
+    ))
+
+
+def panel_qc(panel_region_df, fasta_file, qc_setting={}, verbose=1):
+    '''
+    adds the sequence QC columns (see sequence_qc) of the (padded) panel regions using the reference genome fasta_file
+    qc_setting can set min_entropy and max_homopolymer for the low_complexity flag
+    '''
+
+    if verbose:
+        show_output(f"Computing sequence QC for {len(panel_region_df.index)} panel regions from {os.path.basename(fasta_file)}")
+    seq, offsets, lengths = fetch_regions(fasta_file, panel_region_df)
+    qc_df = sequence_qc(seq, offsets, lengths, **qc_setting)
+    panel_region_df = pd.concat([panel_region_df.reset_index(drop=True), qc_df], axis=1)
+    if verbose:
+        show_output(f"{panel_region_df['low_complexity'].sum()} regions flagged as low complexity - mean GC {panel_region_df['gc'].mean():.2f}")
+    return panel_region_df
+
+
+def score_cosmic(cosmic_df, cosmic_weights_file="", threads=10, verbose=1, condense_mut_positions=True, type_index=""):
+    '''
+    computes the cosmic scores and (optionally) condenses the mutations per position
+    '''
+
     if cosmic_weights_file:
         # remove_duplicate_positions has to be set because we are only interested in the highest interest positions
-        cosmic_scored = get_cosmic_score(cosmic_df, cosmic_weights_file=cosmic_weights_file, threads=threads, verbose=1)
+        cosmic_scored = get_cosmic_score(cosmic_df, cosmic_weights_file=cosmic_weights_file, threads=threads, verbose=verbose, type_index=type_index)
         # reduce to unique mutations (by summing up the clinscore) (needed for panel design)
         # + group by start position and keep the first
         if condense_mut_positions:
             show_output("Condensing the mutations per position.")
-            cosmic_scored = condense_muts_clinscore(cosmic_scored, threads=threads)
-    else:
-        if 'cosmic_score' in cosmic_df.columns:
-            show_output(f"Using precomputed cosmic scores! For recomputation, provide a cosmic weights file")
-            cosmic_scored = cosmic_df
-        else:
-            show_output("No clinscore in df and no weights file to compute clinscores. Sorry - stopping here!", color="warning")
-            return
-
-    # + sort by cosmic_score    # + sort by cosmic_score
-    cosmic_scored = cosmic_scored.sort_values(['Chr', 'Start', 'cosmic_score'], ascending=[True, True, False])
+            cosmic_scored = condense_muts_clinscore(cosmic_scored, threads=threads, verbose=verbose)
+        return cosmic_scored
+    if 'cosmic_score' in cosmic_df.columns:
+        show_output(f"Using precomputed cosmic scores! For recomputation, provide a cosmic weights file")
+        return cosmic_df
+    show_output("No clinscore in df and no weights file to compute clinscores. Sorry - stopping here!", color="warning")
+
+
+def cosmic_panel_master(cosmic_df, cosmic_weights_file="", filter_setting={}, threads=10, verbose=1, condense_mut_positions=True, type_index="", use_cache=True, fasta_file="", qc_setting={}):
+    '''
+    takes an annovar annotated mutation list and returns the collapsed mutation list based on filter list
+    threads are used for scoring and for the per-chromosome density and collapse stages (see pool_utils.map_chroms)
+    with a reference genome fasta_file, the panel regions get sequence QC columns (see panel_qc)
+    type_index is an optional file for storing the parsed cosmic types (see clinscore.get_type_index)
+    with use_cache, the results of every stage are cached (see panel_cache) under a key derived from the input df,
+    the weights file and the settings of the stage and its predecessors
+    so changing e.g. only the padding just reruns the collapsing
+    '''
+    
+    filter_info = "".join([f"\n\t[{col}:\t{filter_setting[col]}]" for col in ["cosmic_rolling_min", "rolling_window_size", "cosmic_min", "cosmic_density_min", "padding"]])
+    show_output(f"Creating custom panel based on limits set in filter settings.{filter_info}")
+    # derive the stage keys
+    score_key = density_key = filter_key = collapse_key = qc_key = ""
+    if use_cache:
+        score_key = stage_key(hash_df(cosmic_df), "score", dict(
+            weights=hash_file(cosmic_weights_file) if cosmic_weights_file else "",
+            condense=condense_mut_positions
+        ))
+        density_key = stage_key(score_key, "density", {col: filter_setting.get(col, 0) for col in ["cosmic_rolling_min", "rolling_window_size", "rolling_window_bp"]})
+        filter_key = stage_key(density_key, "filter", {col: filter_setting[col] for col in ["cosmic_min", "cosmic_density_min"]})
+        collapse_key = stage_key(filter_key, "collapse", dict(padding=filter_setting['padding']))
+        qc_key = stage_key(collapse_key, "qc", dict(fasta=fasta_file, mtime=os.path.getmtime(fasta_file) if fasta_file else 0, qc_setting=qc_setting))
+
+    cosmic_scored = cached_stage(score_key, score_cosmic, cosmic_df, use_cache=use_cache,
+        cosmic_weights_file=cosmic_weights_file, threads=threads, verbose=verbose, condense_mut_positions=condense_mut_positions, type_index=type_index
+    )
+    if cosmic_scored is None:
+        return
     
-    # perform rolling window computation
+    # perform rolling window computation (sorted by Chr, Start and cosmic_score)
     if verbose:
         show_output("Perform rolling window computation")
-    cosmic_denscored = compute_cosmic_density(cosmic_scored, filter_setting=filter_setting, verbose=verbose)
+    cosmic_denscored = cached_stage(density_key, compute_cosmic_density, cosmic_scored, use_cache=use_cache, verbose=verbose, filter_setting=filter_setting, threads=threads)
 
     # filter based on cosmic scores
     if verbose:
         show_output("Filtering out background mutations")
-    panel_mut_df = filter_cosmic(cosmic_denscored, filter_setting=filter_setting, verbose=verbose)
+    panel_mut_df = cached_stage(filter_key, filter_cosmic, cosmic_denscored, use_cache=use_cache, verbose=verbose, filter_setting=filter_setting)
 
     # collapse the df
     if verbose:
         show_output("Collapsing the mutations to adjacency groups")
-    panel_mut_df, panel_region_df = full_collapse(panel_mut_df, padding=filter_setting['padding'], verbose=verbose)
+    panel_mut_df, panel_region_df = cached_stage(collapse_key, full_collapse, panel_mut_df, use_cache=use_cache, verbose=verbose, padding=filter_setting['padding'], threads=threads)
+    # sequence QC of the panel regions
+    if fasta_file:
+        panel_region_df = cached_stage(qc_key, panel_qc, panel_region_df, use_cache=use_cache, verbose=verbose, fasta_file=fasta_file, qc_setting=qc_setting)
     # meaningfull output
     mutN = panel_region_df['mutN'].sum()
     kb_size = int(panel_region_df['stretch'].sum() / 1000)
@@ -107,9 +240,201 @@ def cosmic_panel_master(cosmic_df, cosmic_weights_file="", filter_setting={}, th
     return panel_mut_df, panel_region_df, cosmic_denscored
 
 
-def read_gene_list(panel_excel, gene_col="GeneInPanel"):
+def panel_chrom(cosmic_df, cosmic_weights_file="", filter_setting={}, threads=10, verbose=1, condense_mut_positions=True, type_index="", fasta_file="", qc_setting={}):
     '''
-    reads a list of Genes ("GeneInPanel") with optional notes column and (n = XX) counts
+    runs scoring, condensing, density, filtering, collapsing (and QC) of cosmic_panel_master for the mutations of one chromosome
+    returns panel_mut_df, panel_region_df and cosmic_denscored (None if nothing is left)
+    '''
+
+    cosmic_scored = score_cosmic(cosmic_df, cosmic_weights_file=cosmic_weights_file, threads=threads, verbose=verbose, condense_mut_positions=condense_mut_positions, type_index=type_index)
+    if cosmic_scored is None:
+        return
+    cosmic_denscored = compute_cosmic_density(cosmic_scored, verbose=verbose, filter_setting=filter_setting, threads=threads)
+    panel_mut_df = filter_cosmic(cosmic_denscored, verbose=verbose, filter_setting=filter_setting)
+    if panel_mut_df.empty:
+        return
+    panel_mut_df, panel_region_df = full_collapse(panel_mut_df, padding=filter_setting['padding'], verbose=verbose, threads=threads)
+    if fasta_file:
+        panel_region_df = panel_qc(panel_region_df, fasta_file, qc_setting=qc_setting, verbose=verbose)
+    return panel_mut_df, panel_region_df, cosmic_denscored
+
+
+def concat_parts(parts):
+    '''
+    concats per-chromosome results restoring the natural chromosome order and the categorical columns
+    '''
+
+    df = pd.concat(parts, ignore_index=True)
+    df['Chr'] = chrom_categories(df['Chr'].astype(str))
+    for col in anno_categories:
+        if col in df.columns and all(isinstance(part[col].dtype, pd.CategoricalDtype) for part in parts):
+            df[col] = df[col].astype("category")
+    return df
+
+
+def cosmic_panel_streamed(anno_file, out_folder, cosmic_weights_file="", filter_setting={}, threads=10, verbose=1, condense_mut_positions=True, type_index="", fasta_file="", qc_setting={}, use_cache=True):
+    '''
+    out-of-core version of cosmic_panel_master for annovar files too large for memory (like the complete cosmic release)
+    the chromosomes are loaded one at a time (through the table cache, see load_anno) and run through all stages
+    the partial results are written to out_folder (<chrom>.muts.pkl, <chrom>.regions.pkl, <chrom>.denscored.pkl)
+    so peak memory is bounded by the largest chromosome
+    the ovgroups are renumbered to continue across chromosomes, so the result matches cosmic_panel_master
+    the exonic filters in filter_setting (exonic_list, mut_list, gnomad_max) are applied while loading
+    if type_index is given, one type index per chromosome is stored as <type_index base>.<chrom><ext>
+    use_cache refers to the table cache of anno_file (stage results are not kept in memory)
+    returns panel_mut_df, panel_region_df and the list of the cosmic_denscored files
+    '''
+
+    if not cosmic_weights_file:
+        show_output("Streaming mode needs a cosmic weights file to compute the clinscores. Sorry - stopping here!", color="warning")
+        return
+    os.makedirs(out_folder, exist_ok=True)
+    exonic_setting = filter_setting if "exonic_list" in filter_setting else {}
+    chroms = anno_chroms(anno_file, use_cache=use_cache, verbose=verbose)
+    show_output(f"Creating custom panel from {os.path.basename(anno_file)} streaming {len(chroms)} chromosomes")
+    mut_parts, region_parts, denscored_files = [], [], []
+    groups = 0
+    for chrom in chroms:
+        cosmic_df = load_anno(anno_file, filter_setting=exonic_setting, chroms=[chrom], use_cache=use_cache, verbose=0)
+        if cosmic_df.empty:
+            continue
+        if verbose:
+            show_output(f"Processing chromosome {chrom} with {len(cosmic_df.index)} mutations")
+        chrom_index = f"{os.path.splitext(type_index)[0]}.{chrom}{os.path.splitext(type_index)[1]}" if type_index else ""
+        result = panel_chrom(cosmic_df, cosmic_weights_file=cosmic_weights_file, filter_setting=filter_setting, threads=threads, verbose=verbose > 1,
+            condense_mut_positions=condense_mut_positions, type_index=chrom_index, fasta_file=fasta_file, qc_setting=qc_setting
+        )
+        del cosmic_df
+        if result is None:
+            continue
+        panel_mut_df, panel_region_df, cosmic_denscored = result
+        # continue the ovgroup numbering of the previous chromosomes
+        panel_mut_df['ovgroup'] += groups
+        panel_region_df['ovgroup'] += groups
+        groups += len(panel_region_df.index)
+        for name, df in [("muts", panel_mut_df), ("regions", panel_region_df), ("denscored", cosmic_denscored)]:
+            df.to_pickle(os.path.join(out_folder, f"{chrom}.{name}.pkl"))
+        denscored_files.append(os.path.join(out_folder, f"{chrom}.denscored.pkl"))
+        mut_parts.append(panel_mut_df)
+        region_parts.append(panel_region_df)
+        del cosmic_denscored
+    if not region_parts:
+        show_output("No mutations left for the panel", color="warning")
+        return
+    panel_mut_df, panel_region_df = concat_parts(mut_parts), concat_parts(region_parts)
+    mutN = panel_region_df['mutN'].sum()
+    kb_size = int(panel_region_df['stretch'].sum() / 1000)
+    show_output(f"Finished! Library size = {kb_size}kb - {mutN} mutations included", color="success")
+    return panel_mut_df, panel_region_df, denscored_files
+
+
+def coverage_max(bounds, first, last, values):
+    '''
+    returns the maximum of the (non-negative int) values over the intervals covering each elementary segment between the sorted bounds (0 if uncovered)
+    the intervals cover the segments first to last - 1, the range updates are spread over a sparse table in O(n log n)
+    '''
+
+    n = max(len(bounds) - 1, 0)
+    has_len = last > first
+    first, last, values = first[has_len], last[has_len], values[has_len]
+    # the table only needs the levels up to the longest range
+    levels = max(int((last - first).max()).bit_length() if len(first) else 1, 1)
+    table = np.zeros((levels, n), dtype=values.dtype)
+    # every range is covered by two (overlapping) blocks of length 2**level
+    level = np.log2(last - first).astype(np.int64)
+    flat = table.reshape(-1)
+    np.maximum.at(flat, level * n + first, values)
+    np.maximum.at(flat, level * n + last - 2**level, values)
+    for level in range(levels - 1, 0, -1):
+        half = 2**(level - 1)
+        np.maximum(table[level - 1], table[level], out=table[level - 1])
+        np.maximum(table[level - 1, half:], table[level, :n - half], out=table[level - 1, half:])
+    return table[0]
+
+
+def padded_segments(start, end, padding):
+    '''
+    returns the sorted bounds of the elementary segments between the padded interval keys
+    and the first and last (exclusive) segment of every interval
+    '''
+
+    bounds = np.sort(np.r_[start - padding, end + padding])
+    bounds = bounds[np.r_[True, bounds[1:] != bounds[:-1]][:len(bounds)]]
+    return bounds, np.searchsorted(bounds, start - padding), np.searchsorted(bounds, end + padding)
+
+
+def panel_curves(segments, score, rank, bins):
+    '''
+    returns the panel size (bp), the number of mutations and the summed cosmic_score for the cosmic_min thresholds 0 to bins - 2
+    every mutation is included at the thresholds below its rank (see solve_panel_size)
+    the panel size is the length of the segments (see padded_segments) whose highest covering rank lies above the threshold
+    '''
+
+    bounds, first, last = segments
+    seg_rank = coverage_max(bounds, first, last, rank)
+    # the sums over all ranks above each threshold
+    above = lambda counts: np.cumsum(counts[::-1])[::-1][1:]
+    sizes = above(np.bincount(seg_rank, weights=np.diff(bounds), minlength=bins))
+    return sizes, above(np.bincount(rank, minlength=bins)), above(np.bincount(rank, weights=score, minlength=bins))
+
+
+def solve_panel_size(cosmic_denscored, filter_setting={}, target_kb=0, target_mutN=0, density_mins=[], paddings=[], verbose=1):
+    '''
+    searches cosmic_min, cosmic_density_min and padding for the panel that fits into target_kb and/or target_mutN
+    takes the cosmic_denscored output of cosmic_panel_master (computed with the rolling settings of filter_setting)
+    density_mins and paddings are the candidates to test
+    (defaults: quantiles of the density and the padding in filter_setting down to half of it)
+    for every combination, the panel sizes of all cosmic_min thresholds are computed at once (see panel_curves)
+    and the lowest cosmic_min that keeps the panel within the limits is taken
+    the best setting is the one covering the highest summed cosmic_score (ties go to the larger padding)
+    returns the filter_setting, the panel_mut_df and the panel_region_df
+    '''
+
+    df = cosmic_denscored.sort_values(['Chr', 'Start'], kind="mergesort")
+    score = df['cosmic_score'].values
+    density = df['cosmic_density'].values
+    start, end = position_keys(df)
+    # candidate thresholds: keep everything or stop right at each distinct score
+    cosmic_mins = np.r_[score.min() - 1, np.unique(score)] if len(score) else np.array([0])
+    if not len(density_mins):
+        density_mins = list(np.unique(np.nanquantile(density, [0.9, 0.95, 0.99, 0.999]))) + [np.inf]
+    if not len(paddings):
+        paddings = np.unique(np.round(filter_setting['padding'] * np.array([0.5, 0.75, 1])).astype(int))
+    if verbose:
+        limits = " and ".join(([f"{target_kb}kb"] if target_kb else []) + ([f"{target_mutN} mutations"] if target_mutN else []))
+        show_output(f"Searching {len(density_mins) * len(paddings)} density/padding combinations for a panel within {limits}")
+
+    best = None
+    # the mutations are included if cosmic_score > cosmic_min or cosmic_density > density_min (see filter_cosmic),
+    # so the rank of a mutation is the number of cosmic_mins below its score (all of them for dense mutations)
+    score_rank = np.searchsorted(cosmic_mins, score, side="left").astype(np.int32)
+    for padding in sorted(paddings, reverse=True):
+        segments = padded_segments(start, end, padding)
+        for density_min in density_mins:
+            rank = np.where(density > density_min, np.int32(len(cosmic_mins)), score_rank)
+            sizes, mutNs, covered = panel_curves(segments, score, rank, len(cosmic_mins) + 1)
+            # the panel shrinks with rising cosmic_min, so the first fitting threshold is the best one
+            fits = (sizes <= target_kb * 1000 if target_kb else True) & (mutNs <= target_mutN if target_mutN else True)
+            if not np.any(fits):
+                continue
+            low = np.argmax(fits)
+            if best is None or covered[low] > best[0]:
+                best = (covered[low], dict(cosmic_min=int(cosmic_mins[low]), cosmic_density_min=float(density_min), padding=int(padding)))
+    if best is None:
+        show_output("No setting found that fits the limits!", color="warning")
+        return
+    filter_setting = {**filter_setting, **best[1]}
+    panel_mut_df = filter_cosmic(df, filter_setting=filter_setting, verbose=verbose)
+    panel_mut_df, panel_region_df = full_collapse(panel_mut_df, padding=filter_setting['padding'], verbose=verbose)
+    kb_size = int(panel_region_df['stretch'].sum() / 1000)
+    show_output(f"Best setting: cosmic_min={best[1]['cosmic_min']} cosmic_density_min={best[1]['cosmic_density_min']} padding={best[1]['padding']} | Library size = {kb_size}kb - {panel_region_df['mutN'].sum()} mutations included", color="success")
+    return filter_setting, panel_mut_df, panel_region_df
+
+
+@lru_cache(maxsize=16)
+def load_gene_list(panel_excel, gene_col, mtime):
+    '''
+    cached worker of read_gene_list (mtime is part of the cache key to catch changes of the file)
     '''
     
     # read the excel file
@@ -127,15 +452,27 @@ def read_gene_list(panel_excel, gene_col="GeneInPanel"):
     return genes.loc[:, ['Gene', 'countOtherPanels', 'notes']]
 
 
-def analyze_genes(panel_mut_df, cosmic_scored, panel_excel="", save_excel=""):
+def read_gene_list(panel_excel, gene_col="GeneInPanel"):
+    '''
+    reads a list of Genes ("GeneInPanel") with optional notes column and (n = XX) counts
+    the parsed list is cached as long as the file does not change
+    '''
+
+    return load_gene_list(panel_excel, gene_col, os.path.getmtime(panel_excel)).copy()
+
+
+def analyze_genes(panel_mut_df, cosmic_scored, panel_excel="", save_excel="", save_formats=["xlsx"], background=False):
     '''
     accumulate infos
+    the results are saved to save_excel in all save_formats (xlsx, parquet, feather, tsv, bed - see export_utils.export_sheets)
+    with background, the files are written in a background thread and the call returns right away
+    (export_utils.wait_exports waits for them and raises export errors, unwaited failures are reported at exit)
     '''
     # get the top genes of all of cosmic
-    top_genes = cosmic_scored.groupby("Gene").agg({'cosmic_score':"sum", 'type':'count'}).rename({'type':'count'}, axis=1).reset_index().sort_values('cosmic_score', ascending=False)
+    top_genes = cosmic_scored.groupby("Gene", observed=True).agg({'cosmic_score':"sum", 'type':'count'}).rename({'type':'count'}, axis=1).reset_index().sort_values('cosmic_score', ascending=False)
     
     # get the genes in the designed panel sorted by cosmic score
-    gene_df = panel_mut_df.groupby("Gene").agg({'cosmic_score':'sum',  'type':'count'}).rename({'type':'count'}, axis=1).reset_index().sort_values('count', ascending=False)
+    gene_df = panel_mut_df.groupby("Gene", observed=True).agg({'cosmic_score':'sum',  'type':'count'}).rename({'type':'count'}, axis=1).reset_index().sort_values('count', ascending=False)
 
 
     # merge top cosmic genes with genes from the designed panel
@@ -159,13 +496,14 @@ def analyze_genes(panel_mut_df, cosmic_scored, panel_excel="", save_excel=""):
     in_panel = merge2.query('countPanel > 0')
     
     if save_excel:
-        show_output(f"Saving to excel file {save_excel}.")
-        # write to excel
-        with pd.ExcelWriter(save_excel, mode="w") as writer:
-            panel_mut_df.to_excel(writer, sheet_name="AllMutationsInPanel", index=False)
-            pos2bed(panel_mut_df).to_excel(writer, sheet_name="AllMutationsBed", index=False, header=None)
-            in_panel.to_excel(writer, sheet_name="GenesInPanel", index=False)
-            cosmic_not_included.to_excel(writer, sheet_name="missing_TopCosmic", index=False)
-            otherPanel_not_included.to_excel(writer, sheet_name="missing_otherPanels", index=False)
+        sheets = {
+            "AllMutationsInPanel": panel_mut_df,
+            "AllMutationsBed": pos2bed(panel_mut_df).to_frame(),
+            "GenesInPanel": in_panel,
+            "missing_TopCosmic": cosmic_not_included,
+            "missing_otherPanels": otherPanel_not_included
+        }
+        export = export_background if background else export_sheets
+        export(sheets, save_excel, formats=save_formats, bed_sheet="AllMutationsInPanel", no_header=["AllMutationsBed"])
     
     return in_panel, cosmic_not_included, otherPanel_not_included
\ No newline at end of file
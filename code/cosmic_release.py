@@ -0,0 +1,327 @@
+import numpy as np
+import pandas as pd
+from script_utils import show_output
+from interval_index import chrom_names, build_interval_index, query_interval_index
+from variant_key import build_key_table, variant_keys, variant_cols, merge_on_key, sort_by_key
+from pyseq_utils import anno_cols, anno_col, exonic_mask, full_collapse, chrom_categories
+from cosmic_panel import score_cosmic, compute_cosmic_density, filter_cosmic, panel_qc, concat_parts
+from anno import run_annovar
+
+
+def value_ids(old_df, new_df, cols):
+    '''
+    returns int64 ids of the value combinations in cols for the rows of both dfs (same values --> same id)
+    '''
+
+    ids = np.zeros(len(old_df.index) + len(new_df.index), dtype=np.int64)
+    for col in cols:
+        codes, values = pd.factorize(pd.concat([old_df[col], new_df[col]], ignore_index=True), use_na_sentinel=False)
+        # renumber the combinations to keep the ids small
+        ids = pd.factorize(ids * len(values) + codes)[0]
+    return ids[:len(old_df.index)], ids[len(old_df.index):]
+
+
+def mix_ids(ids):
+    '''
+    scrambles int64 ids into uint64 hashes (splitmix64) so that sums of hashes identify sets of ids
+    '''
+
+    with np.errstate(over="ignore"):
+        x = ids.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return x ^ (x >> np.uint64(31))
+
+
+def diff_releases(old_df, new_df, value_cols=[], verbose=1):
+    '''
+    compares two cosmic releases (annovar dfs or humandb tables with Chr, Start, End, Ref, Alt) by variant key
+    a variant has changed if its values in value_cols (default: all shared columns but the variant columns) differ
+    repeated variants are compared as a whole (independent of the order of their rows)
+    returns a dict with the rows of the added and changed (new values) variants from new_df and of the removed variants from old_df
+    '''
+
+    if not value_cols:
+        value_cols = [col for col in new_df.columns if col in old_df.columns and not col in variant_cols]
+    key_table = build_key_table(old_df, new_df)
+    old_keys, new_keys = variant_keys(old_df, key_table)[0], variant_keys(new_df, key_table)[0]
+    # the hash sums (wrapping around) are the same for repeated rows in any order
+    old_ids, new_ids = value_ids(old_df, new_df, value_cols)
+    old_prints = pd.Series(mix_ids(old_ids)).groupby(old_keys).sum().drop(-1, errors="ignore")
+    new_prints = pd.Series(mix_ids(new_ids)).groupby(new_keys).sum().drop(-1, errors="ignore")
+    shared = old_prints.index.intersection(new_prints.index)
+    changed = shared[old_prints.loc[shared].values != new_prints.loc[shared].values]
+    diff = dict(
+        added=new_df.loc[np.isin(new_keys, new_prints.index.difference(old_prints.index))],
+        removed=old_df.loc[np.isin(old_keys, old_prints.index.difference(new_prints.index))],
+        changed=new_df.loc[np.isin(new_keys, changed)]
+    )
+    if verbose:
+        show_output(f"Release diff: {len(new_prints.index) - len(shared)} added, {len(old_prints.index) - len(shared)} removed and {len(changed)} changed variants")
+    return diff
+
+
+def position_index(df):
+    '''
+    returns the positions (normalized Chr, Start, End) of the rows as index
+    '''
+
+    return pd.MultiIndex.from_arrays([chrom_names(df['Chr']), df['Start'].values.astype(np.int64), df['End'].values.astype(np.int64)])
+
+
+def annotate_added(added_df, annovar_config, filter_setting={}, **anno_kwargs):
+    '''
+    annotates the added variants of a release diff with run_annovar and converts them like load_anno
+    '''
+
+    anno_df = run_annovar(added_df.loc[:, [col for col in anno_cols if col in added_df.columns]], annovar_config=annovar_config, **anno_kwargs)
+    anno_df = anno_df.rename(columns={**{col: anno_col(col) for col in anno_df.columns}, "cytoBand": "cytoband"})
+    missing = [col for col in anno_cols if not col in anno_df.columns]
+    if missing:
+        show_output(f"Annotation of the added variants lacks the columns {', '.join(missing)}", color="warning")
+        return
+    anno_df = anno_df.loc[:, anno_cols]
+    for col in ["Start", "End"]:
+        anno_df[col] = anno_df[col].astype(np.int32)
+    anno_df['gnomAD'] = pd.to_numeric(anno_df['gnomAD'], errors="coerce").fillna(0)
+    if filter_setting:
+        anno_df = anno_df.loc[exonic_mask(anno_df, filter_setting)]
+    return anno_df
+
+
+def patch_anno(cosmic_anno, diff, annovar_config="", filter_setting={}, verbose=1, **anno_kwargs):
+    '''
+    applies a release diff (see diff_releases) to an annotated cosmic df (see load_anno)
+        - removed variants are dropped
+        - changed variants get the new release values and keep their annotation (the coords have not changed)
+        - added variants are annotated with annovar_config (unless they come with the annotation columns)
+    the exonic filters in filter_setting (exonic_list, mut_list, gnomad_max) are applied to the added variants like in load_anno
+    returns the patched df (sorted by variant) and the touched positions (see position_index)
+    '''
+
+    key_table = build_key_table(cosmic_anno, *diff.values())
+    anno_keys = variant_keys(cosmic_anno, key_table)[0]
+    drop_keys = np.r_[variant_keys(diff['removed'], key_table)[0], variant_keys(diff['changed'], key_table)[0]]
+    old_rows = cosmic_anno.loc[np.isin(anno_keys, drop_keys)]
+    parts = [cosmic_anno.loc[~np.isin(anno_keys, drop_keys)]]
+    # the changed variants take the annotation of their old rows (repeated variants by occurrence, extra occurrences from the first row)
+    changed_df = diff['changed'].loc[:, [col for col in anno_cols if col in diff['changed'].columns]]
+    if len(changed_df.index):
+        if not all(col in changed_df.columns for col in anno_cols):
+            anno_info = old_rows.loc[:, [col for col in anno_cols if col in variant_cols or not col in changed_df.columns]].assign(has_anno=True)
+            changed_df = merge_on_key(changed_df, anno_info, how="left", one_to_one=True)
+            is_extra = changed_df['has_anno'].isna().values
+            if is_extra.any():
+                first_info = anno_info.loc[~pd.Series(variant_keys(anno_info, key_table)[0]).duplicated().values]
+                changed_df = pd.concat([changed_df.loc[~is_extra], merge_on_key(changed_df.loc[is_extra, [col for col in changed_df.columns if col in diff['changed'].columns]], first_info)])
+        parts.append(changed_df.loc[:, anno_cols])
+    added_df = diff['added']
+    if len(added_df.index):
+        if all(col in added_df.columns for col in anno_cols):
+            added_df = added_df.loc[:, anno_cols]
+            if filter_setting:
+                added_df = added_df.loc[exonic_mask(added_df, filter_setting)]
+        elif annovar_config:
+            if verbose:
+                show_output(f"Annotating {len(added_df.index)} added variants")
+            added_df = annotate_added(added_df, annovar_config, filter_setting=filter_setting, **anno_kwargs)
+            if added_df is None:
+                return None, None
+        else:
+            show_output("Added variants without annotation need an annovar config. Sorry - stopping here!", color="warning")
+            return None, None
+        parts.append(added_df)
+    touched = position_index(pd.concat([df.loc[:, variant_cols] for df in diff.values()])).unique()
+    # the variant order keeps the condensed mutations (see condense_muts_proc) independent of the patch order
+    cosmic_anno = concat_parts(parts)
+    cosmic_anno = sort_by_key(cosmic_anno, variant_keys(cosmic_anno)[0])[0].reset_index(drop=True)
+    if verbose:
+        show_output(f"Patched annotations: {len(cosmic_anno.index)} mutations at {len(touched)} touched positions")
+    return cosmic_anno, touched
+
+
+def panel_changes(old_region_df, new_region_df):
+    '''
+    compares the regions of two panels (see full_collapse) via the interval index
+        - entered: new regions not overlapping any old region
+        - left: old regions not overlapping any new region
+        - resized: overlapping regions with different coords (one row per overlapping pair, also for merged or split regions)
+    returns the changes with Chr, Start, End and mutN of the new region, Start_old, End_old and mutN_old of the old region,
+    Gene and the status
+    '''
+
+    cols = ['Chr', 'Start', 'End', 'Gene', 'mutN']
+    old_df = old_region_df.loc[:, cols].reset_index(drop=True).astype({'Chr': str, 'Gene': object})
+    new_df = new_region_df.loc[:, cols].reset_index(drop=True).astype({'Chr': str, 'Gene': object})
+    # touching regions are separate regions (see merge_intervals), so the inclusive query runs on End - 1
+    old_rows, new_rows = query_interval_index(build_interval_index(new_df.assign(End=new_df['End'] - 1)), old_df.assign(End=old_df['End'] - 1))
+    old_cols = {'Start': 'Start_old', 'End': 'End_old', 'mutN': 'mutN_old'}
+    pairs = pd.concat([new_df.iloc[new_rows].reset_index(drop=True), old_df.iloc[old_rows].loc[:, list(old_cols)].rename(columns=old_cols).reset_index(drop=True)], axis=1)
+    changes = pd.concat([
+        new_df.loc[~np.isin(np.arange(len(new_df.index)), new_rows)].assign(status="entered"),
+        old_df.loc[~np.isin(np.arange(len(old_df.index)), old_rows)].rename(columns=old_cols).assign(status="left"),
+        pairs.loc[(pairs['Start'] != pairs['Start_old']) | (pairs['End'] != pairs['End_old'])].assign(status="resized")
+    ], ignore_index=True).reindex(columns=['Chr', 'Start', 'End', 'Start_old', 'End_old', 'Gene', 'mutN', 'mutN_old', 'status'])
+    changes['Chr'] = chrom_categories(changes['Chr'])
+    changes = changes.astype({col: "Int64" for col in ['Start', 'End', 'Start_old', 'End_old', 'mutN', 'mutN_old']})
+    changes = changes.assign(pos=changes['Start'].fillna(changes['Start_old'])).sort_values(['Chr', 'pos'], kind="mergesort")
+    return changes.drop(columns="pos").reset_index(drop=True)
+
+
+def renumber_groups(panel_mut_df, panel_region_df):
+    '''
+    sorts the regions (and their mutations) by Chr and Start and renumbers the (unique) ovgroups from 1
+    '''
+
+    panel_region_df = panel_region_df.sort_values(['Chr', 'Start'], kind="mergesort").reset_index(drop=True)
+    ovgroups = pd.Series(np.arange(1, len(panel_region_df.index) + 1), index=panel_region_df['ovgroup'].values)
+    panel_region_df['ovgroup'] = ovgroups.values
+    panel_mut_df = panel_mut_df.sort_values(['Chr', 'Start'], kind="mergesort").reset_index(drop=True)
+    panel_mut_df['ovgroup'] = ovgroups.loc[panel_mut_df['ovgroup'].values].values
+    return panel_mut_df, panel_region_df
+
+
+def overlap_mask(df, regions):
+    '''
+    marks the rows of df overlapping any of the regions (both with half-open coords Start, End like the padded intervals of merge_intervals)
+    '''
+
+    if not len(df.index) or not len(regions.index):
+        return np.zeros(len(df.index), dtype=bool)
+    rows = query_interval_index(build_interval_index(regions.assign(End=regions['End'] - 1)), df.assign(End=df['End'] - 1))[0]
+    return np.isin(np.arange(len(df.index)), rows)
+
+
+def density_windows(denscored, touched, filter_setting):
+    '''
+    finds the rows of a density table (sorted like compute_cosmic_density) whose density window contains a touched position
+    returns the mask of these dirty rows and the mask of the rows their windows need
+        - rolling_window_size: the window_size mutations from each row on (the last rows of a chromosome use the last full window)
+        - rolling_window_bp: the mutations within +-rolling_window_bp
+    '''
+
+    chroms = chrom_names(denscored['Chr'])
+    chrom_ids = pd.factorize(chroms)[0].astype(np.int64)
+    keys = chrom_ids * 2**32 + denscored['Start'].values.astype(np.int64)
+    touched_ids = pd.Series(touched.get_level_values(0)).map({chrom: i for i, chrom in enumerate(pd.unique(chroms))})
+    has_chrom = touched_ids.notna().values
+    touched_keys = np.sort(touched_ids.values[has_chrom].astype(np.int64) * 2**32 + touched.get_level_values(1).values[has_chrom].astype(np.int64))
+    rows = np.arange(len(keys))
+    window_bp = filter_setting.get('rolling_window_bp', 0)
+    if window_bp:
+        first = np.searchsorted(keys, keys - window_bp, side="left")
+        last = np.searchsorted(keys, keys + window_bp, side="right") - 1
+        lo, hi = keys - window_bp, keys + window_bp
+    else:
+        window_size = filter_setting['rolling_window_size']
+        chrom_start = np.searchsorted(chrom_ids, chrom_ids, side="left")
+        chrom_end = np.searchsorted(chrom_ids, chrom_ids, side="right")
+        # chromosomes with less than window_size mutations have no density at all
+        is_full = chrom_end - chrom_start >= window_size
+        first = np.minimum(rows, np.where(is_full, chrom_end - window_size, chrom_start))
+        last = np.where(is_full, np.minimum(rows + window_size, chrom_end) - 1, chrom_end - 1)
+        # windows reaching the chromosome end also change with the mutations behind the last one
+        lo = np.where(is_full, keys[first], chrom_ids * 2**32)
+        hi = np.where(last == chrom_end - 1, (chrom_ids + 1) * 2**32 - 1, keys[last])
+    is_dirty = np.searchsorted(touched_keys, hi, side="right") > np.searchsorted(touched_keys, lo, side="left")
+    # the rows needed by the dirty windows
+    cover = np.zeros(len(keys) + 1, dtype=np.int64)
+    np.add.at(cover, first[is_dirty], 1)
+    np.add.at(cover, last[is_dirty] + 1, -1)
+    return is_dirty, np.cumsum(cover[:-1]) > 0
+
+
+def refresh_density(cosmic_scored, cosmic_denscored, touched, filter_setting={}, verbose=1):
+    '''
+    updates the density table of the old release (see compute_cosmic_density) to the rescored cosmic_scored
+    only the densities of windows containing touched positions are recomputed, the other rows keep their old density
+    returns the new density table and the mask of its rows with recomputed density
+    '''
+
+    cosmin = filter_setting['cosmic_rolling_min']
+    denscored = cosmic_scored.query('cosmic_score >= @cosmin').sort_values(['Chr', 'Start', 'cosmic_score'], ascending=[True, True, False], kind="mergesort").reset_index(drop=True)
+    is_dirty, is_needed = density_windows(denscored, touched, filter_setting)
+    density = np.full(len(denscored.index), np.nan)
+    # the untouched rows are in the same order in both releases
+    is_kept = ~position_index(denscored).isin(touched)
+    old_kept = cosmic_denscored.loc[~position_index(cosmic_denscored).isin(touched), 'cosmic_density'].values
+    if len(old_kept) == is_kept.sum():
+        density[is_kept] = old_kept
+    else:
+        show_output("The density table does not match the scores of the old release and is recomputed", color="warning")
+        is_dirty = is_needed = np.ones(len(denscored.index), dtype=bool)
+    if is_dirty.any():
+        # every stretch of needed rows is computed as separate sequence (its own Chr) so windows do not reach into other stretches
+        needed_rows = np.flatnonzero(is_needed)
+        needed_chroms = chrom_names(denscored['Chr'].iloc[needed_rows])
+        stretches = np.cumsum(np.r_[True, (np.diff(needed_rows) > 1) | (needed_chroms[1:] != needed_chroms[:-1])][:len(needed_rows)])
+        needed_df = compute_cosmic_density(denscored.iloc[needed_rows].assign(Chr=stretches), filter_setting=filter_setting, verbose=0)
+        density[needed_rows[is_dirty[needed_rows]]] = needed_df['cosmic_density'].values[is_dirty[needed_rows]]
+    if verbose:
+        show_output(f"Recomputed the density of {is_dirty.sum()} of {len(denscored.index)} mutations")
+    denscored = denscored.assign(cosmic_density=density)
+    denscored['cosmic_score'] = denscored['cosmic_score'].astype(int)
+    return denscored, is_dirty
+
+
+def refresh_panel(cosmic_anno, cosmic_scored, panel, diff, cosmic_weights_file="", filter_setting={}, annovar_config="", threads=10, verbose=1, condense_mut_positions=True, fasta_file="", qc_setting={}, **anno_kwargs):
+    '''
+    updates a cosmic panel to a new cosmic release without rerunning the whole database
+        - cosmic_anno is the annotated old release (see load_anno)
+        - cosmic_scored are its scores (see score_cosmic, cosmic_panel_master reuses them if no weights file is given)
+        - panel is the result of cosmic_panel_master (panel_mut_df, panel_region_df, cosmic_denscored)
+        - diff is the release diff (see diff_releases)
+    the annotations are patched (see patch_anno) and only the touched positions are rescored
+    only the densities of windows containing touched positions are recomputed (see refresh_density)
+    and only the regions overlapping changed mutations (extended by the padding) are filtered and collapsed again
+    anno_kwargs are passed to run_annovar for the added variants
+    returns the patched cosmic_anno and cosmic_scored, the new panel and the region changes (see panel_changes)
+    '''
+
+    panel_mut_df, panel_region_df, cosmic_denscored = panel
+    cosmic_anno, touched = patch_anno(cosmic_anno, diff, annovar_config=annovar_config, filter_setting=filter_setting, verbose=verbose, **anno_kwargs)
+    if cosmic_anno is None:
+        return
+    if not len(touched):
+        show_output("No changes between the releases - the panel stays the same", color="success")
+        return cosmic_anno, cosmic_scored, panel, panel_changes(panel_region_df, panel_region_df)
+    # rescore all mutations at the touched positions (condensing combines the mutations per position)
+    scored_parts = [cosmic_scored.loc[~position_index(cosmic_scored).isin(touched)]]
+    is_touched = position_index(cosmic_anno).isin(touched)
+    if is_touched.any():
+        scored_parts.append(score_cosmic(cosmic_anno.loc[is_touched], cosmic_weights_file=cosmic_weights_file, threads=threads, verbose=verbose, condense_mut_positions=condense_mut_positions))
+    cosmic_scored = concat_parts(scored_parts).sort_values(['Chr', 'Start', 'End'], kind="mergesort").reset_index(drop=True)
+
+    # only the densities depending on the touched positions are recomputed
+    cosmic_denscored, is_dirty = refresh_density(cosmic_scored, cosmic_denscored, touched, filter_setting=filter_setting, verbose=verbose)
+    # the old regions overlapping changed mutations (extended by the padding) are rebuilt from their mutations
+    padding = filter_setting['padding']
+    pad = lambda df: df.assign(Start=df['Start'] - padding, End=df['End'] + padding)
+    changed_df = pad(pd.concat([
+        cosmic_denscored.loc[is_dirty, ['Chr', 'Start', 'End']].astype({'Chr': str}),
+        pd.DataFrame(dict(Chr=touched.get_level_values(0), Start=touched.get_level_values(1), End=touched.get_level_values(2)))
+    ], ignore_index=True))
+    is_stale = overlap_mask(panel_region_df, changed_df)
+    # the mutations of the stale regions and the changed mutations are collapsed again
+    rebuild_df = pd.concat([changed_df, panel_region_df.loc[is_stale, ['Chr', 'Start', 'End']].astype({'Chr': str})], ignore_index=True)
+    is_rebuilt = overlap_mask(pad(cosmic_denscored), rebuild_df)
+    show_output(f"Refreshing {is_stale.sum()} of {len(panel_region_df.index)} regions")
+    mut_df = filter_cosmic(cosmic_denscored.loc[is_rebuilt], filter_setting=filter_setting, verbose=verbose)
+    if mut_df.empty:
+        mut_df, region_df = panel_mut_df.iloc[:0], panel_region_df.iloc[:0]
+    else:
+        mut_df, region_df = full_collapse(mut_df, padding=padding, verbose=verbose)
+        if fasta_file:
+            region_df = panel_qc(region_df, fasta_file, qc_setting=qc_setting, verbose=verbose)
+    # keep the other regions (the new ovgroups are moved behind the old ones before renumbering)
+    offset = panel_region_df['ovgroup'].max() if len(panel_region_df.index) else 0
+    new_panel_mut_df, new_panel_region_df = renumber_groups(
+        concat_parts([panel_mut_df.loc[~np.isin(panel_mut_df['ovgroup'].values, panel_region_df['ovgroup'].values[is_stale])], mut_df.assign(ovgroup=mut_df['ovgroup'] + offset)]),
+        concat_parts([panel_region_df.loc[~is_stale], region_df.assign(ovgroup=region_df['ovgroup'] + offset)])
+    )
+
+    changes = panel_changes(panel_region_df, new_panel_region_df)
+    mutN = new_panel_region_df['mutN'].sum()
+    kb_size = int(new_panel_region_df['stretch'].sum() / 1000)
+    show_output(f"Finished! Library size = {kb_size}kb - {mutN} mutations included ({(changes['status'] == 'entered').sum()} regions entered, {(changes['status'] == 'left').sum()} left, {(changes['status'] == 'resized').sum()} resized)", color="success")
+    return cosmic_anno, cosmic_scored, (new_panel_mut_df, new_panel_region_df, cosmic_denscored), changes
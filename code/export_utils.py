@@ -0,0 +1,148 @@
+import os
+import atexit
+import importlib.util
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from script_utils import show_output
+
+# single background writer so that exports are written one after the other
+export_state = dict(executor=None, jobs=[])
+
+
+def df2lines(df, sep="\t"):
+    '''
+    builds the text lines of a df column-wise (vectorized) instead of row by row
+    '''
+
+    lines = None
+    for col in df.columns:
+        values = df[col].astype(str).where(df[col].notna(), "")
+        lines = values if lines is None else lines + sep + values
+    return lines if lines is not None else pd.Series([], dtype=str)
+
+
+def write_lines(lines, file, header=""):
+    '''
+    writes a series of text lines to file
+    '''
+
+    with open(file, "w") as stream:
+        if header:
+            stream.write(header + "\n")
+        if len(lines.index):
+            stream.write("\n".join(lines) + "\n")
+
+
+def write_tsv(df, file):
+    '''
+    writes a df as tab-separated file with header
+    '''
+
+    write_lines(df2lines(df), file, header="\t".join(str(col) for col in df.columns))
+
+
+def write_bed(df, file, chr_start_end=['Chr', 'Start', 'End']):
+    '''
+    writes the coords of a df (1-based like the annovar coords) as a 0-based bed file
+    '''
+
+    bed = df.loc[:, chr_start_end].copy()
+    bed.iloc[:, 1] = bed.iloc[:, 1].astype(int) - 1
+    write_lines(df2lines(bed), file)
+
+
+def write_xlsx(sheets, file, no_header=[], chunksize=10000):
+    '''
+    writes a dict of dfs as sheets into an excel file (sheets in no_header are written without header)
+    with xlsxwriter, the rows are streamed in constant-memory mode (only the current row is held by the workbook)
+    and converted to python values in chunks of chunksize rows, otherwise pandas (openpyxl) writes the file
+    '''
+
+    if not importlib.util.find_spec("xlsxwriter"):
+        with pd.ExcelWriter(file, mode="w") as writer:
+            for sheet, df in sheets.items():
+                df.to_excel(writer, sheet_name=sheet, index=False, header=sheet not in no_header)
+        return
+
+    import xlsxwriter
+
+    with xlsxwriter.Workbook(file, {"constant_memory": True}) as workbook:
+        for sheet, df in sheets.items():
+            worksheet = workbook.add_worksheet(sheet)
+            row = 0
+            if sheet not in no_header:
+                worksheet.write_row(row, 0, [str(col) for col in df.columns])
+                row += 1
+            for start in range(0, len(df.index), chunksize):
+                # missing values are written as empty cells
+                chunk = df.iloc[start:start + chunksize].astype(object)
+                for values in chunk.where(chunk.notna(), None).values.tolist():
+                    worksheet.write_row(row, 0, values)
+                    row += 1
+
+
+def export_sheets(sheets, save_file, formats=["xlsx"], bed_sheet="", no_header=[]):
+    '''
+    writes a dict of dfs in the given formats
+        - xlsx: one excel file with a sheet per df (sheets in no_header without header)
+        - parquet, feather, tsv: one file per df named <save_file base>.<sheet>.<format>
+        - bed: the coords of sheets[bed_sheet] as <save_file base>.bed
+    '''
+
+    base = os.path.splitext(save_file)[0]
+    for fmt in formats:
+        show_output(f"Saving to {fmt} file(s) {base}.*")
+        if fmt == "xlsx":
+            write_xlsx(sheets, f"{base}.xlsx", no_header=no_header)
+        elif fmt == "bed":
+            write_bed(sheets[bed_sheet], f"{base}.bed")
+        elif fmt in ["parquet", "feather", "tsv"]:
+            for sheet, df in sheets.items():
+                file = f"{base}.{sheet}.{fmt}"
+                if fmt == "tsv":
+                    write_tsv(df, file)
+                elif fmt == "parquet":
+                    df.to_parquet(file, index=False)
+                else:
+                    df.reset_index(drop=True).to_feather(file)
+        else:
+            show_output(f"Unknown export format {fmt}!", color="warning")
+    show_output(f"Finished saving {base}.*", color="success")
+
+
+def export_background(sheets, save_file, formats=["xlsx"], bed_sheet="", no_header=[]):
+    '''
+    writes the sheets with export_sheets in a background thread and returns the future
+    the dfs are copied so they can be changed while the export is running
+    '''
+
+    if export_state['executor'] is None:
+        export_state['executor'] = ThreadPoolExecutor(max_workers=1)
+    sheets = {sheet: df.copy() for sheet, df in sheets.items()}
+    job = export_state['executor'].submit(export_sheets, sheets, save_file, formats=formats, bed_sheet=bed_sheet, no_header=no_header)
+    export_state['jobs'].append(job)
+    return job
+
+
+def wait_exports():
+    '''
+    waits for all background exports to finish and raises the first export error
+    '''
+
+    jobs, export_state['jobs'] = export_state['jobs'], []
+    for job in jobs:
+        job.result()
+
+
+def report_exports():
+    '''
+    reports the background exports that failed without being waited for (called at exit)
+    '''
+
+    jobs, export_state['jobs'] = export_state['jobs'], []
+    for job in jobs:
+        if job.exception() is not None:
+            show_output(f"Background export failed: {job.exception()}", color="warning")
+
+
+atexit.register(report_exports)
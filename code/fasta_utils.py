@@ -0,0 +1,114 @@
+import os
+import numpy as np
+import pandas as pd
+from functools import lru_cache
+from script_utils import show_output
+from interval_index import chrom_names
+
+fai_cols = ['name', 'length', 'offset', 'linebases', 'linewidth']
+
+
+def build_fai(fasta_file):
+    '''
+    writes the samtools faidx index (<fasta>.fai) of an uncompressed fasta file
+    columns: name, length, offset of the first base, bases per line, bytes per line
+    '''
+
+    show_output(f"Building fasta index for {os.path.basename(fasta_file)}")
+    rows = []
+    with open(fasta_file, "rb") as stream:
+        offset = 0
+        entry = None
+        for line in stream:
+            offset += len(line)
+            if line.startswith(b">"):
+                if entry:
+                    rows.append(entry)
+                entry = [line[1:].split()[0].decode(), 0, offset, 0, 0]
+                continue
+            bases = len(line.rstrip(b"\r\n"))
+            if entry and bases:
+                if not entry[3]:
+                    entry[3], entry[4] = bases, len(line)
+                entry[1] += bases
+        if entry:
+            rows.append(entry)
+    fai_df = pd.DataFrame(rows, columns=fai_cols)
+    fai_df.to_csv(f"{fasta_file}.fai", sep="\t", header=False, index=False)
+    return fai_df
+
+
+@lru_cache(4)
+def load_fasta(fasta_file, mtime):
+    '''
+    opens a fasta file as read-only memory map together with its faidx index (built if missing)
+    mtime is only used to reopen changed files
+    '''
+
+    with open(fasta_file, "rb") as stream:
+        if stream.read(2) == b"\x1f\x8b":
+            raise ValueError(f"{fasta_file} is compressed - please provide an uncompressed fasta for memory-mapping")
+    fai_file = f"{fasta_file}.fai"
+    if os.path.isfile(fai_file) and os.path.getmtime(fai_file) >= mtime:
+        fai_df = pd.read_csv(fai_file, sep="\t", header=None, usecols=range(5), names=fai_cols, dtype={'name': str})
+    else:
+        fai_df = build_fai(fasta_file)
+    # sequences are found by their normalized names (chr1 and 1 are the same)
+    fai_df.index = chrom_names(fai_df['name'])
+    return dict(seq=np.memmap(fasta_file, dtype=np.uint8, mode="r"), fai=fai_df)
+
+
+def open_fasta(fasta_file):
+    '''
+    returns the memory-mapped fasta and its faidx index (see load_fasta)
+    '''
+
+    return load_fasta(fasta_file, os.path.getmtime(fasta_file))
+
+
+def fetch_regions(fasta_file, regions, chr_start_end=['Chr', 'Start', 'End'], upper=True):
+    '''
+    fetches the sequences of all regions (1-based, inclusive coords) from a fasta file in one batch
+    regions beyond the sequence end are clipped, regions on unknown sequences are empty
+    returns the concatenated sequence bytes and the offsets and lengths of the regions in them
+    '''
+
+    fasta = open_fasta(fasta_file)
+    fai = fasta['fai'].reindex(chrom_names(regions[chr_start_end[0]]))
+    length = fai['length'].fillna(0).values.astype(np.int64)
+    start = np.clip(regions[chr_start_end[1]].values.astype(np.int64) - 1, 0, length)
+    end = np.clip(regions[chr_start_end[2]].values.astype(np.int64), start, length)
+    # file positions of the first and after the last base (line breaks included)
+    offset, linebases, linewidth = [fai[col].fillna(1).values.astype(np.int64) for col in ['offset', 'linebases', 'linewidth']]
+    file_start = offset + start // linebases * linewidth + start % linebases
+    file_end = offset + end // linebases * linewidth + end % linebases
+    file_end = np.where(end > start, file_end, file_start)
+    # gather the byte ranges and drop the line breaks
+    byte_len = file_end - file_start
+    positions = np.repeat(file_start - (np.cumsum(byte_len) - byte_len), byte_len) + np.arange(byte_len.sum())
+    raw = fasta['seq'][positions]
+    is_base = (raw != ord("\n")) & (raw != ord("\r"))
+    region_ids = np.repeat(np.arange(len(byte_len)), byte_len)[is_base]
+    seq = raw[is_base]
+    if upper:
+        seq = np.where((seq >= ord("a")) & (seq <= ord("z")), seq - 32, seq).astype(np.uint8)
+    lengths = np.bincount(region_ids, minlength=len(byte_len)).astype(np.int64)
+    return seq, np.cumsum(lengths) - lengths, lengths
+
+
+def fetch_sequences(fasta_file, regions, chr_start_end=['Chr', 'Start', 'End'], upper=True):
+    '''
+    returns the sequences of the regions as list of strings (see fetch_regions)
+    '''
+
+    seq, offsets, lengths = fetch_regions(fasta_file, regions, chr_start_end=chr_start_end, upper=upper)
+    seq = seq.tobytes()
+    return [seq[offset:offset + length].decode() for offset, length in zip(offsets, lengths)]
+
+
+def fetch_region(fasta_file, chrom, start, end, upper=True):
+    '''
+    returns the sequence of one region (1-based, inclusive coords) as string
+    '''
+
+    return fetch_sequences(fasta_file, pd.DataFrame(dict(Chr=[chrom], Start=[start], End=[end])), upper=upper)[0]
@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+from script_utils import show_output
+
+
+def chrom_names(chrom_col):
+    '''
+    normalizes chromosome names (1 | chr1 --> 1) for matching between tables
+    '''
+
+    # only the distinct names are normalized
+    codes, chroms = pd.factorize(pd.Series(chrom_col), use_na_sentinel=False)
+    return np.asarray(pd.Series(chroms).astype(str).str.replace(r"^chr", "", regex=True), dtype=str)[codes]
+
+
+def build_interval_index(df, chr_start_end=['Chr', 'Start', 'End']):
+    '''
+    builds an interval index of a df (mutations, exons, bed regions...)
+    the intervals are stored as start-sorted int64 keys (chromosome offset + position) together with
+        - the running maximum of the ends (max-end) for overlap queries
+        - the row positions in df
+    '''
+
+    chroms, chrom_ids = np.unique(chrom_names(df[chr_start_end[0]]), return_inverse=True)
+    chrom_offset = chrom_ids.astype(np.int64) * 2**32
+    start = chrom_offset + df[chr_start_end[1]].values.astype(np.int64)
+    end = chrom_offset + df[chr_start_end[2]].values.astype(np.int64)
+    order = np.argsort(start, kind="mergesort")
+    return dict(
+        chroms=chroms,
+        start=start[order],
+        end=end[order],
+        max_end=np.maximum.accumulate(end[order]),
+        rows=order,
+        n=len(df.index)
+    )
+
+
+def save_interval_index(index, index_file):
+    '''
+    stores an interval index as numpy archive
+    '''
+
+    np.savez(index_file, **index)
+
+
+def load_interval_index(index_file):
+    '''
+    loads an interval index stored with save_interval_index
+    '''
+
+    with np.load(index_file) as data:
+        index = {key: data[key] for key in data.files}
+    index['n'] = int(index['n'])
+    return index
+
+
+def query_interval_index(index, regions, how="overlap", chr_start_end=['Chr', 'Start', 'End']):
+    '''
+    finds all indexed intervals overlapping (how="overlap") or contained in (how="contained") the regions
+    coords are inclusive on both ends (like the annovar coords)
+    returns the row positions in regions and the matching row positions in the indexed df
+    '''
+
+    # regions on chromosomes not in the index get an empty key range
+    chrom_ids = pd.Series(chrom_names(regions[chr_start_end[0]])).map({chrom: i for i, chrom in enumerate(index['chroms'])}).values
+    has_chrom = ~np.isnan(chrom_ids)
+    chrom_offset = np.where(has_chrom, chrom_ids, 0).astype(np.int64) * 2**32
+    start = chrom_offset + regions[chr_start_end[1]].values.astype(np.int64)
+    end = chrom_offset + regions[chr_start_end[2]].values.astype(np.int64)
+
+    # candidates start within the region or (for overlaps) end after the region start
+    hi = np.searchsorted(index['start'], end, side="right")
+    if how == "contained":
+        lo = np.searchsorted(index['start'], start, side="left")
+    else:
+        lo = np.searchsorted(index['max_end'], start, side="left")
+    counts = np.where(has_chrom, np.maximum(hi - lo, 0), 0)
+    region_rows = np.repeat(np.arange(len(start)), counts)
+    candidates = np.repeat(lo, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    if how == "contained":
+        is_hit = index['end'][candidates] <= end[region_rows]
+    else:
+        is_hit = index['end'][candidates] >= start[region_rows]
+    return region_rows[is_hit], index['rows'][candidates[is_hit]]
+
+
+def interval_join(regions, df, how="overlap", index=None, chr_start_end=['Chr', 'Start', 'End']):
+    '''
+    joins all rows of df overlapping (how="overlap") or contained in (how="contained") the regions
+    index is an optional prebuilt (or loaded) interval index of df
+    returns the matching rows of df with the columns of the regions attached
+    (region columns also present in df get the suffix _region)
+    '''
+
+    if index is None:
+        index = build_interval_index(df, chr_start_end=chr_start_end)
+    elif index['n'] != len(df.index):
+        show_output("Interval index does not match the df and will be rebuilt!", color="warning")
+        index = build_interval_index(df, chr_start_end=chr_start_end)
+    region_rows, df_rows = query_interval_index(index, regions, how=how, chr_start_end=chr_start_end)
+    region_df = regions.iloc[region_rows].reset_index(drop=True)
+    region_df.columns = [f"{col}_region" if col in df.columns else col for col in region_df.columns]
+    return pd.concat([df.iloc[df_rows].reset_index(drop=True), region_df], axis=1)
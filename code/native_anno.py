@@ -0,0 +1,479 @@
+import os
+import numpy as np
+import pandas as pd
+from functools import lru_cache
+from script_utils import show_output
+from interval_index import chrom_names, build_interval_index, query_interval_index
+from table_cache import get_cache, cache_lock
+
+
+def db_names(db_file, db):
+    '''
+    returns the column names for the table cache of a humandb file
+    files without header (first line not starting with #) get Chr, Start, End, Ref, Alt and db (db2, db3.. for more columns)
+    '''
+
+    with open(db_file, "r") as stream:
+        first = stream.readline().rstrip("\n").split("\t")
+    if first[0].startswith("#"):
+        return []
+    return ['Chr', 'Start', 'End', 'Ref', 'Alt'] + [db if i == 0 else f"{db}{i + 1}" for i in range(len(first) - 5)]
+
+
+def filter_index(db_file, db, verbose=1):
+    '''
+    returns the folder and manifest of the filter index of a humandb file
+    the index consists of the per-chromosome table cache (see table_cache) and a sorted Start array per chromosome
+    both are memory-mapped for queries and rebuilt if the humandb file changes
+    '''
+
+    folder, manifest = get_cache(db_file, names=db_names(db_file, db), verbose=verbose)
+    with cache_lock:
+        write_start_files(folder, manifest)
+    return folder, manifest
+
+
+def write_start_files(folder, manifest):
+    '''
+    writes the sorted Start array (and the sort order if needed) of each chromosome of a table cache
+    '''
+
+    for chrom, part in manifest['chroms'].items():
+        start_file = os.path.join(folder, f"{part['file']}.start.npy")
+        if os.path.isfile(start_file):
+            continue
+        import pyarrow as pa
+        with pa.memory_map(os.path.join(folder, part['file']), "r") as source:
+            start = pa.ipc.open_file(source).read_all().column(1).to_numpy()
+        # humandb files are usually sorted, otherwise the sort order is stored with the starts
+        order = np.argsort(start, kind="mergesort")
+        if (np.diff(order) != 1).any():
+            np.save(os.path.join(folder, f"{part['file']}.order.npy"), order)
+        np.save(start_file, start[order])
+
+
+def annotate_filter(df, db_file, db, nastring=".", verbose=1):
+    '''
+    annotates the variants of df (Chr, Start, End, Ref, Alt) with a filter-based humandb file like annovar -f
+    a variant is annotated with the values of the first db entry with identical Chr, Start, End, Ref and Alt
+    returns the annotation columns (named like in the multianno output) aligned to the rows of df
+    '''
+
+    import pyarrow as pa
+
+    folder, manifest = filter_index(db_file, db, verbose=verbose)
+    columns = manifest['columns'][5:]
+    anno_df = pd.DataFrame(nastring, index=np.arange(len(df.index)), columns=columns, dtype=object)
+    chroms = chrom_names(df['Chr'])
+    start = df['Start'].values.astype(np.int64)
+    end = df['End'].values.astype(np.int64)
+    ref = np.asarray(df['Ref'], dtype=str)
+    alt = np.asarray(df['Alt'], dtype=str)
+    for chrom, part in manifest['chroms'].items():
+        rows = np.flatnonzero(chroms == chrom)
+        if not len(rows):
+            continue
+        # candidates are all db entries with the same Start
+        db_start = np.load(os.path.join(folder, f"{part['file']}.start.npy"), mmap_mode="r")
+        lo = np.searchsorted(db_start, start[rows], side="left")
+        hi = np.searchsorted(db_start, start[rows], side="right")
+        counts = hi - lo
+        query_rows = np.repeat(rows, counts)
+        candidates = np.repeat(lo, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        order_file = os.path.join(folder, f"{part['file']}.order.npy")
+        if os.path.isfile(order_file):
+            candidates = np.load(order_file, mmap_mode="r")[candidates]
+        with pa.memory_map(os.path.join(folder, part['file']), "r") as source:
+            table = pa.ipc.open_file(source).read_all()
+            hits = table.take(pa.array(candidates, type=pa.int64())).to_pandas()
+        # exact allele matching
+        is_hit = (hits.iloc[:, 2].values == end[query_rows]) & (hits.iloc[:, 3].astype(str).values == ref[query_rows]) & (hits.iloc[:, 4].astype(str).values == alt[query_rows])
+        first = np.unique(query_rows[is_hit], return_index=True)[1]
+        hit_rows = np.flatnonzero(is_hit)[first]
+        anno_df.iloc[query_rows[hit_rows], :] = hits.iloc[hit_rows, 5:].fillna(nastring).values
+    if verbose:
+        show_output(f"Annotated {(anno_df.iloc[:, 0] != nastring).sum()} of {len(df.index)} variants with {db}")
+    return anno_df
+
+
+def annotate_native(df, native_dbs, verbose=1):
+    '''
+    annotates df with all native dbs [(db, humandb file, operation), ...] and returns the annotation columns aligned to df
+    gene-based dbs (operation g) use annotate_gene, filter-based dbs (operation f) annotate_filter
+    '''
+
+    return pd.concat([
+        annotate_gene(df, db_file, db, verbose=verbose) if operation == 'g' else annotate_filter(df, db_file, db, verbose=verbose)
+        for db, db_file, operation in native_dbs
+    ], axis=1)
+
+
+# gene-based annotation (annovar -g)
+gene_funcs = ['exonic', 'splicing', 'ncRNA_exonic', 'ncRNA_splicing', 'UTR5', 'UTR3', 'intronic', 'ncRNA_intronic', 'upstream', 'downstream', 'intergenic']
+# annovar precedence of the regions (regions of the same rank are reported together)
+func_ranks = dict(exonic=0, splicing=0, ncRNA_exonic=1, ncRNA_splicing=1, UTR5=2, UTR3=2, intronic=3, ncRNA_intronic=3, upstream=4, downstream=4, intergenic=5)
+# annovar precedence of the exonic functions of SNVs
+exonic_funcs = ['stopgain', 'stoploss', 'startloss', 'nonsynonymous SNV', 'synonymous SNV', 'unknown']
+# standard genetic code for codons in TCAG order
+codon_table = np.frombuffer(b"FFLLSSSSYY**CC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG", dtype=np.uint8)
+base_codes = np.full(256, -1, dtype=np.int64)
+for i, base in enumerate(b"TCAG"):
+    base_codes[base] = base_codes[base + 32] = i
+complement = np.arange(256, dtype=np.uint8)
+for base, comp in zip(b"ACGTNacgtn", b"TGCANtgcan"):
+    complement[base] = comp
+
+
+def read_mrna(mrna_file):
+    '''
+    reads the transcript sequences of an annovar Mrna.fa file
+    returns the concatenated sequence bytes and a dict transcript --> (offset, length)
+    '''
+
+    names, seqs = [], []
+    with open(mrna_file, "r") as stream:
+        for line in stream:
+            if line.startswith(">"):
+                names.append(line[1:].split()[0].split("#")[0])
+                seqs.append([])
+            elif names:
+                seqs[-1].append(line.strip().upper())
+    seqs = ["".join(seq) for seq in seqs]
+    lengths = np.array([len(seq) for seq in seqs], dtype=np.int64)
+    offsets = np.cumsum(lengths) - lengths
+    seq_dict = {name: (offset, length) for name, offset, length in zip(names, offsets, lengths)}
+    return np.frombuffer("".join(seqs).encode(), dtype=np.uint8), seq_dict
+
+
+@lru_cache(2)
+def load_gene_model(db_file, mrna_file, mtimes):
+    '''
+    loads a genePred humandb file (like hg38_ensGene34.txt) and its Mrna.fa into a compact transcript/exon model
+        - transcripts: one row per transcript with 1-based coords and the mRNA offsets of the CDS
+        - exon arrays sorted by transcript and start with exon number and mRNA offset (transcript orientation)
+        - the mRNA sequences as one byte array
+    mtimes (of db_file and mrna_file) are only used to reload changed files
+    '''
+
+    genes = pd.read_csv(db_file, sep="\t", header=None, dtype=str)
+    # genePred files with bin column
+    if genes[0].str.isdigit().all():
+        genes = genes.iloc[:, 1:].T.reset_index(drop=True).T
+    tx = pd.DataFrame(dict(
+        name=genes[0].values,
+        chrom=chrom_names(genes[1]),
+        strand=genes[2].values,
+        tx_start=genes[3].astype(np.int64).values + 1,
+        tx_end=genes[4].astype(np.int64).values,
+        cds_start=genes[5].astype(np.int64).values + 1,
+        cds_end=genes[6].astype(np.int64).values,
+        gene=(genes[11] if genes.shape[1] > 11 else genes[0]).values
+    ))
+    tx['coding'] = tx['cds_end'] >= tx['cds_start']
+    tx['minus'] = tx['strand'] == "-"
+
+    # exons
+    starts = genes[8].str.rstrip(",").str.split(",").explode()
+    ends = genes[9].str.rstrip(",").str.split(",").explode()
+    exon_tx = starts.index.values.astype(np.int64)
+    exon_start = starts.values.astype(np.int64) + 1
+    exon_end = ends.values.astype(np.int64)
+    order = np.lexsort((exon_start, exon_tx))
+    exon_tx, exon_start, exon_end = exon_tx[order], exon_start[order], exon_end[order]
+    exon_len = exon_end - exon_start + 1
+    tx_first = np.searchsorted(exon_tx, np.arange(len(tx.index)))
+    exon_count = np.bincount(exon_tx, minlength=len(tx.index))
+    rank = np.arange(len(exon_tx)) - tx_first[exon_tx]
+    minus = tx['minus'].values[exon_tx]
+    # exon number and mRNA offset of the first exon base in transcript orientation
+    exon_number = np.where(minus, exon_count[exon_tx] - rank, rank + 1)
+    cum_len = np.cumsum(exon_len) - exon_len
+    before = cum_len - cum_len[tx_first[exon_tx]]
+    tx_len = np.bincount(exon_tx, weights=exon_len, minlength=len(tx.index)).astype(np.int64)
+    exon_mrna = np.where(minus, tx_len[exon_tx] - before - exon_len, before)
+    model = dict(
+        tx=tx,
+        exon_key=(exon_tx << 32) | exon_start,
+        exon_tx=exon_tx, exon_start=exon_start, exon_end=exon_end,
+        exon_number=exon_number, exon_mrna=exon_mrna
+    )
+    # mRNA offset of the first coding base
+    cds_pos = np.where(tx['minus'], tx['cds_end'], tx['cds_start'])
+    tx['cds_mrna'] = np.where(tx['coding'], mrna_offsets(model, np.arange(len(tx.index)), cds_pos)[0], -1)
+    cds_last = np.where(tx['minus'], tx['cds_start'], tx['cds_end'])
+    tx['cds_len'] = np.where(tx['coding'], mrna_offsets(model, np.arange(len(tx.index)), cds_last)[0] - tx['cds_mrna'] + 1, 0)
+
+    # sequences
+    seq, seq_dict = read_mrna(mrna_file) if mrna_file and os.path.isfile(mrna_file) else (np.zeros(0, dtype=np.uint8), {})
+    seq_info = np.array([seq_dict.get(name, (-1, 0)) for name in tx['name']], dtype=np.int64).reshape(-1, 2)
+    tx['seq_offset'], tx['seq_len'] = seq_info[:, 0], seq_info[:, 1]
+    model['seq'] = seq
+    return model
+
+
+def mrna_offsets(model, tx_ids, pos):
+    '''
+    locates genomic positions in transcripts
+    returns the mRNA offset (transcript orientation, -1 outside exons), the exon index left of (or at) pos and whether pos is exonic
+    '''
+
+    exon = np.searchsorted(model['exon_key'], (tx_ids.astype(np.int64) << 32) | pos, side="right") - 1
+    exon = np.maximum(exon, 0)
+    in_exon = (model['exon_tx'][exon] == tx_ids) & (model['exon_start'][exon] <= pos) & (pos <= model['exon_end'][exon])
+    minus = model['tx']['minus'].values[tx_ids]
+    offset = model['exon_mrna'][exon] + np.where(minus, model['exon_end'][exon] - pos, pos - model['exon_start'][exon])
+    return np.where(in_exon, offset, -1), exon, in_exon
+
+
+def gene_regions(model, tx_ids, pos):
+    '''
+    returns the annovar region (index in gene_funcs) of positions in transcripts
+    and for splicing positions the exon boundary and the signed intron distance (transcript orientation)
+    '''
+
+    tx = model['tx']
+    minus = tx['minus'].values[tx_ids]
+    coding = tx['coding'].values[tx_ids]
+    offset, exon, in_exon = mrna_offsets(model, tx_ids, pos)
+    # distance to the flanking exons for intronic positions
+    next_exon = np.minimum(exon + 1, len(model['exon_tx']) - 1)
+    dist_left = pos - model['exon_end'][exon]
+    dist_right = model['exon_start'][next_exon] - pos
+    in_tx = (tx['tx_start'].values[tx_ids] <= pos) & (pos <= tx['tx_end'].values[tx_ids])
+    is_left = dist_left <= dist_right
+    boundary = np.where(is_left, model['exon_end'][exon], model['exon_start'][next_exon])
+    intron_dist = np.where(is_left, dist_left, -dist_right) * np.where(minus, -1, 1)
+    is_splicing = in_tx & ~in_exon & (np.minimum(dist_left, dist_right) <= 2)
+    cds_start, cds_end = tx['cds_start'].values[tx_ids], tx['cds_end'].values[tx_ids]
+    before_cds = np.where(minus, pos > cds_end, pos < cds_start)
+    after_cds = np.where(minus, pos < cds_start, pos > cds_end)
+    upstream = np.where(minus, pos > tx['tx_end'].values[tx_ids], pos < tx['tx_start'].values[tx_ids])
+    region = np.select(
+        [~in_tx & upstream, ~in_tx, in_exon & ~coding, in_exon & before_cds, in_exon & after_cds, in_exon, is_splicing & coding, is_splicing, coding],
+        [8, 9, 2, 4, 5, 0, 1, 3, 6],
+        default=7
+    )
+    return region, boundary, intron_dist
+
+
+def codon_aa(codons):
+    '''
+    translates an (n, 3) array of codon bytes into amino acid bytes (X for unknown bases)
+    '''
+
+    codes = base_codes[codons]
+    aa = codon_table[np.maximum(codes[:, 0] * 16 + codes[:, 1] * 4 + codes[:, 2], 0)]
+    return np.where((codes < 0).any(axis=1), ord("X"), aa).astype(np.uint8)
+
+
+def allele_bytes(alleles, minus):
+    '''
+    returns the first base of the alleles as bytes in transcript orientation
+    '''
+
+    bases = np.frombuffer("".join(allele[:1] or "N" for allele in alleles).upper().encode(), dtype=np.uint8)
+    return np.where(minus, complement[bases], bases)
+
+
+def transcript_alleles(alleles, minus):
+    '''
+    returns the alleles in transcript orientation (reverse complement on minus strand)
+    '''
+
+    alleles = pd.Series(alleles).str.upper()
+    rev_comp = alleles.str[::-1].str.translate(str.maketrans("ACGTN", "TGCAN"))
+    return np.where(minus, rev_comp, alleles)
+
+
+def exonic_changes(model, pairs):
+    '''
+    computes ExonicFunc and AAChange (gene:transcript:exonN:c.<ref><pos><alt>:p.<ref><pos><alt>) of exonic SNV-transcript pairs
+    pairs is a df with the columns tx_id, Start, Ref, Alt
+    '''
+
+    tx = model['tx']
+    tx_ids = pairs['tx_id'].values
+    minus = tx['minus'].values[tx_ids]
+    offset, exon = mrna_offsets(model, tx_ids, pairs['Start'].values)[:2]
+    # cDNA coord (1-based from the first coding base) and the codon of the SNV
+    c_pos = offset - tx['cds_mrna'].values[tx_ids] + 1
+    aa_pos = (c_pos - 1) // 3 + 1
+    seq_offset, seq_len = tx['seq_offset'].values[tx_ids], tx['seq_len'].values[tx_ids]
+    codon_off = tx['cds_mrna'].values[tx_ids] + (aa_pos - 1) * 3
+    has_seq = (seq_offset >= 0) & (c_pos >= 1) & (aa_pos * 3 <= tx['cds_len'].values[tx_ids]) & (codon_off + 3 <= seq_len)
+    codon_idx = np.where(has_seq, seq_offset + codon_off, 0)[:, None] + np.arange(3)
+    codons = model['seq'][np.minimum(codon_idx, max(len(model['seq']) - 1, 0))] if len(model['seq']) else np.full((len(tx_ids), 3), ord("N"), dtype=np.uint8)
+    ref_aa = codon_aa(codons)
+    frame = (c_pos - 1) % 3
+    ref_base = codons[np.arange(len(tx_ids)), frame]
+    alt_codons = codons.copy()
+    alt_codons[np.arange(len(tx_ids)), frame] = allele_bytes(pairs['Alt'].astype(str).values, minus)
+    alt_aa = codon_aa(alt_codons)
+    stop, start = ord("*"), ord("M")
+    exonic_func = np.select(
+        [~has_seq, (ref_aa == stop) & (alt_aa != stop), (alt_aa == stop) & (ref_aa != stop), (aa_pos == 1) & (ref_aa == start) & (alt_aa != start), ref_aa == alt_aa],
+        ["unknown", "stoploss", "stopgain", "startloss", "synonymous SNV"],
+        default="nonsynonymous SNV"
+    )
+
+    # the change strings (annovar writes stop codons as X)
+    c_pos_s, aa_pos_s = [pd.Series(values).astype(str).values.astype(object) for values in [c_pos, aa_pos]]
+    ref_aa_s, alt_aa_s, ref_base_s, alt_base_s = [
+        np.frombuffer(values.tobytes(), dtype="S1").astype(str).astype(object) for values in [ref_aa, alt_aa, ref_base, alt_codons[np.arange(len(tx_ids)), frame]]
+    ]
+    ref_aa_s = np.where(ref_aa_s == "*", "X", ref_aa_s)
+    alt_aa_s = np.where(alt_aa_s == "*", "X", alt_aa_s)
+    exon_s = "exon" + pd.Series(model['exon_number'][exon]).astype(str).values.astype(object)
+    aa_change = (
+        tx['gene'].values[tx_ids].astype(object) + ":" + tx['name'].values[tx_ids].astype(object) + ":" + exon_s
+        + ":c." + ref_base_s + c_pos_s + alt_base_s + ":p." + ref_aa_s + aa_pos_s + alt_aa_s
+    )
+    aa_change = np.where(has_seq, aa_change, "UNKNOWN")
+    return exonic_func, aa_change, exon_s
+
+
+def is_snv(df):
+    '''
+    returns the boolean mask of the single nucleotide variants of df (Ref and Alt one base each)
+    '''
+
+    bases = ["A", "C", "G", "T", "a", "c", "g", "t"]
+    return (df['Ref'].isin(bases) & df['Alt'].isin(bases)).values
+
+
+def annotate_gene(df, db_file, db, mrna_file="", neargene=1000, nastring=".", verbose=1):
+    '''
+    annotates the SNVs of df (Chr, Start, End, Ref, Alt) with a genePred humandb file like annovar -g
+    indels are not annotated (nastring), annotate_variants hands them to annovar
+    the regions (Func) follow the annovar precedence: exonic/splicing > ncRNA > UTR5/UTR3 > intronic > upstream/downstream (neargene) > intergenic
+    ExonicFunc and AAChange are computed from the transcript sequences in mrna_file (default: <db_file base>Mrna.fa)
+    returns the columns Func, Gene, GeneDetail, ExonicFunc, AAChange (suffixed with .db) aligned to the rows of df
+    '''
+
+    snv_rows = np.flatnonzero(is_snv(df))
+    if len(snv_rows) < len(df.index):
+        result = pd.DataFrame(nastring, index=np.arange(len(df.index)), columns=[f"{col}.{db}" for col in ['Func', 'Gene', 'GeneDetail', 'ExonicFunc', 'AAChange']], dtype=object)
+        if len(snv_rows):
+            result.iloc[snv_rows] = annotate_gene(df.iloc[snv_rows], db_file, db, mrna_file=mrna_file, neargene=neargene, nastring=nastring, verbose=verbose).values
+        return result
+    if not mrna_file:
+        mrna_file = f"{os.path.splitext(db_file)[0]}Mrna.fa"
+    model = load_gene_model(db_file, mrna_file, tuple(os.path.getmtime(file) if os.path.isfile(file) else 0 for file in [db_file, mrna_file]))
+    tx = model['tx']
+    variants = df.loc[:, ['Chr', 'Start', 'End', 'Ref', 'Alt']].reset_index(drop=True)
+    variants['Start'] = variants['Start'].astype(np.int64)
+    variants['End'] = variants['End'].astype(np.int64)
+
+    # all variant-transcript pairs within neargene of the transcript
+    spans = pd.DataFrame(dict(Chr=tx['chrom'], Start=tx['tx_start'] - neargene, End=tx['tx_end'] + neargene))
+    var_rows, tx_ids = query_interval_index(build_interval_index(spans), variants)
+    pairs = variants.iloc[var_rows].reset_index(drop=True)
+    pairs['var_row'], pairs['tx_id'] = var_rows, tx_ids
+    start_region, boundary, intron_dist = gene_regions(model, tx_ids, pairs['Start'].values)
+    pairs['func'] = np.array(gene_funcs, dtype=object)[start_region]
+    pairs['rank'] = pairs['func'].map(func_ranks).values
+    pairs['gene'] = tx['gene'].values[tx_ids]
+    pairs['tx'] = tx['name'].values[tx_ids]
+
+    # keep only the pairs of the best region rank per variant
+    pairs = pairs.loc[pairs['rank'].values == pairs.groupby("var_row")['rank'].transform("min").values].copy()
+    pairs['func_order'] = pairs['func'].map({func: i for i, func in enumerate(gene_funcs)})
+    result = pd.DataFrame(nastring, index=np.arange(len(variants.index)), columns=['Func', 'Gene', 'GeneDetail', 'ExonicFunc', 'AAChange'], dtype=object)
+    if len(pairs.index):
+        funcs = pairs.drop_duplicates(['var_row', 'func']).sort_values(['var_row', 'func_order'])
+        result.loc[funcs['var_row'].unique(), 'Func'] = funcs.groupby("var_row")['func'].agg(";".join)
+        result.loc[pairs['var_row'].unique(), 'Gene'] = pairs.drop_duplicates(['var_row', 'gene']).groupby("var_row")['gene'].agg(";".join)
+
+        # GeneDetail for UTR and splicing
+        tx_ids = pairs['tx_id'].values
+        is_utr = pairs['func'].isin(['UTR5', 'UTR3']).values
+        is_splicing = pairs['func'].isin(['splicing', 'ncRNA_splicing']).values
+        if is_utr.any() or is_splicing.any():
+            minus = tx['minus'].values[tx_ids]
+            pos = pairs['Start'].values
+            offset = mrna_offsets(model, tx_ids, np.where(is_splicing, boundary[pairs.index.values], pos))[0]
+            cds_mrna = tx['cds_mrna'].values[tx_ids]
+            cds_len = tx['cds_len'].values[tx_ids]
+            c_pos = offset - cds_mrna + 1
+            c_pos_s = pd.Series(np.where(c_pos < 1, c_pos - 1, np.where(c_pos > cds_len, c_pos - cds_len, c_pos))).astype(str).values.astype(object)
+            c_pos_s = np.where(c_pos < 1, c_pos_s, np.where(c_pos > cds_len, "*" + c_pos_s, c_pos_s))
+            dist = intron_dist[pairs.index.values]
+            dist_s = np.where(dist > 0, "+", "").astype(object) + pd.Series(dist).astype(str).values.astype(object)
+            exon_s = "exon" + pd.Series(model['exon_number'][mrna_offsets(model, tx_ids, boundary[pairs.index.values])[1]]).astype(str).values.astype(object)
+            change = transcript_alleles(pairs['Ref'].astype(str).values, minus).astype(object) + ">" + transcript_alleles(pairs['Alt'].astype(str).values, minus).astype(object)
+            details = np.where(
+                is_splicing,
+                pairs['tx'].values.astype(object) + ":" + exon_s + ":c." + c_pos_s + dist_s + change,
+                pairs['tx'].values.astype(object) + ":c." + c_pos_s + change
+            )
+            detail_df = pairs.loc[is_utr | is_splicing, ['var_row']].assign(detail=details[is_utr | is_splicing])
+            result.loc[detail_df['var_row'].unique(), 'GeneDetail'] = detail_df.groupby("var_row")['detail'].agg(";".join)
+
+        # ExonicFunc and AAChange for exonic pairs
+        exonic = pairs.loc[pairs['func'] == "exonic"].copy()
+        if len(exonic.index):
+            exonic['exonic_func'], exonic['aa_change'], exonic['exon'] = exonic_changes(model, exonic)
+            exonic['func_rank'] = exonic['exonic_func'].map({func: i for i, func in enumerate(exonic_funcs)})
+            best = exonic.sort_values(['var_row', 'func_rank']).drop_duplicates("var_row")
+            result.loc[best['var_row'].values, 'ExonicFunc'] = best['exonic_func'].values
+            changes = exonic.sort_values(['var_row', 'exon', 'tx']).drop_duplicates(['var_row', 'aa_change'])
+            result.loc[changes['var_row'].unique(), 'AAChange'] = changes.groupby("var_row")['aa_change'].agg(",".join)
+
+    # intergenic variants get the nearest genes on both sides
+    is_intergenic = ~np.isin(np.arange(len(variants.index)), pairs['var_row'].values)
+    if is_intergenic.any():
+        result.loc[is_intergenic, ['Func', 'Gene', 'GeneDetail']] = nearest_genes(model, variants.loc[is_intergenic]).values
+    if verbose:
+        show_output(f"Annotated {len(variants.index)} variants with {db}")
+    result.columns = [f"{col}.{db}" for col in result.columns]
+    return result
+
+
+def nearest_genes(model, variants):
+    '''
+    returns Func, Gene and GeneDetail for intergenic variants (nearest transcript on both sides and distances)
+    '''
+
+    tx = model['tx']
+    chroms = np.unique(np.r_[tx['chrom'].values, chrom_names(variants['Chr'])])
+    tx_chrom = np.searchsorted(chroms, tx['chrom'].values).astype(np.int64) << 32
+    var_chrom = np.searchsorted(chroms, chrom_names(variants['Chr'])).astype(np.int64) << 32
+    pos = variants['Start'].values.astype(np.int64)
+    # left: transcript with the closest end before the variant, right: closest start after the variant
+    end_order = np.argsort(tx_chrom | tx['tx_end'].values, kind="mergesort")
+    end_keys = (tx_chrom | tx['tx_end'].values)[end_order]
+    left = np.searchsorted(end_keys, var_chrom | pos, side="left") - 1
+    has_left = (left >= 0) & ((end_keys[np.maximum(left, 0)] >> 32) == (var_chrom >> 32))
+    start_order = np.argsort(tx_chrom | tx['tx_start'].values, kind="mergesort")
+    start_keys = (tx_chrom | tx['tx_start'].values)[start_order]
+    right = np.searchsorted(start_keys, var_chrom | pos, side="right")
+    has_right = (right < len(start_keys)) & ((start_keys[np.minimum(right, len(start_keys) - 1)] >> 32) == (var_chrom >> 32))
+    left_tx = end_order[np.maximum(left, 0)]
+    right_tx = start_order[np.minimum(right, len(start_keys) - 1)]
+    left_gene = np.where(has_left, tx['gene'].values[left_tx], "NONE").astype(object)
+    right_gene = np.where(has_right, tx['gene'].values[right_tx], "NONE").astype(object)
+    left_dist = np.where(has_left, pd.Series(pos - tx['tx_end'].values[left_tx]).astype(str).values, "NONE").astype(object)
+    right_dist = np.where(has_right, pd.Series(tx['tx_start'].values[right_tx] - pos).astype(str).values, "NONE").astype(object)
+    return pd.DataFrame(dict(
+        Func="intergenic",
+        Gene=left_gene + ";" + right_gene,
+        GeneDetail="dist=" + left_dist + ";dist=" + right_dist
+    ))
+
+
+def validate_gene_anno(multianno_file, db_file, db, mrna_file=""):
+    '''
+    compares the native gene-based annotation with the annovar (perl) output in a multianno file
+    only the SNVs are compared (indels are annotated by annovar, see annotate_variants)
+    returns the rows with differences (native columns suffixed with _native) and prints the match rate per column
+    '''
+
+    annovar_df = pd.read_csv(multianno_file, sep="\t", dtype=str)
+    annovar_df = annovar_df.loc[is_snv(annovar_df)].reset_index(drop=True)
+    native_df = annotate_gene(annovar_df.astype({'Start': int, 'End': int}), db_file, db, mrna_file=mrna_file, verbose=0)
+    columns = list(native_df.columns)
+    is_diff = (annovar_df.loc[:, columns].fillna(".").values != native_df.values)
+    for col, diff in zip(columns, is_diff.T):
+        show_output(f"{col}: {len(diff) - diff.sum()} of {len(diff)} identical", color="warning" if diff.any() else "success")
+    diffs = annovar_df.loc[is_diff.any(axis=1), ['Chr', 'Start', 'End', 'Ref', 'Alt'] + columns]
+    return diffs.join(native_df.loc[is_diff.any(axis=1)].add_suffix("_native"))
@@ -0,0 +1,127 @@
+import hashlib
+import json
+from collections import OrderedDict
+import pandas as pd
+from script_utils import show_output
+
+# in-memory cache of stage results (least recently used entries are evicted first)
+cache_state = dict(entries=OrderedDict(), size=0, max_size=4 * 1024 ** 3)
+
+
+def hash_df(df):
+    '''
+    returns a content hash of a df (values, index and columns)
+    '''
+
+    sha = hashlib.sha1(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+    sha.update(json.dumps([str(col) for col in df.columns]).encode())
+    return sha.hexdigest()
+
+
+def hash_file(file):
+    '''
+    returns a content hash of a file
+    '''
+
+    sha = hashlib.sha1()
+    with open(file, "rb") as stream:
+        for chunk in iter(lambda: stream.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def stage_key(parent_key, stage, settings={}):
+    '''
+    derives the key of a stage from the key of its input and the settings the stage depends on
+    '''
+
+    return hashlib.sha1(json.dumps([parent_key, stage, settings], sort_keys=True, default=str).encode()).hexdigest()
+
+
+def frame_size(df):
+    '''
+    estimates the memory footprint of a df from a sample of its rows
+    '''
+
+    sample = df.iloc[::max(len(df.index) // 1000, 1)]
+    return int(sample.memory_usage(index=True, deep=True).sum() * len(df.index) / max(len(sample.index), 1))
+
+
+def result_frames(result):
+    '''
+    returns the dfs of a stage result (a df or a tuple of dfs)
+    '''
+
+    return result if isinstance(result, tuple) else (result,)
+
+
+def copy_result(result):
+    '''
+    copies a stage result so that cached dfs cannot be altered from outside
+    '''
+
+    frames = tuple(df.copy() for df in result_frames(result))
+    return frames if isinstance(result, tuple) else frames[0]
+
+
+def get_cached(key):
+    '''
+    returns a copy of the cached result for key or None
+    '''
+
+    if key not in cache_state['entries']:
+        return None
+    cache_state['entries'].move_to_end(key)
+    return copy_result(cache_state['entries'][key][0])
+
+
+def set_cached(key, result):
+    '''
+    stores a stage result and evicts the least recently used results beyond the size limit
+    '''
+
+    size = sum(frame_size(df) for df in result_frames(result))
+    if key in cache_state['entries']:
+        cache_state['size'] -= cache_state['entries'].pop(key)[1]
+    if size > cache_state['max_size']:
+        return
+    cache_state['entries'][key] = (copy_result(result), size)
+    cache_state['size'] += size
+    while cache_state['size'] > cache_state['max_size']:
+        cache_state['size'] -= cache_state['entries'].popitem(last=False)[1][1]
+
+
+def set_cache_size(max_gb=4):
+    '''
+    sets the size limit of the stage cache in GB
+    '''
+
+    cache_state['max_size'] = int(max_gb * 1024 ** 3)
+    while cache_state['size'] > cache_state['max_size']:
+        cache_state['size'] -= cache_state['entries'].popitem(last=False)[1][1]
+
+
+def clear_cache():
+    '''
+    removes all cached stage results
+    '''
+
+    cache_state['entries'].clear()
+    cache_state['size'] = 0
+
+
+def cached_stage(key, func, *args, use_cache=True, **kwargs):
+    '''
+    returns the cached result of func for key or computes (and caches) it with func(*args, **kwargs)
+    '''
+
+    if use_cache:
+        result = get_cached(key)
+        if result is not None:
+            if kwargs.get('verbose', 1):
+                show_output(f"Using cached result for {func.__name__}")
+            return result
+    result = func(*args, **kwargs)
+    if use_cache and result is not None:
+        set_cached(key, result)
+    return result
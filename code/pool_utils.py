@@ -0,0 +1,145 @@
+import atexit
+import numpy as np
+import pandas as pd
+from multiprocessing import Pool, resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from functools import partial
+
+# the worker pool shared by all pipeline stages
+pool_state = dict(pool=None, threads=0)
+
+
+def get_pool(threads):
+    '''
+    returns the worker pool shared by all stages
+    the pool is only re-created if the number of threads changes
+    '''
+
+    if pool_state['pool'] is None or pool_state['threads'] != threads:
+        close_pool()
+        # workers have to share the resource tracker of the main process for the shared memory handling
+        resource_tracker.ensure_running()
+        pool_state['pool'] = Pool(threads)
+        pool_state['threads'] = threads
+    return pool_state['pool']
+
+
+def close_pool():
+    '''
+    shuts down the shared worker pool (also called at exit)
+    '''
+
+    if pool_state['pool'] is not None:
+        pool_state['pool'].close()
+        pool_state['pool'].join()
+        pool_state['pool'] = None
+        pool_state['threads'] = 0
+
+
+atexit.register(close_pool)
+
+
+def share_arrays(arrays):
+    '''
+    copies a dict of numpy arrays into shared memory blocks
+    returns the blocks (to be freed with release_arrays) and picklable handles for attach_arrays
+    '''
+
+    blocks = []
+    handles = {}
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        block = SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+        blocks.append(block)
+        handles[name] = (block.name, array.shape, array.dtype.str)
+    return blocks, handles
+
+
+def release_arrays(blocks):
+    '''
+    frees the shared memory blocks created by share_arrays
+    '''
+
+    for block in blocks:
+        block.close()
+        block.unlink()
+
+
+def attach_arrays(handles):
+    '''
+    attaches to shared arrays from within a worker
+    returns the blocks (to be closed after use) and the arrays as views on the shared memory
+    '''
+
+    blocks = []
+    arrays = {}
+    for name, (block_name, shape, dtype) in handles.items():
+        block = SharedMemory(name=block_name)
+        blocks.append(block)
+        arrays[name] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+    return blocks, arrays
+
+
+def run_df_part(func, handles, columns, kwargs, part, start, end):
+    '''
+    worker side of map_df_parts:
+    restores the shared columns of rows start:end into the part and applies func
+    '''
+
+    blocks, arrays = attach_arrays(handles)
+    try:
+        for col, array in arrays.items():
+            part[col] = array[start:end].copy()
+    finally:
+        for block in blocks:
+            block.close()
+    return func(part.loc[:, columns], **kwargs)
+
+
+def map_df_parts(func, df, bounds, threads, shared_cols=None, largest_first=False, **kwargs):
+    '''
+    applies func(df_part, **kwargs) to the row ranges between bounds using the shared worker pool
+    numeric columns (or shared_cols) reach the workers via shared memory, only the remaining columns are pickled
+    with largest_first, the parts are dispatched one by one starting with the largest (for parts of very different size)
+    returns the list of results in the order of the parts
+    '''
+
+    if shared_cols is None:
+        shared_cols = [col for col in df.columns if isinstance(df[col].dtype, np.dtype) and df[col].dtype.kind in "biuf"]
+    sizes = np.diff(bounds)
+    order = np.argsort(-sizes, kind="mergesort") if largest_first else np.arange(len(sizes))
+    blocks, handles = share_arrays({col: df[col].values for col in shared_cols})
+    try:
+        parts = [(df.iloc[bounds[i]:bounds[i + 1]].drop(columns=shared_cols), bounds[i], bounds[i + 1]) for i in order]
+        results = get_pool(threads).starmap(partial(run_df_part, func, handles, list(df.columns), kwargs), parts, chunksize=1 if largest_first else None)
+    finally:
+        release_arrays(blocks)
+    # restore the order of the parts
+    ordered = [None] * len(results)
+    for i, result in zip(order, results):
+        ordered[i] = result
+    return ordered
+
+
+def chrom_bounds(df, chrom_col="Chr"):
+    '''
+    sorts df (stable) by chromosome and returns it with the row bounds of the chromosomes
+    '''
+
+    df = df.sort_values(chrom_col, kind="mergesort")
+    codes = pd.factorize(df[chrom_col])[0]
+    return df, np.r_[0, np.flatnonzero(codes[1:] != codes[:-1]) + 1, len(codes)]
+
+
+def map_chroms(func, df, threads, chrom_col="Chr", **kwargs):
+    '''
+    applies the per-chromosome kernel func(chrom_df, **kwargs) to all chromosomes of df using the shared worker pool
+    the chromosomes are split off in one pass and dispatched largest first for load balancing
+    returns the list of results in chromosome order (the sort order of chrom_col)
+    '''
+
+    df, bounds = chrom_bounds(df, chrom_col=chrom_col)
+    if threads < 2 or len(bounds) < 3:
+        return [func(df.iloc[start:end], **kwargs) for start, end in zip(bounds[:-1], bounds[1:])]
+    return map_df_parts(func, df, bounds, threads, largest_first=True, **kwargs)
@@ -1,15 +1,29 @@
 import pandas as pd
+import numpy as np
 import os
-from script_utils import show_output
+import gzip
+from pandas.api.types import union_categoricals
+from script_utils import show_output, chrom_order
+from table_cache import has_arrow, iter_cached, get_cache, na_args
+from interval_index import chrom_names
+from variant_key import variant_keys, variant_cols
+from pool_utils import map_chroms
 
 
 def remove_gene_dups(df, gene_col="Gene"):
     '''
     cosmic dbs sometimes contain Gene entries of this kind: RB1;RB1
-    this tool removes these entries
+    this tool removes these entries (adjacent repeats of whole gene names in one pass, applied to the unique gene entries only)
     '''
-    for i in range(3):
-        df.loc[df[gene_col].str.contains(";"), gene_col] = df[gene_col].str.replace(r"([A-Z0-9]+);\1", r"\1", regex=True)
+    is_categorical = isinstance(df[gene_col].dtype, pd.CategoricalDtype)
+    gene_ids, genes = pd.factorize(df[gene_col])
+    genes = pd.Series(np.asarray(genes, dtype=object))
+    is_multi = genes.str.contains(";", regex=False, na=False)
+    # the lookarounds keep names like RB1;RB1-AS1 apart
+    genes.loc[is_multi] = genes.loc[is_multi].str.replace(r"(?<![A-Za-z0-9.-])([A-Za-z0-9.-]+)(?:;\1)+(?![A-Za-z0-9.-])", r"\1", regex=True)
+    df[gene_col] = np.append(genes.values, np.nan)[gene_ids]
+    if is_categorical:
+        df[gene_col] = df[gene_col].astype("category")
     return df
 
 
@@ -17,33 +31,162 @@ def remove_cosmic_dups(df):
     '''
     for some reason, sometimes genes appear more often in the DB with different types
     probably after applying remove_gene_dups
+    duplicates are detected and sorted on the packed variant key (see variant_key)
+    rows without valid key are only merged if they share all variant columns
     '''
-    no_dups = df.loc[~df.duplicated(['Chr', 'Start', 'End', 'Ref', 'Alt'], keep=False), :]
-    dups = df.loc[df.duplicated(['Chr', 'Start', 'End', 'Ref', 'Alt'], keep=False), :]
+    keys = variant_keys(df)[0]
+    is_dup = pd.Series(keys).duplicated(keep=False).values
+    no_dups = df.loc[~is_dup, :].assign(variant_key=keys[~is_dup])
+    dups = df.loc[is_dup, :].assign(variant_key=keys[is_dup])
     # remove by grouping and concating the types
-    dups = dups.groupby([c for c in dups.columns if c not in ["type", "Mut_ID"]]).agg({"Mut_ID": "first", "type":lambda x: "+".join(x)}).reset_index()
-    df = pd.concat([no_dups, dups]).sort_values(['Chr', 'Start', 'End', 'Ref', 'Alt'])
-    return df
+    group_cols = ['variant_key'] + [c for c in dups.columns if c not in variant_cols + ["type", "Mut_ID", "variant_key"]]
+    agg = {"Mut_ID": "first", "type": lambda x: "+".join(x)}
+    is_valid = dups['variant_key'].values >= 0
+    dups = pd.concat([
+        dups.loc[is_valid].groupby(group_cols, observed=True, dropna=False, sort=False).agg({**{col: "first" for col in variant_cols}, **agg}).reset_index(),
+        dups.loc[~is_valid].groupby(group_cols + variant_cols, observed=True, dropna=False, sort=False).agg(agg).reset_index()
+    ])
+    df = pd.concat([no_dups, dups.loc[:, no_dups.columns]]).sort_values('variant_key', kind="mergesort")
+    return df.drop(columns="variant_key")
+
+
+
+def partition_bounds(df, keys, parts):
+    '''
+    sorts the df by keys and returns it with the row bounds of (roughly) equal-sized parts
+    rows sharing the same keys always end up in the same part
+    '''
 
+    df = df.sort_values(keys, kind="mergesort")
+    key_starts = np.flatnonzero(df[keys].ne(df[keys].shift()).any(axis=1).values)
+    # move the even split points to the next start of a key group
+    splits = np.searchsorted(key_starts, np.linspace(0, len(df.index), parts + 1)[1:-1])
+    bounds = np.unique(np.r_[0, key_starts[splits[splits < len(key_starts)]], len(df.index)])
+    return df, bounds
 
 
 # load the annovar output
-def load_anno(file):
+anno_cols = ['Chr', 'Start', 'End', 'Ref', 'Alt', 'Func', 'Gene', 'ExonicFunc', 'AAChange', 'cytoband', 'gnomAD', 'Mut_ID', 'type']
+anno_categories = ['Func', 'Gene', 'ExonicFunc']
+
+
+def chrom_categories(chrom_col):
+    '''
+    converts a chromosome column into an ordered categorical in natural chromosome order
+    purely numeric chromosome names are kept as integers
+    '''
+
+    if isinstance(chrom_col.dtype, pd.CategoricalDtype):
+        # only the categories are converted
+        chrom_col = chrom_col.cat.remove_unused_categories()
+        categories = chrom_categories(pd.Series(chrom_col.cat.categories))
+        codes = np.append(categories.cat.codes.values, -1)[chrom_col.cat.codes.values]
+        return pd.Series(pd.Categorical.from_codes(codes, dtype=categories.dtype), index=chrom_col.index)
+    chroms = chrom_col.astype(str)
+    if chroms.str.isdigit().all():
+        chroms = chroms.astype(int)
+    return chroms.astype(pd.CategoricalDtype(sorted(chroms.unique(), key=chrom_order), ordered=True))
+
+
+def exonic_mask(anno_df, filter_setting):
+    '''
+    returns the boolean mask of the relevant (exonic and functional non-SNP) mutations
+    '''
+
+    # filter for exonic mutations
+    exonic = anno_df['Func'].isin(filter_setting['exonic_list'])
+    # filter for functional mutations
+    SNV = anno_df['ExonicFunc'].isin(filter_setting['mut_list'])
+    SNP = anno_df['gnomAD'].astype(float) > filter_setting['gnomad_max']
+    return exonic & SNV & ~SNP
+
+
+def anno_col(col):
+    '''
+    shortens an annovar column name (Func.refGene --> Func, gnomAD_exome_ALL --> gnomAD)
+    '''
+
+    return col.replace(".refGene","").replace("_exome_ALL", "")
+
+
+def anno_names(file):
+    '''
+    returns the column names of an annovar file (the names of the Other columns are stored in the first data row)
+    '''
+
+    header = pd.read_csv(file, sep="\t", nrows=1, dtype=str)
+    names = [header[col].iloc[0] if col.startswith("Other") else anno_col(col) for col in header.columns]
+    return [name if name not in names[:i] else f"{name}.{i}" for i, name in enumerate(names)]
+
+
+def anno_chroms(file, chunksize=1000000, use_cache=True, cache_folder="", verbose=1):
+    '''
+    returns the (normalized) chromosomes of an annovar file in natural order
+    with use_cache (and pyarrow installed) they are taken from the table cache, otherwise from a pass over the Chr column
+    '''
+
+    if use_cache and has_arrow():
+        chroms = get_cache(file, cache_folder=cache_folder, names=anno_names(file), skiprows=2, chunksize=chunksize, verbose=verbose)[1]['chroms']
+    else:
+        chroms = set()
+        for chunk in pd.read_csv(file, sep="\t", header=None, skiprows=2, usecols=[0], dtype=str, chunksize=chunksize, **na_args):
+            chroms.update(chrom_names(chunk[0].dropna().unique()))
+    return sorted(chroms, key=chrom_order)
+
+
+def concat_categoricals(dfs, cols):
+    '''
+    concats dfs with categorical cols, unifying the categories with union_categoricals (pd.concat falls back to object dtype)
+    '''
+
+    df = pd.concat([part.drop(columns=cols) for part in dfs], ignore_index=True)
+    for col in cols:
+        df[col] = union_categoricals([part[col] for part in dfs])
+    return df.loc[:, dfs[0].columns]
+
+
+def load_anno(file, filter_setting={}, chroms=[], chunksize=1000000, use_cache=True, cache_folder="", verbose=1):
     '''
     load the annovar file and edits columns
+    the file is streamed in chunks reading only the needed columns with a fixed schema:
+        - Chr, Func, Gene, ExonicFunc as categoricals (Chr in natural order)
+        - Start, End as int32 and gnomAD as float64 (exact filter cutoffs)
+    the categoricals are built per chunk and unified with union_categoricals, so no full object-dtype frame is held
+    if a filter_setting is given, the filter_exonic filters are applied per chunk
+    only the chromosomes in chroms are loaded (all if empty)
+    with use_cache (and pyarrow installed), the chunks are read chromosome-wise from the table cache (see table_cache)
+    both ways read only empty fields as missing values (see table_cache.na_args)
     '''
-    cosmic_anno = pd.read_csv(file, sep="\t", low_memory=False)
-    # quick edit of the columns
-    cosmic_anno.columns = [cosmic_anno[col].iloc[0] if col.startswith("Other") else col.replace(".refGene","").replace("_exome_ALL", "") for col in cosmic_anno.columns]
-    cosmic_anno = cosmic_anno[1:]
-    # adjust file types
-    for col in ["Chr", "Start", "End"]:
-        cosmic_anno.loc[:,col] = cosmic_anno[col].fillna(0).astype(float).astype(int)
-        cosmic_anno.loc[cosmic_anno['gnomAD'] == ".",'gnomAD'] = 0
-    cosmic_anno.loc[:, 'gnomAD'] = cosmic_anno['gnomAD'].astype(float)
-    # remove unneeded cols
-    cosmic_anno = cosmic_anno.loc[:,['Chr', 'Start', 'End', 'Ref', 'Alt', 'Func', 'Gene',
-       'ExonicFunc', 'AAChange', 'cytoband', 'gnomAD', 'Mut_ID', 'type']]
+
+    names = anno_names(file)
+    if use_cache and has_arrow():
+        chunks = iter_cached(file, columns=anno_cols, chroms=chroms, cache_folder=cache_folder, names=names, skiprows=2, chunksize=chunksize, verbose=verbose)
+    else:
+        cols = {names.index(col): col for col in anno_cols}
+        chunks = (chunk.rename(columns=cols).loc[:, anno_cols] for chunk in pd.read_csv(file, sep="\t", header=None, skiprows=2, usecols=list(cols), dtype=str, chunksize=chunksize, **na_args))
+        if len(chroms):
+            chunks = (chunk.loc[np.isin(chrom_names(chunk['Chr'].fillna("")), chrom_names(chroms))] for chunk in chunks)
+    anno_dfs = []
+    ini_len = 0
+    for chunk in chunks:
+        # adjust file types
+        for col in ["Start", "End"]:
+            chunk[col] = pd.to_numeric(chunk[col]).fillna(0).astype(np.int32)
+        chunk['gnomAD'] = pd.to_numeric(chunk['gnomAD'], errors="coerce").fillna(0)
+        ini_len += len(chunk.index)
+        if filter_setting:
+            chunk = chunk.loc[exonic_mask(chunk, filter_setting)]
+        chunk['Chr'] = chunk['Chr'].fillna("0")
+        for col in ['Chr'] + anno_categories:
+            chunk[col] = chunk[col].astype("category")
+        anno_dfs.append(chunk)
+    cosmic_anno = concat_categoricals(anno_dfs, ['Chr'] + anno_categories) if anno_dfs else pd.DataFrame(columns=anno_cols)
+    cosmic_anno['Chr'] = chrom_categories(cosmic_anno['Chr'])
+    for col in anno_categories:
+        cosmic_anno[col] = cosmic_anno[col].astype("category")
+    if filter_setting and verbose:
+        filter_len = len(cosmic_anno.index)
+        show_output(f"Filtered out {ini_len - filter_len} mutations [{ini_len} --> {filter_len}]")
     return cosmic_anno
 
 
@@ -53,46 +196,79 @@ def filter_exonic(anno_df, filter_setting):
     '''
     
     ini_len = len(anno_df.index)
-    # filter for exonic mutations
-    exonic = anno_df['Func'].isin(filter_setting['exonic_list'])
-    # filter for functional mutations
-    SNV = anno_df['ExonicFunc'].isin(filter_setting['mut_list'])
-    SNP = anno_df['gnomAD'].astype(float) > filter_setting['gnomad_max']
-    cosmic_filtered = anno_df[exonic & SNV & ~SNP]
+    cosmic_filtered = anno_df[exonic_mask(anno_df, filter_setting)]
     filter_len = len(cosmic_filtered.index)
     print(f"Filtered out {ini_len - filter_len} mutations [{ini_len} --> {filter_len}]")
     return cosmic_filtered
 
 
 
-def collapse(chrom_df, pad=100):
+def position_keys(df):
     '''
-    detect overlapping regions and collapse stretches
-    expects single chromosome dfs
+    returns Start and End combined with the chromosome into sortable int64 keys
+    expects a df sorted by Chr
+    '''
+
+    chrom_offset = pd.factorize(df['Chr'])[0].astype(np.int64) * 2**32
+    return chrom_offset + df['Start'].values.astype(np.int64), chrom_offset + df['End'].values.astype(np.int64)
+
+
+def overlap_starts(start, end):
+    '''
+    interval merge kernel for interval keys sorted by start
+    returns a boolean array marking the first interval of every overlap group and the running maximum of end
+    an interval belongs to the current group if it overlaps (start < end) with any previous interval of the group
     '''
-    pd.options.mode.chained_assignment = None
-    # copy just to make sure
-    cr = chrom_df.copy()
+
+    max_end = np.maximum.accumulate(end)
+    return np.r_[True, start[1:] >= max_end[:-1]][:len(start)], max_end
+
+
+def merge_intervals(df, pad=0, agg={}):
+    '''
+    detects overlapping intervals across all chromosomes in one pass
+    the df is sorted once by Chr and Start, the coords are extended by pad
+    and the overlap groups are assigned from the running maximum of End
+    returns the sorted df with the group ids in column ovgroup
+    and a df with Chr, Start, End (+ aggregations in agg) and stretch per group
+    '''
+
+    df = df.sort_values(['Chr', 'Start'], kind="mergesort").reset_index(drop=True)
     #extend the coords
-    cr.loc[:,'Start'] = cr['Start'] - pad
-    cr.loc[:,'End'] = cr['End'] + pad
-    # get the overlaps
-    cr.loc[:,'ov1'] = (cr['End'] > cr.shift(-1)['Start']).astype(int)
-    cr.loc[:,'ov2'] = (cr['Start'] < cr.shift(1)['End']).astype(int)
-    # assign overlap groups
-    cr.loc[:,'ovgroup'] = ((cr['ov1'] * (cr['ov2'] == 0).astype(int)).cumsum()) * (cr['ov1'] | (cr['ov2']))   
-    # remove the isolated mutations from the grouping because they are all group 0 and re-index
-    cr_nogap = cr.query('ovgroup == 0')
-    cr = cr.query('ovgroup > 0').reset_index(drop=True)
-    # assign negative indices to isolated mutations
-    cr_nogap.loc[:,'ovgroup'] = -cr_nogap.index
-    # re-combine for proper grouping
-    cr = pd.concat([cr_nogap, cr]).reset_index(drop=True).sort_values(["Chr", "Start"], ascending=True)
+    df['Start'] = df['Start'] - pad
+    df['End'] = df['End'] + pad
+    start, end = position_keys(df)
+    is_first, max_end = overlap_starts(start, end)
+    df['ovgroup'] = np.cumsum(is_first)
+    # min/max of string columns are aggregated on their sorted codes (pandas loops over the groups for strings)
+    str_cols = [col for col, func in agg.items() if func in ["min", "max"] and not pd.api.types.is_numeric_dtype(df[col])]
+    levels = {}
+    codes_df = df.copy(deep=False)
+    for col in str_cols:
+        codes, levels[col] = pd.factorize(df[col], sort=True)
+        codes_df[col] = np.where(codes < 0, np.nan, codes)
     # condense the groups and keep important metrices
-    cg = cr.groupby("ovgroup").agg(dict(
-        Chr="first",
-        Start="min",
-        End="max",
+    groups = codes_df.groupby("ovgroup", sort=False).agg(dict(Chr="first", Start="min", End="max", **agg))
+    for key in [key for key in groups.columns if (key[0] if isinstance(key, tuple) else key) in str_cols]:
+        group_codes = groups[key].values
+        level = levels[key[0] if isinstance(key, tuple) else key]
+        if not len(level):
+            # only missing values
+            groups[key] = np.nan
+            continue
+        groups[key] =pd.Series(level.take(np.nan_to_num(group_codes, nan=0).astype(np.int64)), index=groups.index).where(~np.isnan(group_codes))
+    # add the length of the overlap
+    groups['stretch'] = max_end[np.r_[is_first[1:], True][:len(start)]] - start[is_first]
+    return df, groups
+
+
+def collapse(chrom_df, pad=100):
+    '''
+    detect overlapping regions and collapse stretches
+    works on single or multiple chromosomes
+    '''
+
+    cr, cg = merge_intervals(chrom_df, pad=pad, agg=dict(
         Gene=["first","last"],
         cytoband="min",
         gnomAD="max",
@@ -103,35 +279,30 @@ def collapse(chrom_df, pad=100):
     
     # reassign the multiindex to simple column index
     cg.columns = [f"{col[0]}-{col[1]}" if col[0] == "Gene" else col[0] for col in cg.columns]
-    # consolidate the Gene Info
+    # consolidate the Gene Info (categorical genes from load_anno are edited as plain strings)
+    cg[['Gene-first', 'Gene-last']] = cg[['Gene-first', 'Gene-last']].astype(object)
     cg.loc[cg['Gene-first'] == cg['Gene-last'], 'Gene-last'] = ""
     cg = cg.rename({"Gene-first": "Gene", "Gene-last":"Gene2", "Func":"mutN"}, axis=1).reset_index()
-    # add the length of the overlap
-    cg.loc[:, 'stretch'] = cg['End'] - cg['Start']
-    #reorder columns
-    # cg.columns = list(cg.columns[1:]) + [cg.columns[0]]
-    cg = cg.sort_values(['Chr', 'Start'], ascending=True).reset_index(drop=True)
-    pd.options.mode.chained_assignment = "warn"
     return cg, cr
 
 
-def full_collapse(df, padding=100, verbose=1):
+def full_collapse(df, padding=100, verbose=1, threads=1):
     '''
-    cycles through chromosomes and returns df with collapsed mutation regions
+    returns df with collapsed mutation regions (all chromosomes at once)
+    with threads > 1, the chromosomes are collapsed in parallel (see pool_utils.map_chroms) and the ovgroups renumbered
     '''
     if verbose:
         show_output("Collapsing adjacent mutations and including bait padding")
-    chrom_dfs = []
-    chrom_group_dfs = []
-    for chrom in df['Chr'].unique():
-        if verbose > 1:
-            show_output(f"Collapsing chromosome {chrom}")
-        chrom_group_df, chrom_df = collapse(df.query("Chr == @chrom"), pad=padding)
-        chrom_group_dfs.append(chrom_group_df)
-        chrom_dfs.append(chrom_df)
-    df = pd.concat(chrom_dfs).drop(['ov1', 'ov2'], axis=1)
-    group_df = pd.concat(chrom_group_dfs).loc[:,['Chr', 'Start', 'End', 'Gene', 'Gene2', 'cytoband', 'gnomAD',
-       'cosmic_score', 'cosmic_density', 'ovgroup', 'mutN', 'stretch']].sort_values(['Chr', 'Start'])
+    if threads > 1:
+        parts = map_chroms(collapse, df, threads, pad=padding)
+        # continue the group ids of every chromosome after those of the previous ones
+        offsets = np.cumsum([0] + [len(group_df.index) for group_df, _ in parts[:-1]])
+        group_df = pd.concat([group_df.assign(ovgroup=group_df['ovgroup'] + offset) for (group_df, _), offset in zip(parts, offsets)], ignore_index=True)
+        df = pd.concat([chrom_df.assign(ovgroup=chrom_df['ovgroup'] + offset) for (_, chrom_df), offset in zip(parts, offsets)], ignore_index=True)
+    else:
+        group_df, df = collapse(df, pad=padding)
+    group_df = group_df.loc[:,['Chr', 'Start', 'End', 'Gene', 'Gene2', 'cytoband', 'gnomAD',
+       'cosmic_score', 'cosmic_density', 'ovgroup', 'mutN', 'stretch']]
 
     # now, remove the padding again
     df.loc[:,'Start'] = df['Start'] + padding
@@ -142,84 +313,75 @@ def full_collapse(df, padding=100, verbose=1):
 def collapse_bed(chrom_df):
     '''
     detect overlapping regions and collapse stretches
-    expects single chromosome dfs
+    works on single or multiple chromosomes
     '''
-    pd.options.mode.chained_assignment = None
-    # copy just to make sure
-    cr = chrom_df.copy()
-    #extend the coords
-    # get the overlaps
-    cr['ov1'] = (cr['End'] > cr.shift(-1)['Start']).astype(int)
-    cr['ov2'] = (cr['Start'] < cr.shift(1)['End']).astype(int)
-    # assign overlap groups
-    cr['ovgroup'] = ((cr['ov1'] * (cr['ov2'] == 0).astype(int)).cumsum()) * (cr['ov1'] | (cr['ov2']))   
-    # remove the isolated mutations from the grouping because they are all group 0 and re-index
-    cr_nogap = cr.query('ovgroup == 0')
-    cr = cr.query('ovgroup > 0').reset_index(drop=True)
-    # assign negative indices to isolated mutations
-    cr_nogap.loc[:,'ovgroup'] = -cr_nogap.index
-    # re-combine for proper grouping
-    cr = pd.concat([cr_nogap, cr]).reset_index(drop=True).sort_values(["Chr", "Start"], ascending=True)
-    # condense the groups and keep important metrices
-    cg = cr.groupby("ovgroup").agg(dict(
-        Chr="first",
-        Start="min",
-        End="max",
-    ))
-    
-    # consolidate the Gene Info
-    # add the length of the overlap
-    cg.loc[:, 'stretch'] = cg['End'] - cg['Start']
-    #reorder columns
-    # cg.columns = list(cg.columns[1:]) + [cg.columns[0]]
-    cg = cg.sort_values(['Chr', 'Start'], ascending=True).reset_index()
-    pd.options.mode.chained_assignment = "warn"
-    return cg
+
+    return merge_intervals(chrom_df)[1].reset_index()
 
 
-def is_bed(bed_df):
+def is_bed_line(line):
     '''
-    checks for chromosome label and Start-End id
+    checks whether a line of a bed file is a data line (Chr Start End ...)
     '''
-    
-    test = bed_df.iloc[0,:]
-    try:
-        has_chr = test[0].startswith("chr") or int(test[0]) < 25
-    except:
-        has_chr = False      
-    try:
-        start_end = test[1].is_integer() and test[2].is_integer()
-    except:
-        start_end = False                                  
-    return has_chr and start_end
 
+    fields = line.split("\t")
+    return len(fields) >= 3 and fields[1].strip().isdigit() and fields[2].strip().isdigit() and not line.startswith(("track", "browser", "#"))
 
-def get_bedsize(bed_file, verbose=0):
+
+def read_bed(bed_file, chunksize=1000000):
+    '''
+    streams the regions of a (gzipped) bed file as chunks of Chr, Start, End
+    leading header lines (track, browser, comments or column names) are skipped in the same pass
+    '''
+
+    with (gzip.open(bed_file, "rt") if bed_file.endswith(".gz") else open(bed_file, "r")) as stream:
+        skipped = 0
+        while True:
+            pos = stream.tell()
+            line = stream.readline()
+            if not line or is_bed_line(line):
+                break
+            skipped += 1
+        stream.seek(pos)
+        if skipped:
+            show_output(f"Skipping first {skipped} rows of bedfile", color="warning")
+        for chunk in pd.read_csv(stream, sep="\t", header=None, usecols=[0, 1, 2], names=['Chr', 'Start', 'End'], dtype={'Chr': str, 'Start': np.int32, 'End': np.int32}, comment="#", chunksize=chunksize):
+            yield chunk
+
+
+def get_bedsize(bed_file, verbose=0, chunksize=1000000, threads=1):
     '''
     reads bedfile and returns the library size
-    cycles through chromosomes and returns df with collapsed mutation regions
-    '''
-    # read bed_file and skip improper rows
-    i = 0
-    while True:
-        df = pd.read_csv(bed_file, sep="\t", skiprows=i, names=['Chr', 'Start', 'End', 'ID', 'desc', 'info'])
-        if is_bed(df):
-            show_output(f"Skipping first {i} rows of bedfile", color="warning")
-            break
-        i += 1
-        
-        
+    the bed file is streamed in chunks and overlapping regions are merged on the fly
+    so that only the currently open region is carried over between chunks
+    unsorted bed files are merged in memory (per chromosome in parallel with threads > 1)
+    '''
     if verbose:
         show_output("Collapsing adjacent mutations")
-    chrom_group_dfs = []
-    for chrom in df['Chr'].unique():
-        if verbose > 1:
-            show_output(f"Collapsing chromosome {chrom}")
-        chrom_group_df = collapse_bed(df.query("Chr == @chrom"))
-        chrom_group_dfs.append(chrom_group_df)
-    group_df = pd.concat(chrom_group_dfs).loc[:,['Chr', 'Start', 'End', 'ovgroup','stretch']].sort_values(['Chr', 'Start'])
-    
-    bedsize = group_df['stretch'].sum()
+    chrom_ids = {}
+    bedsize = 0
+    # the open region as (start, end) keys
+    carry = None
+    for chunk in read_bed(bed_file, chunksize=chunksize):
+        for chrom in chunk['Chr'].unique():
+            chrom_ids.setdefault(chrom, len(chrom_ids))
+        chrom_offset = chunk['Chr'].map(chrom_ids).values.astype(np.int64) * 2**32
+        start = chrom_offset + chunk['Start'].values
+        end = chrom_offset + chunk['End'].values
+        if carry is not None:
+            start, end = np.r_[carry[0], start], np.r_[carry[1], end]
+        if np.any(start[1:] < start[:-1]):
+            show_output("Bed file is not sorted - merging regions in memory", color="warning")
+            bedsize = int(sum(chrom_df['stretch'].sum() for chrom_df in map_chroms(collapse_bed, pd.concat(read_bed(bed_file, chunksize=chunksize)), threads)))
+            break
+        is_first, max_end = overlap_starts(start, end)
+        first = np.flatnonzero(is_first)
+        # all but the last region are complete
+        bedsize += int((max_end[first[1:] - 1] - start[first[:-1]]).sum())
+        carry = (start[first[-1]], max_end[-1])
+    else:
+        if carry is not None:
+            bedsize += int(carry[1] - carry[0])
     show_output(f"bedfile {os.path.basename(bed_file)} has a design size of {bedsize / 1000}kb", color="success")
     return bedsize
 
@@ -1,4 +1,5 @@
 import os
+import pandas as pd
 from datetime import datetime as dt
 from subprocess import check_call as run
 from datetime import datetime as dt
@@ -56,12 +57,32 @@ def run_cmd(cmd, show=True, **kwargs):
     return exit == 0
 
 
+def chrom_order(chrom):
+    """
+    sort key for the natural order of chromosome names (1, 2, .., 22, X, Y, M)
+    """
+    name = str(chrom).replace("chr", "")
+    if name.isdigit():
+        return (0, int(name), "")
+    return (1, ["X", "Y", "M", "MT"].index(name) if name in ["X", "Y", "M", "MT"] else 4, name)
+
+
+def chrom_ranks(chrom_col):
+    """
+    returns the rank of every chromosome in a column in natural chromosome order
+    """
+    chroms = pd.unique(chrom_col.dropna())
+    ranks = {chrom: rank for rank, chrom in enumerate(sorted(chroms, key=chrom_order))}
+    return chrom_col.astype(object).map(ranks)
+
+
 def sort_df(df, cols={"Chr": True, "Start": True}):
     """
     helper for sorting dfs for chromosomes using Chr, Start + cols in cols
     """
-    # make Chr column categorical for sorting .. and sort
-    chrom_list = [f"chr{i}" for i in range(23)] + ["chrX", "chrY"]
-
-    df.loc[:, "Chr"] = pd.Categorical(df["Chr"], chrom_list)
-    return df.sort_values(list(cols.keys()), ascending=list(cols.values()))
\ No newline at end of file
+    # sort Chr in natural chromosome order (chr1, chr2, .. chr22, chrX, chrY, chrM, other contigs)
+    return df.sort_values(
+        list(cols.keys()),
+        ascending=list(cols.values()),
+        key=lambda col: chrom_ranks(col) if col.name == "Chr" else col
+    )
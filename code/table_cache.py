@@ -0,0 +1,162 @@
+import os
+import json
+import shutil
+import threading
+import importlib.util
+import pandas as pd
+from script_utils import show_output
+from interval_index import chrom_names
+
+# bump to invalidate all caches written with an older layout
+cache_version = 1
+# serializes cache builds of concurrent threads (see annotate_batch)
+cache_lock = threading.Lock()
+# only empty fields are missing values (annovar strings like NA stay strings), also for uncached reads of the same tables
+na_args = dict(keep_default_na=False, na_values=[""])
+
+
+def has_arrow():
+    '''
+    checks whether pyarrow is available for the table cache
+    '''
+
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def cache_path(file, cache_folder=""):
+    '''
+    returns the cache folder of a table file (default: .table_cache next to the file)
+    '''
+
+    if not cache_folder:
+        cache_folder = os.path.join(os.path.dirname(os.path.abspath(file)), ".table_cache")
+    return os.path.join(cache_folder, os.path.basename(file))
+
+
+def source_stamp(file, read_args={}):
+    '''
+    returns the properties of the source file (and the read arguments) that invalidate a cache
+    '''
+
+    stat = os.stat(file)
+    return dict(version=cache_version, size=stat.st_size, mtime=stat.st_mtime_ns, read_args=read_args)
+
+
+def load_manifest(folder):
+    '''
+    returns the manifest of a cache folder or an empty dict
+    '''
+
+    manifest_file = os.path.join(folder, "manifest.json")
+    if not os.path.isfile(manifest_file):
+        return {}
+    with open(manifest_file, "r") as stream:
+        return json.load(stream)
+
+
+def read_source(file, names=[], skiprows=0, chunksize=1000000):
+    '''
+    streams a tab-separated table as chunks of strings
+    the first column is the chromosome, the next two columns (Start, End) are converted to int64
+    '''
+
+    kwargs = dict(header=None, skiprows=skiprows, names=names) if names else dict(header=0, skiprows=skiprows or None)
+    for chunk in pd.read_csv(file, sep="\t", dtype=str, chunksize=chunksize, **na_args, **kwargs):
+        for col in chunk.columns[1:3]:
+            chunk[col] = pd.to_numeric(chunk[col], errors="coerce").fillna(0).astype("int64")
+        yield chunk
+
+
+def build_cache(file, folder, stamp, names=[], skiprows=0, chunksize=1000000, verbose=1):
+    '''
+    converts a table into one uncompressed arrow (feather v2) file per chromosome
+    the files are written chunk by chunk so the table is never fully loaded
+    the cache folder is always reported, as it can take as much disk space as the table
+    '''
+
+    import pyarrow as pa
+
+    show_output(f"Building table cache for {os.path.basename(file)} in {folder}")
+    temp_folder = f"{folder}.tmp"
+    shutil.rmtree(temp_folder, ignore_errors=True)
+    os.makedirs(temp_folder)
+    writers = {}
+    chroms = {}
+    schema = None
+    try:
+        for chunk in read_source(file, names=names, skiprows=skiprows, chunksize=chunksize):
+            if schema is None:
+                schema = pa.schema([(col, pa.int64() if i in [1, 2] else pa.string()) for i, col in enumerate(chunk.columns)])
+            chunk_chroms = chrom_names(chunk.iloc[:, 0].fillna(""))
+            for chrom, chrom_df in chunk.groupby(chunk_chroms, sort=False):
+                if chrom not in writers:
+                    chroms[chrom] = dict(file=f"{len(chroms)}.feather", rows=0)
+                    writers[chrom] = pa.ipc.new_file(os.path.join(temp_folder, chroms[chrom]['file']), schema)
+                writers[chrom].write_table(pa.Table.from_pandas(chrom_df, schema=schema, preserve_index=False))
+                chroms[chrom]['rows'] += len(chrom_df.index)
+    finally:
+        for writer in writers.values():
+            writer.close()
+    with open(os.path.join(temp_folder, "manifest.json"), "w") as stream:
+        json.dump(dict(stamp, columns=list(schema.names) if schema else [], chroms=chroms), stream)
+    shutil.rmtree(folder, ignore_errors=True)
+    os.rename(temp_folder, folder)
+    return load_manifest(folder)
+
+
+def get_cache(file, cache_folder="", names=[], skiprows=0, chunksize=1000000, verbose=1):
+    '''
+    returns the folder and manifest of the cache of file
+    the cache is (re)built if it is missing or the source file (or the read arguments) changed
+    '''
+
+    folder = cache_path(file, cache_folder=cache_folder)
+    stamp = source_stamp(file, read_args=dict(names=list(names), skiprows=skiprows))
+    with cache_lock:
+        manifest = load_manifest(folder)
+        if {key: manifest.get(key) for key in stamp} != stamp:
+            if manifest and verbose:
+                show_output(f"Source {os.path.basename(file)} has changed - table cache will be rebuilt", color="warning")
+            manifest = build_cache(file, folder, stamp, names=names, skiprows=skiprows, chunksize=chunksize, verbose=verbose)
+    return folder, manifest
+
+
+def iter_cached(file, columns=[], chroms=[], cache_folder="", names=[], skiprows=0, chunksize=1000000, verbose=1):
+    '''
+    yields a table chromosome by chromosome as dfs from the (memory-mapped) table cache
+    only the chromosomes in chroms (all if empty) and the columns in columns (all if empty) are read
+    without pyarrow, the source file is streamed and filtered instead
+    '''
+
+    chroms = list(chrom_names(chroms)) if len(chroms) else []
+    if not has_arrow():
+        for chunk in read_source(file, names=names, skiprows=skiprows, chunksize=chunksize):
+            if chroms:
+                chunk = chunk.loc[pd.Series(chrom_names(chunk.iloc[:, 0].fillna("")), index=chunk.index).isin(chroms)]
+            yield chunk.loc[:, columns] if len(columns) else chunk
+        return
+
+    import pyarrow as pa
+
+    folder, manifest = get_cache(file, cache_folder=cache_folder, names=names, skiprows=skiprows, chunksize=chunksize, verbose=verbose)
+    for chrom, part in manifest['chroms'].items():
+        if chroms and chrom not in chroms:
+            continue
+        # uncompressed arrow files are memory-mapped and only the selected columns are touched
+        with pa.memory_map(os.path.join(folder, part['file']), "r") as source:
+            table = pa.ipc.open_file(source).read_all()
+            if len(columns):
+                table = table.select(list(columns))
+            yield table.to_pandas()
+
+
+def read_cached(file, columns=[], chroms=[], cache_folder="", names=[], skiprows=0, chunksize=1000000, verbose=1):
+    '''
+    reads a table (or selected columns and chromosomes of it) through the table cache
+    the rows are grouped by chromosome in the order of their first appearance in the source file
+    '''
+
+    parts = list(iter_cached(file, columns=columns, chroms=chroms, cache_folder=cache_folder, names=names, skiprows=skiprows, chunksize=chunksize, verbose=verbose))
+    if not parts:
+        return pd.DataFrame(columns=list(columns) or load_manifest(cache_path(file, cache_folder)).get('columns', []))
+    return pd.concat(parts, ignore_index=True)
@@ -0,0 +1,159 @@
+import numpy as np
+import pandas as pd
+from script_utils import chrom_order
+from interval_index import chrom_names
+
+# bit layout of the int64 variant key: | chrom (7) | Start (30) | allele (26) |
+chrom_bits = 7
+pos_bits = 30
+allele_bits = 26
+variant_cols = ['Chr', 'Start', 'End', 'Ref', 'Alt']
+
+
+def key_levels(col, dropna=True):
+    '''
+    returns the codes and unique values of a column (NaN is kept as value unless dropna)
+    '''
+
+    return pd.factorize(col, use_na_sentinel=dropna)
+
+
+def build_key_table(*dfs):
+    '''
+    builds the dictionaries for the variant keys of one or more dfs (with Chr, Start, End, Ref, Alt)
+        - chroms: the (normalized) chromosome names in natural order
+        - lengths, refs, alts: the sorted unique values of End - Start, Ref and Alt
+        - alleles: the sorted unique (length, Ref, Alt) combinations as int64 codes
+    dfs encoded with the same key table can be compared and merged on their keys
+    '''
+
+    chroms = np.unique(np.concatenate([chrom_names(key_levels(df['Chr'])[1]) for df in dfs]))
+    key_table = dict(
+        chroms=np.array(sorted(chroms, key=chrom_order)),
+        lengths=np.unique(np.concatenate([(df['End'] - df['Start']).dropna().unique().astype(np.int64) for df in dfs])),
+        refs=pd.Index(np.concatenate([np.asarray(key_levels(df['Ref'], dropna=False)[1], dtype=object) for df in dfs])).unique().sort_values(),
+        alts=pd.Index(np.concatenate([np.asarray(key_levels(df['Alt'], dropna=False)[1], dtype=object) for df in dfs])).unique().sort_values()
+    )
+    key_table['alleles'] = np.unique(np.concatenate([allele_codes(df, key_table) for df in dfs]))
+    if len(chroms) >= 2**chrom_bits or len(key_table['alleles']) >= 2**allele_bits:
+        raise ValueError(f"Too many chromosomes ({len(chroms)}) or alleles ({len(key_table['alleles'])}) for the variant key")
+    return key_table
+
+
+def allele_codes(df, key_table):
+    '''
+    returns the (length, Ref, Alt) combinations of the rows as int64 codes (-1 for rows without coords)
+    '''
+
+    length = (df['End'] - df['Start']).values.astype(float)
+    length_ids = np.searchsorted(key_table['lengths'], np.nan_to_num(length, nan=0))
+    ref_codes, refs = key_levels(df['Ref'], dropna=False)
+    alt_codes, alts = key_levels(df['Alt'], dropna=False)
+    ref_ids = key_table['refs'].get_indexer(refs)[ref_codes]
+    alt_ids = key_table['alts'].get_indexer(alts)[alt_codes]
+    codes = (length_ids.astype(np.int64) * len(key_table['refs']) + ref_ids) * len(key_table['alts']) + alt_ids
+    return np.where(np.isnan(length), -1, codes)
+
+
+def variant_keys(df, key_table=None):
+    '''
+    packs Chr, Start, End, Ref and Alt of every row into one int64 key (-1 for rows without coords)
+    the keys sort like the variants (natural chromosome order, Start, End, Ref, Alt)
+    returns the keys and the key table needed for decode_keys
+    '''
+
+    if key_table is None:
+        key_table = build_key_table(df)
+    chrom_codes, chroms = key_levels(df['Chr'])
+    chrom_ids = np.append(pd.Index(key_table['chroms']).get_indexer(chrom_names(chroms)), -1)[chrom_codes]
+    codes = allele_codes(df, key_table)
+    allele_ids = np.minimum(np.searchsorted(key_table['alleles'], codes), max(len(key_table['alleles']) - 1, 0))
+    start = df['Start'].fillna(-1).values.astype(np.int64)
+    if (start >= 2**pos_bits).any():
+        raise ValueError("Start positions beyond the range of the variant key")
+    keys = (chrom_ids.astype(np.int64) << (pos_bits + allele_bits)) | (start << allele_bits) | allele_ids
+    is_valid = (chrom_ids >= 0) & (start >= 0) & (codes >= 0) & (key_table['alleles'][allele_ids] == codes)
+    return np.where(is_valid, keys, -1), key_table
+
+
+def decode_keys(keys, key_table):
+    '''
+    restores the variant columns Chr, Start, End, Ref, Alt from variant keys (Chr as normalized name)
+    '''
+
+    keys = np.asarray(keys, dtype=np.int64)
+    start = (keys >> allele_bits) & (2**pos_bits - 1)
+    codes = key_table['alleles'][keys & (2**allele_bits - 1)]
+    pairs = len(key_table['refs']) * len(key_table['alts'])
+    return pd.DataFrame(dict(
+        Chr=key_table['chroms'][keys >> (pos_bits + allele_bits)],
+        Start=start,
+        End=start + key_table['lengths'][codes // pairs],
+        Ref=key_table['refs'].values[codes // len(key_table['alts']) % len(key_table['refs'])],
+        Alt=key_table['alts'].values[codes % len(key_table['alts'])]
+    ))
+
+
+def position_groups(keys, key_table):
+    '''
+    returns the ids of the positions (Chr, Start, End) of variant keys as int64 codes in the order of the keys
+    '''
+
+    # the allele codes are sorted by length first, so the length id keeps the order of End within Start
+    length_ids = key_table['alleles'][keys & (2**allele_bits - 1)] // (len(key_table['refs']) * len(key_table['alts']))
+    return ((keys >> allele_bits) << allele_bits) | length_ids
+
+
+def sort_by_key(df, keys):
+    '''
+    sorts df (stable) by its variant keys and returns the sorted df and keys
+    '''
+
+    order = np.argsort(keys, kind="mergesort")
+    return df.iloc[order], keys[order]
+
+
+def dedup_by_key(df, keys):
+    '''
+    removes duplicate variants (and rows without coords) keeping the first occurrence
+    returns the deduplicated df and its keys
+    '''
+
+    keep = ~pd.Series(keys).duplicated().values & (keys >= 0)
+    return df.loc[keep], keys[keep]
+
+
+def merge_on_key(left, right, how="inner", one_to_one=False):
+    '''
+    merges two dfs on the variant columns via their shared variant keys
+    the variant columns of right are dropped in favor of those of left
+    with one_to_one, repeated variants are matched by occurrence (the n-th in left with the n-th in right)
+    rows without a valid key (-1) are merged on the variant columns themselves (they would all match each other)
+    '''
+
+    key_table = build_key_table(left, right)
+    left = left.assign(variant_key=variant_keys(left, key_table)[0])
+    right = right.assign(variant_key=variant_keys(right, key_table)[0])
+    on = ["variant_key"]
+    if one_to_one:
+        left['occurrence'] = left.groupby("variant_key").cumcount().values
+        right['occurrence'] = right.groupby("variant_key").cumcount().values
+        on.append("occurrence")
+    is_left_valid = left['variant_key'].values >= 0
+    is_right_valid = right['variant_key'].values >= 0
+    if is_left_valid.all() and is_right_valid.all():
+        return left.merge(right.drop(columns=variant_cols), on=on, how=how).drop(columns=on)
+
+    # merge the rows without key separately and restore the order of left
+    left = left.assign(left_row=np.arange(len(left.index)))
+    left_invalid = left.loc[~is_left_valid].drop(columns="variant_key")
+    right_invalid = right.loc[~is_right_valid].drop(columns="variant_key")
+    if one_to_one:
+        left_invalid['occurrence'] = left_invalid.groupby(variant_cols, dropna=False, observed=True).cumcount().values
+        right_invalid['occurrence'] = right_invalid.groupby(variant_cols, dropna=False, observed=True).cumcount().values
+    parts = [
+        left.loc[is_left_valid].merge(right.loc[is_right_valid].drop(columns=variant_cols), on=on, how=how),
+        left_invalid.merge(right_invalid, on=variant_cols + on[1:], how=how)
+    ]
+    merged = pd.concat([part for part in parts if len(part.index)] or parts[:1], ignore_index=True)
+    return merged.sort_values("left_row", kind="mergesort").drop(columns=on + ["left_row"]).reset_index(drop=True)
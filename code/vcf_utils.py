@@ -0,0 +1,209 @@
+import os
+import re
+import csv
+import gzip
+import numpy as np
+import pandas as pd
+from script_utils import show_output
+
+vcf_cols = ['CHROM', 'POS', 'ID', 'REF', 'ALT', 'QUAL', 'FILTER', 'INFO']
+
+
+def is_vcf(file):
+    '''
+    checks whether file is a (gzipped or bgzipped) vcf file by its extension
+    '''
+
+    return isinstance(file, str) and re.search(r"\.vcf(\.b?gz)?$", file) is not None
+
+
+def vcf_compression(file):
+    '''
+    returns the compression of a vcf file by its magic bytes ("gzip" also for bgzip, which is multi-member gzip)
+    '''
+
+    with open(file, "rb") as stream:
+        return "gzip" if stream.read(2) == b"\x1f\x8b" else None
+
+
+def read_vcf_header(file):
+    '''
+    reads the meta lines and the column line of a vcf file
+    returns the column names, a dict INFO field --> Number from the meta lines and the number of header lines
+    '''
+
+    info_numbers = {}
+    header_lines = 0
+    opener = gzip.open if vcf_compression(file) else open
+    with opener(file, "rt") as stream:
+        for line in stream:
+            if not line.startswith("#"):
+                break
+            header_lines += 1
+            if line.startswith("##INFO="):
+                field = re.search(r"ID=([^,>]+)", line)
+                number = re.search(r"Number=([^,>]+)", line)
+                if field:
+                    info_numbers[field.group(1)] = number.group(1) if number else "."
+            elif not line.startswith("##"):
+                return line[1:].rstrip("\n").split("\t"), info_numbers, header_lines
+    return vcf_cols, info_numbers, header_lines
+
+
+def trim_allele(pos, ref, alt):
+    '''
+    converts one vcf allele into annovar coords exactly like convert2annovar.pl (convertVCF4 and adjustStartEndRefAlt)
+    alleles equal to ref are no variants and have to be dropped before (see vcf2annovar)
+    returns Start, End, Ref, Alt
+    '''
+
+    # a shared first part (the vcf padding base) is removed first
+    if len(ref) > len(alt) and ref.startswith(alt):
+        start, end, ref, alt = pos + len(alt), pos + len(ref) - 1, ref[len(alt):], "-"
+    elif len(ref) < len(alt) and alt.startswith(ref):
+        start, end, ref, alt = pos + len(ref) - 1, pos + len(ref) - 1, "-", alt[len(ref):]
+    elif len(ref) == len(alt) and alt.startswith(ref[:-1]):
+        start, end, ref, alt = pos + len(ref) - 1, pos + len(ref) - 1, ref[-1], alt[-1]
+    else:
+        start, end = pos, pos + len(ref) - 1
+    # then the shared suffix and the shared prefix
+    while ref[-1] == alt[-1]:
+        ref, alt, end = ref[:-1], alt[:-1], end - 1
+        if not ref:
+            # now it is an insertion
+            return start - 1, end, "-", alt
+        if not alt:
+            return start, end, ref, "-"
+    while ref[0] == alt[0]:
+        ref, alt, start = ref[1:], alt[1:], start + 1
+        if not ref:
+            return start - 1, end, "-", alt
+        if not alt:
+            return start, end, ref, "-"
+    return start, end, ref, alt
+
+
+def trim_alleles(pos, ref, alt):
+    '''
+    converts vcf alleles into annovar coords like convert2annovar.pl (see trim_allele)
+    SNVs and padded insertions/deletions are converted as arrays, only the other alleles are trimmed one by one
+    returns Start, End, Ref, Alt
+    '''
+
+    ref, alt = pd.Series(ref, dtype=str), pd.Series(alt, dtype=str)
+    ref_len, alt_len = ref.str.len().values, alt.str.len().values
+    start, end = pos.copy(), pos.copy()
+    # deletions and insertions with one padding base (the most common indels)
+    is_del = (alt_len == 1) & (ref_len > 1) & (ref.str[0] == alt).values
+    is_ins = (ref_len == 1) & (alt_len > 1) & (alt.str[0] == ref).values
+    end[is_del] += ref_len[is_del] - 1
+    start[is_del] += 1
+    ref = ref.mask(is_del, ref.str[1:]).mask(is_ins, "-")
+    alt = alt.mask(is_ins, alt.str[1:]).mask(is_del, "-")
+    ref, alt = np.asarray(ref, dtype=object), np.asarray(alt, dtype=object)
+    rows = np.flatnonzero(((ref_len != 1) | (alt_len != 1)) & ~is_del & ~is_ins)
+    if len(rows):
+        trimmed = [trim_allele(p, r, a) for p, r, a in zip(pos[rows], ref[rows], alt[rows])]
+        start[rows], end[rows], ref[rows], alt[rows] = [np.array(values, dtype=dtype) for values, dtype in zip(zip(*trimmed), [np.int64, np.int64, object, object])]
+    return start, end, ref, alt
+
+
+def info_values(info, fields, info_numbers, alt_index):
+    '''
+    extracts INFO fields as columns INFO_<field> from the INFO strings
+    for split multi-allelic records, fields with Number=A (Number=R) keep the value of their alt allele
+    flags become 1/0
+    '''
+
+    info = pd.Series(info, dtype=object).fillna("")
+    columns = {}
+    for field in fields:
+        number = info_numbers.get(field, ".")
+        if number == "0":
+            columns[f"INFO_{field}"] = info.str.contains(rf"(?:^|;){re.escape(field)}(?:;|$)").astype(int).values
+            continue
+        values = info.str.extract(rf"(?:^|;){re.escape(field)}=([^;]*)", expand=False)
+        if number in ["A", "R"]:
+            index = alt_index - 1 if number == "A" else alt_index
+            split = values.str.split(",")
+            values = pd.Series([
+                items[i] if isinstance(items, list) and i < len(items) else np.nan for items, i in zip(split, index)
+            ], dtype=object)
+        columns[f"INFO_{field}"] = values.values
+    return pd.DataFrame(columns)
+
+
+def vcf2annovar(chunk, info_numbers={}, info_fields=[], keep_info=True):
+    '''
+    converts a chunk of vcf records into annovar variants (Chr, Start, End, Ref, Alt)
+    multi-allelic records are split into one row per alt allele (column AltIndex holds the position in ALT)
+    records without called alt allele (., * and symbolic alleles like <DEL>) and alleles equal to REF are dropped (like convert2annovar.pl)
+    ID, QUAL, FILTER, INFO (unless keep_info=False), FORMAT and the sample columns are kept as side columns
+    the INFO fields in info_fields are extracted into columns INFO_<field>
+    '''
+
+    # only multi-allelic records need splitting
+    alt_counts = chunk['ALT'].str.count(",").values + 1
+    rows = np.repeat(np.arange(len(chunk.index)), alt_counts)
+    alt_index = np.arange(len(rows)) - np.repeat(np.cumsum(alt_counts) - alt_counts, alt_counts) + 1
+    alt = chunk['ALT'].str.upper().values.take(rows)
+    is_multi = alt_counts[rows] > 1
+    if is_multi.any():
+        alt = np.asarray(alt, dtype=object)
+        alt[is_multi] = chunk['ALT'].loc[alt_counts > 1].str.upper().str.split(",").explode().values
+    alt = pd.Series(alt, dtype=str)
+    ref = chunk['REF'].str.upper().values.take(rows)
+    is_called = ~(alt.isin([".", "*"]) | alt.str.startswith("<") | (alt == ref)).values
+    alt, ref = alt.values[is_called], ref[is_called]
+    rows, alt_index = rows[is_called], alt_index[is_called]
+
+    start, end, ref, alt = trim_alleles(chunk['POS'].values.astype(np.int64)[rows], ref, alt)
+    side_cols = [col for col in chunk.columns if not col in ['CHROM', 'POS', 'REF', 'ALT'] + ([] if keep_info else ['INFO'])]
+    anno_df = pd.concat([
+        pd.DataFrame(dict(Chr=chunk['CHROM'].values[rows], Start=start, End=end, Ref=ref, Alt=alt, AltIndex=alt_index)),
+        chunk.iloc[rows].loc[:, side_cols].reset_index(drop=True)
+    ], axis=1)
+    if info_fields:
+        anno_df = pd.concat([anno_df, info_values(chunk['INFO'].values[rows], info_fields, info_numbers, alt_index)], axis=1)
+    return anno_df
+
+
+def iter_vcf(file, chunksize=200000, info_fields=[], keep_info=True):
+    '''
+    streams a (b)gzipped or plain vcf file as chunks of annovar variants (see vcf2annovar)
+    only one chunk of records is held in memory at a time
+    '''
+
+    columns, info_numbers, header_lines = read_vcf_header(file)
+    chunks = pd.read_csv(
+        file, sep="\t", header=None, names=columns, skiprows=header_lines, compression=vcf_compression(file),
+        dtype=str, keep_default_na=False, na_values=[], quoting=csv.QUOTE_NONE, chunksize=chunksize
+    )
+    with chunks:
+        for chunk in chunks:
+            yield vcf2annovar(chunk.astype({'POS': np.int64}), info_numbers=info_numbers, info_fields=info_fields, keep_info=keep_info)
+
+
+def read_vcf(file, chunksize=200000, info_fields=[], keep_info=True):
+    '''
+    reads a vcf file as df of annovar variants with the vcf fields as side columns (see vcf2annovar)
+    '''
+
+    parts = list(iter_vcf(file, chunksize=chunksize, info_fields=info_fields, keep_info=keep_info))
+    vcf_df = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=['Chr', 'Start', 'End', 'Ref', 'Alt'])
+    show_output(f"Loaded {len(vcf_df.index)} variants from {os.path.basename(file)}")
+    return vcf_df
+
+
+def vcf2anno_file(file, out_file, chunksize=200000, info_fields=[], keep_info=True):
+    '''
+    converts a vcf file into a tab-separated annovar input file with header (replacement for convert2annovar.pl -format vcf4)
+    the file is written chunk by chunk with bounded memory
+    '''
+
+    rows = 0
+    for i, chunk in enumerate(iter_vcf(file, chunksize=chunksize, info_fields=info_fields, keep_info=keep_info)):
+        chunk.to_csv(out_file, sep="\t", index=False, header=i == 0, mode="w" if i == 0 else "a")
+        rows += len(chunk.index)
+    show_output(f"Converted {rows} variants from {os.path.basename(file)} into {out_file}")
+    return out_file
@@ -0,0 +1,63 @@
+import asyncio
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "code"))
+import anno
+
+
+def test_annotate_batch_waits_for_running_jobs(tmp_path, monkeypatch):
+    finished = []
+
+    def fake_run_annovar(file, temp_folder="", **kwargs):
+        # slow jobs write into their folder after the first job has been consumed
+        time.sleep(0.05 * len(file.index))
+        pd.DataFrame().to_csv(os.path.join(temp_folder, "out.csv"))
+        finished.append(len(file.index))
+        return file
+
+    monkeypatch.setattr(anno, "run_annovar", fake_run_annovar)
+    files = {f"job{i}": pd.DataFrame(dict(Chr=["chr1"] * n)) for i, n in enumerate([1, 4, 4, 8])}
+
+    async def first():
+        batch = anno.annotate_batch(files, max_jobs=3, threads=1, cleanup=True)
+        async for name, anno_df in batch:
+            await batch.aclose()
+            return name, anno_df
+
+    cwd = os.getcwd()
+    os.chdir(tmp_path)
+    try:
+        name, anno_df = asyncio.run(first())
+    finally:
+        os.chdir(cwd)
+    assert name == "job0" and isinstance(anno_df, pd.DataFrame)
+    # all started jobs could write into their folders before the batch folder was removed
+    assert sorted(finished) == [1, 4, 4, 8]
+    assert not os.listdir(tmp_path)
+
+
+def test_annotate_cached_remembers_dropped_variants(tmp_path, monkeypatch, capsys):
+    calls = []
+
+    def fake_annotate_variants(df, annovar_config, **kwargs):
+        # annovar drops the variants with Ref N
+        calls.append(len(df.index))
+        anno_df = df.reset_index(drop=True).assign(Func="exonic", anno_row=np.arange(len(df.index)))
+        return anno_df.loc[anno_df['Ref'] != "N"]
+
+    monkeypatch.setattr(anno, "annotate_variants", fake_annotate_variants)
+    monkeypatch.setattr(anno, "anno_protocol", lambda annovar_config: "protocol")
+    df = pd.DataFrame(dict(Chr=["chr1"] * 4, Start=[1, 2, 3, 1], End=[1, 2, 3, 1], Ref=["A", "N", "C", "A"], Alt=["G"] * 4))
+    cache_file = str(tmp_path / "anno_cache.sqlite")
+    for run in range(2):
+        anno_df = anno.annotate_cached(df, "config.yaml", cache_file=cache_file)
+        assert anno_df['anno_row'].tolist() == [0, 2, 3]
+        assert anno_df['Func'].tolist() == ["exonic"] * 3
+    # the dropped variant is not annotated again
+    assert calls == [3]
+    # the cache location is reported
+    assert f"Added 3 variants to annotation cache {cache_file}" in capsys.readouterr().out
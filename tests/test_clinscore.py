@@ -0,0 +1,91 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "code"))
+from clinscore import cosmic_score_proc, score_types, load_weights, get_cosmic_score, get_cosmic_scores, condense_muts_clinscore
+from pool_utils import close_pool
+
+config_folder = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "configs")
+
+weights = dict(type={'carcinoma': 2}, location={'lung': 3})
+
+
+def test_cosmic_score_proc_missing_types():
+    df = pd.DataFrame(dict(type=["2x(carcinoma@lung)+1x(other)", "no_tokens", np.nan, "1x(carcinoma)"]))
+    scores = cosmic_score_proc(df, clinscore_weights=weights, verbose=0)['cosmic_score']
+    # types without tokens stay NaN like in the row-wise scoring
+    assert scores.iloc[[0, 3]].tolist() == [15, 1]
+    assert scores.iloc[[1, 2]].isna().all()
+
+
+def test_score_types_default_zero():
+    scores = score_types(pd.Series(["no_tokens", "3x(carcinoma@lung)"]), clinscore_weights=weights)
+    assert scores.dtype == np.int64 and scores.tolist() == [0, 21]
+
+
+def rowwise_scores(type_col, w):
+    # the row-wise apply the vectorized scoring replaces
+    def compute_cosmic_score(row):
+        return (1 + w['type'].get(row["types"], 0) * w['location'].get(row["location"], 0)) * int(row["count"])
+
+    pattern = r"(?P<count>[0-9]+)x\((?P<types>[^@)]+)(?:@(?P<location>[^0-9@)]+))?\)"
+    tokens = type_col.str.replace("_(sclerosing_haemangioma)", "", regex=False).str.extractall(pattern)
+    scores = tokens.apply(compute_cosmic_score, axis=1).groupby(level=0).sum()
+    return scores.reindex(range(len(type_col))).fillna(0).astype(int).values
+
+
+def cosmic_types(n=1000, seed=0):
+    rng = np.random.default_rng(seed)
+    tokens = [
+        "adenocarcinoma@lung", "carcinoma@upper_lobe", "cancer", "large_cell_carcinoma@right_(sclerosing_haemangioma)",
+        "carcinoma@skin", "melanoma@lung", "adenocarcinoma"
+    ]
+    types = ["+".join(f"{rng.integers(1, 20)}x({token})" for token in rng.choice(tokens, rng.integers(1, 4))) for _ in range(n)]
+    return pd.DataFrame(dict(Gene=rng.choice(["KDR", "RET", "TP53"], n), type=types)).assign(type=lambda df: df['type'].mask(df.index % 97 == 0, "no_tokens"))
+
+
+def test_get_cosmic_score_matches_rowwise_scoring(tmp_path):
+    df = cosmic_types()
+    weights_files = [os.path.join(config_folder, file) for file in ["clinscoreLung.yaml", "clinscoreLung_with_geneboost.yaml"]]
+    expected = []
+    for weights_file in weights_files:
+        w = load_weights(weights_file)
+        scores = rowwise_scores(df['type'], w)
+        if "genes" in w:
+            scores = scores * df['Gene'].map(w['genes']).fillna(1).astype(int).values
+        expected.append(scores)
+        assert get_cosmic_score(df, cosmic_weights_file=weights_file, threads=1, verbose=0)['cosmic_score'].tolist() == scores.tolist()
+        # the stored type index gives the same scores
+        type_index = str(tmp_path / "types.npz")
+        assert get_cosmic_score(df, cosmic_weights_file=weights_file, verbose=0, type_index=type_index)['cosmic_score'].tolist() == scores.tolist()
+    assert (get_cosmic_scores(df, cosmic_weights_files=weights_files, verbose=0).values == np.column_stack(expected)).all()
+
+
+def mutation_df(n=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    start = rng.integers(1, 300, n)
+    return cosmic_types(n, seed).assign(
+        Chr=rng.choice(["chr1", "chr2", "chrX"], n), Start=start, End=start, Ref=rng.choice(list("AC"), n), Alt=rng.choice(list("GT"), n)
+    ).loc[:, ['Chr', 'Start', 'End', 'Ref', 'Alt', 'Gene', 'type']]
+
+
+def test_pooled_scoring_and_condensing_match_single_thread():
+    weights_file = os.path.join(config_folder, "clinscoreLung_with_geneboost.yaml")
+    df = mutation_df()
+    try:
+        single = get_cosmic_score(df, cosmic_weights_file=weights_file, threads=1, verbose=0)
+        pd.testing.assert_frame_equal(get_cosmic_score(df, cosmic_weights_file=weights_file, threads=3, verbose=0), single)
+        condensed = condense_muts_clinscore(single, threads=1, verbose=0)
+        pooled = condense_muts_clinscore(single, threads=3, verbose=0)
+        sort_cols = ['Chr', 'Start', 'End']
+        pd.testing.assert_frame_equal(pooled.sort_values(sort_cols).reset_index(drop=True), condensed.sort_values(sort_cols).reset_index(drop=True))
+    finally:
+        close_pool()
+    # the groupby condensing per position
+    deduped = single.drop_duplicates(['Chr', 'Start', 'End', 'Ref', 'Alt'])
+    expected = deduped.groupby(sort_cols).agg(dict(
+        Ref="/".join, Alt="/".join, Gene="first", type="+".join, cosmic_score="sum"
+    )).reset_index().loc[:, single.columns]
+    pd.testing.assert_frame_equal(condensed.sort_values(sort_cols).reset_index(drop=True), expected, check_dtype=False)
@@ -0,0 +1,98 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "code"))
+from cosmic_panel import compute_cosmic_density, filter_cosmic, roll, sliding_max, solve_panel_size
+from pyseq_utils import full_collapse, chrom_categories
+from pool_utils import close_pool
+
+filter_setting = dict(cosmic_rolling_min=2, rolling_window_size=5, cosmic_min=20, cosmic_density_min=0.5, padding=50)
+
+
+def scored_df(n=3000, seed=0):
+    rng = np.random.default_rng(seed)
+    chroms = rng.choice(["chr1", "chr2", "chr10", "chrX"], n, p=[0.4, 0.3, 0.2, 0.1])
+    start = rng.integers(1000, 200000, n)
+    return pd.DataFrame(dict(
+        Chr=chrom_categories(pd.Series(chroms)),
+        Start=start,
+        End=start + rng.integers(0, 3, n),
+        Ref="A",
+        Alt="G",
+        Func="exonic",
+        Gene=pd.Series(rng.choice(["RB1", "TP53", "KRAS"], n)).astype("category"),
+        cytoband=rng.choice(["1p", "1q"], n),
+        gnomAD=rng.random(n) / 100,
+        cosmic_score=rng.integers(0, 50, n),
+        type="1x(carcinoma)"
+    ))
+
+
+def test_density_and_collapse_threads_match_single_process():
+    df = scored_df()
+    try:
+        for window in [dict(), dict(rolling_window_bp=500)]:
+            setting = {**filter_setting, **window}
+            single = compute_cosmic_density(df, filter_setting=setting, verbose=0)
+            pooled = compute_cosmic_density(df, filter_setting=setting, verbose=0, threads=3)
+            pd.testing.assert_frame_equal(pooled, single)
+        panel_df = single.query("cosmic_score > 20")
+        for single, pooled in zip(full_collapse(panel_df, padding=50, verbose=0), full_collapse(panel_df, padding=50, verbose=0, threads=3)):
+            pd.testing.assert_frame_equal(pooled, single)
+    finally:
+        close_pool()
+
+
+def rolling_density(chrom_df, window_size):
+    # the pandas rolling version of roll (per chromosome, windows merged back onto their first mutation)
+    rolled = chrom_df.rolling(window_size).agg({"Start": "min", "End": "max", "cosmic_score": "sum"}).fillna(0).astype(int)
+    rolled["cosmic_density"] = rolled["cosmic_score"] / (rolled["End"] - rolled["Start"])
+    chrom_df = chrom_df.merge(rolled.loc[:, ["Start", "cosmic_density"]], on="Start", how="left")
+    chrom_df["cosmic_density"] = chrom_df["cosmic_density"].ffill()
+    return chrom_df
+
+
+def test_sliding_max():
+    values = np.random.default_rng(1).integers(0, 1000, 1003)
+    for window_size in [1, 2, 7, 100, 1003]:
+        expected = np.lib.stride_tricks.sliding_window_view(values, window_size).max(axis=1)
+        np.testing.assert_array_equal(sliding_max(values, window_size), expected)
+
+
+def test_roll_matches_pandas_rolling():
+    df = scored_df(seed=2).drop_duplicates(["Chr", "Start"]).sort_values(["Chr", "Start"]).reset_index(drop=True)
+    # a chromosome with fewer mutations than the window stays without density
+    df = pd.concat([df, df.iloc[:3].assign(Chr="chrY")], ignore_index=True)
+    df["Chr"] = chrom_categories(df["Chr"])
+    for window_size in [1, 5, 40]:
+        rolled = roll(df, window_size)
+        expected = pd.concat([rolling_density(chrom_df.loc[:, ["Start", "End", "cosmic_score"]], window_size) for _, chrom_df in df.groupby("Chr", observed=True)], ignore_index=True)
+        np.testing.assert_allclose(rolled["cosmic_density"].values, expected["cosmic_density"].values)
+
+
+def panel_size(denscored, setting):
+    # the library size and mutation count of the panel filtered and collapsed with setting
+    mut_df = filter_cosmic(denscored, filter_setting=setting, verbose=0)
+    if mut_df.empty:
+        return 0, 0
+    region_df = full_collapse(mut_df, padding=setting['padding'], verbose=0)[1]
+    return region_df['stretch'].sum(), region_df['mutN'].sum()
+
+
+def test_solve_panel_size_matches_filtered_panel():
+    df = scored_df(seed=3)
+    df['End'] = df['Start'] + np.random.default_rng(3).integers(0, 300, len(df.index))
+    denscored = compute_cosmic_density(df, filter_setting=filter_setting, verbose=0)
+    for target_kb, target_mutN in [(40, 0), (0, 300), (60, 500)]:
+        setting, panel_mut_df, panel_region_df = solve_panel_size(denscored, filter_setting, target_kb=target_kb, target_mutN=target_mutN, verbose=0)
+        assert setting['padding'] in [25, 38, 50]
+        size, mutN = panel_size(denscored, setting)
+        assert (size, mutN) == (panel_region_df['stretch'].sum(), panel_region_df['mutN'].sum())
+        assert (not target_kb or size <= target_kb * 1000) and (not target_mutN or mutN <= target_mutN)
+        # the next lower cosmic_min breaks the limits
+        lower = denscored['cosmic_score'].loc[denscored['cosmic_score'] < setting['cosmic_min']]
+        if len(lower.index):
+            size, mutN = panel_size(denscored, {**setting, 'cosmic_min': lower.max()})
+            assert (target_kb and size > target_kb * 1000) or (target_mutN and mutN > target_mutN)
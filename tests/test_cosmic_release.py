@@ -0,0 +1,67 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "code"))
+from cosmic_panel import score_cosmic, cosmic_panel_master
+from cosmic_release import diff_releases, refresh_panel
+from pyseq_utils import chrom_categories
+from variant_key import variant_keys, sort_by_key
+
+weights_file = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "configs", "clinscoreLung.yaml")
+types = ["15x(carcinoma@lung)+2x(NS@NS)", "3x(adenocarcinoma@right_upper_lobe)", "40x(cancer@lung)", "1x(glioma@NS)", "8x(carcinoma@NS)"]
+filter_setting = dict(exonic_list=['exonic'], mut_list=['nonsynonymous SNV'], gnomad_max=0.01, cosmic_rolling_min=30, rolling_window_size=5, cosmic_min=3000, cosmic_density_min=20, padding=75)
+
+
+def anno_df(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    start = rng.integers(1, 40000, rows)
+    df = pd.DataFrame(dict(
+        Chr=rng.choice(["chr1", "chr2", "chr7"], rows), Start=start, End=start, Ref="A", Alt=rng.choice(["C", "G", "T"], rows),
+        Func="exonic", Gene=rng.choice(["EGFR", "KRAS", "TP53"], rows), ExonicFunc="nonsynonymous SNV", AAChange="x",
+        cytoband="1p", gnomAD=0.0, Mut_ID=[f"COSV{i}" for i in range(rows)], type=rng.choice(types, rows)
+    ))
+    return release(df)
+
+
+def release(df):
+    df = df.drop_duplicates(['Chr', 'Start', 'End', 'Ref', 'Alt']).copy()
+    df['Chr'] = chrom_categories(df['Chr'].astype(str))
+    return sort_by_key(df, variant_keys(df)[0])[0].reset_index(drop=True)
+
+
+def new_release(old):
+    rng = np.random.default_rng(1)
+    new = old.loc[rng.random(len(old.index)) > 0.02].copy()
+    is_changed = rng.random(len(new.index)) < 0.02
+    new.loc[is_changed, 'type'] = new.loc[is_changed, 'type'] + "+20x(carcinoma@lung)"
+    added = anno_df(100, seed=2).assign(Mut_ID="COSVnew")
+    return release(pd.concat([new, added], ignore_index=True)), is_changed.sum()
+
+
+def test_diff_releases():
+    old = anno_df(3000)
+    new, changed = new_release(old)
+    diff = diff_releases(old, new, verbose=0)
+    old_ids = set(map(tuple, old.iloc[:, :5].astype(str).values))
+    new_ids = set(map(tuple, new.iloc[:, :5].astype(str).values))
+    assert set(map(tuple, diff['added'].iloc[:, :5].astype(str).values)) == new_ids - old_ids
+    assert set(map(tuple, diff['removed'].iloc[:, :5].astype(str).values)) == old_ids - new_ids
+    assert len(diff['changed'].index) == changed
+    # the row order does not matter
+    assert not any(len(df.index) for df in diff_releases(old, old.sample(frac=1, random_state=0), verbose=0).values())
+
+
+def test_refresh_panel_matches_full_run():
+    old = anno_df(3000)
+    new, _ = new_release(old)
+    old_scored = score_cosmic(old, weights_file, threads=1, verbose=0)
+    old_panel = cosmic_panel_master(old_scored, filter_setting=filter_setting, threads=1, verbose=0, use_cache=False)
+    new_scored = score_cosmic(new, weights_file, threads=1, verbose=0)
+    new_panel = cosmic_panel_master(new_scored, filter_setting=filter_setting, threads=1, verbose=0, use_cache=False)
+    diff = diff_releases(old, new, verbose=0)
+    anno, scored, panel, changes = refresh_panel(old, old_scored, old_panel, diff, weights_file, filter_setting, threads=1, verbose=0)
+    assert changes['status'].isin(["entered", "left", "resized"]).all() and len(changes.index)
+    for refreshed, full in zip([anno, scored, *panel], [new, new_scored.sort_values(['Chr', 'Start', 'End'], kind="mergesort"), *new_panel]):
+        pd.testing.assert_frame_equal(refreshed.reset_index(drop=True).astype(str), full.reset_index(drop=True).astype(str))
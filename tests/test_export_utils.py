@@ -0,0 +1,44 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "code"))
+from export_utils import write_xlsx, export_background, report_exports
+
+
+def test_write_xlsx_roundtrip(tmp_path):
+    df = pd.DataFrame(dict(a=np.arange(5), b=list("vwxyz"), c=np.linspace(0, 1, 5)))
+    file = str(tmp_path / "sheets.xlsx")
+    write_xlsx({'S1': df, 'S2': df}, file)
+    for sheet in ['S1', 'S2']:
+        pd.testing.assert_frame_equal(pd.read_excel(file, sheet_name=sheet), df, check_dtype=False)
+
+
+def test_write_xlsx_no_header(tmp_path):
+    df = pd.DataFrame(dict(a=[1, 2], b=["x", "y"]))
+    file = str(tmp_path / "sheets.xlsx")
+    write_xlsx({'S1': df}, file, no_header=['S1'])
+    back = pd.read_excel(file, sheet_name='S1', header=None)
+    assert back.values.tolist() == df.values.tolist()
+
+
+def test_write_xlsx_chunks_and_missing_values(tmp_path):
+    df = pd.DataFrame(dict(
+        a=np.arange(25),
+        b=pd.Series(list("xyz" * 8) + [None]).astype("category"),
+        c=np.where(np.arange(25) % 4, np.arange(25) / 4, np.nan),
+        d=np.arange(25) % 2 == 0
+    ))
+    file = str(tmp_path / "sheets.xlsx")
+    write_xlsx({'S1': df}, file, chunksize=7)
+    back = pd.read_excel(file, sheet_name='S1')
+    pd.testing.assert_frame_equal(back, df.astype({'b': object}), check_dtype=False)
+
+
+def test_failed_background_export_is_reported(tmp_path, capsys):
+    df = pd.DataFrame(dict(a=[1]))
+    job = export_background({'S1': df}, str(tmp_path / "missing" / "sheets.xlsx"), formats=["tsv"])
+    job.exception()
+    report_exports()
+    assert "Background export failed" in capsys.readouterr().out
@@ -0,0 +1,58 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "code"))
+from fasta_utils import build_fai, fetch_regions, fetch_sequences, fetch_region
+
+
+def write_fasta(fasta_file, seqs, widths, newline="\n"):
+    with open(fasta_file, "w", newline="") as stream:
+        for (name, seq), width in zip(seqs.items(), widths):
+            stream.write(f">{name} test sequence{newline}")
+            stream.write("".join(seq[i:i + width] + newline for i in range(0, len(seq), width)))
+
+
+def genome(seed=0):
+    rng = np.random.default_rng(seed)
+    return {name: "".join(rng.choice(list("ACGTacgtN"), length)) for name, length in [("chr1", 500), ("chr2", 61), ("chrM", 7)]}
+
+
+def random_regions(seqs, n=300, seed=0):
+    rng = np.random.default_rng(seed)
+    chroms = rng.choice(list(seqs) + ["chr7"], n)
+    start = rng.integers(1, 520, n)
+    return pd.DataFrame(dict(Chr=chroms, Start=start, End=start + rng.integers(-1, 40, n)))
+
+
+def test_fetch_regions_across_line_wraps(tmp_path):
+    seqs = genome()
+    for widths, newline in [([60, 13, 7], "\n"), ([7, 60, 3], "\r\n")]:
+        fasta_file = str(tmp_path / f"genome{widths[0]}.fa")
+        write_fasta(fasta_file, seqs, widths, newline=newline)
+        regions = random_regions(seqs)
+        # plain slicing of the sequences (clipped at the end, empty for unknown sequences)
+        expected = [seqs.get(chrom, "")[max(start - 1, 0):end].upper() for chrom, start, end in regions.values]
+        assert fetch_sequences(fasta_file, regions) == expected
+        assert fetch_sequences(fasta_file, regions.assign(Chr=regions['Chr'].str.replace("chr", ""))) == expected
+        seq, offsets, lengths = fetch_regions(fasta_file, regions, upper=False)
+        assert lengths.tolist() == [len(s) for s in expected]
+        assert seq[offsets[0]:offsets[0] + lengths[0]].tobytes().decode() == seqs.get(regions['Chr'][0], "")[regions['Start'][0] - 1:regions['End'][0]]
+        # whole sequences ending on a line break
+        assert fetch_region(fasta_file, "chrM", 1, 7) == seqs['chrM'].upper()
+        assert fetch_region(fasta_file, "chr1", 1, 1000, upper=False) == seqs['chr1']
+
+
+def test_build_fai_and_changed_fasta(tmp_path):
+    seqs = genome()
+    fasta_file = str(tmp_path / "genome.fa")
+    write_fasta(fasta_file, seqs, [60, 13, 7])
+    fai = build_fai(fasta_file)
+    assert fai.values.tolist() == [["chr1", 500, 20, 60, 61], ["chr2", 61, 549, 13, 14], ["chrM", 7, 635, 7, 8]]
+    assert fetch_region(fasta_file, "chr2", 55, 61) == seqs['chr2'][54:].upper()
+    # a rewritten fasta is reopened and reindexed
+    seqs = genome(seed=1)
+    write_fasta(fasta_file, seqs, [9, 9, 9])
+    os.utime(fasta_file, (os.path.getmtime(fasta_file) + 10,) * 2)
+    assert fetch_region(fasta_file, "chr2", 5, 30) == seqs['chr2'][4:30].upper()
@@ -0,0 +1,59 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "code"))
+from interval_index import build_interval_index, save_interval_index, load_interval_index, interval_join
+
+
+def random_intervals(n, max_len, seed):
+    rng = np.random.default_rng(seed)
+    start = rng.integers(1, 2000, n)
+    return pd.DataFrame(dict(
+        Chr=rng.choice(['chr1', 'chr2', 'chrX'], n),
+        Start=start,
+        End=start + rng.integers(0, max_len, n)
+    ))
+
+
+def brute_join(regions, df, how):
+    '''
+    the pairwise region query the interval index replaces
+    '''
+
+    pairs = regions.assign(chrom=regions['Chr'].str.replace("chr", ""), region=np.arange(len(regions.index))).merge(
+        df.assign(chrom=df['Chr'].str.replace("chr", ""), row=np.arange(len(df.index))), on="chrom", suffixes=("_region", "")
+    )
+    if how == "contained":
+        is_hit = (pairs['Start'] >= pairs['Start_region']) & (pairs['End'] <= pairs['End_region'])
+    else:
+        is_hit = (pairs['Start'] <= pairs['End_region']) & (pairs['End'] >= pairs['Start_region'])
+    return sorted(zip(pairs.loc[is_hit, 'region'], pairs.loc[is_hit, 'row']))
+
+
+def test_interval_join_matches_pairwise_query():
+    # long intervals hide short ones behind them (running maximum of End)
+    df = pd.concat([random_intervals(500, 20, 0), random_intervals(20, 800, 1)], ignore_index=True)
+    regions = random_intervals(100, 200, 2)
+    # chromosome names without chr and chromosomes missing in df
+    regions.loc[::3, 'Chr'] = regions.loc[::3, 'Chr'].str.replace("chr", "")
+    regions.loc[::7, 'Chr'] = "chr5"
+    for how in ["overlap", "contained"]:
+        joined = interval_join(regions.assign(region=np.arange(len(regions.index))), df.assign(row=np.arange(len(df.index))), how=how)
+        assert sorted(zip(joined['region'], joined['row'])) == brute_join(regions, df, how)
+        assert (joined.loc[:, ['Chr', 'Start', 'End']].values == df.iloc[joined['row']].values).all()
+        assert joined.columns.tolist() == ['Chr', 'Start', 'End', 'row', 'Chr_region', 'Start_region', 'End_region', 'region']
+
+
+def test_interval_join_saved_and_stale_index(tmp_path, capsys):
+    df = random_intervals(300, 50, 3)
+    regions = random_intervals(30, 100, 4)
+    index_file = str(tmp_path / "index.npz")
+    save_interval_index(build_interval_index(df), index_file)
+    expected = interval_join(regions, df)
+    pd.testing.assert_frame_equal(interval_join(regions, df, index=load_interval_index(index_file)), expected)
+    # an index of another df is rebuilt
+    stale = build_interval_index(df.iloc[:100])
+    pd.testing.assert_frame_equal(interval_join(regions, df, index=stale), expected)
+    assert "will be rebuilt" in capsys.readouterr().out
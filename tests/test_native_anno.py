@@ -0,0 +1,70 @@
+import os
+import sys
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "code"))
+from native_anno import annotate_gene, validate_gene_anno
+
+# NM_0001 (+): exons 101-130, 151-200, CDS 111-190 | NM_0002 (-): exons 1001-1020, 1031-1060, CDS 1006-1057
+gene_pred = [
+    "0\tNM_0001\tchr1\t+\t100\t200\t110\t190\t2\t100,150,\t130,200,\t0\tGENEA\tcmpl\tcmpl\t0,1,",
+    "0\tNM_0002\tchr1\t-\t1000\t1060\t1005\t1057\t2\t1000,1030,\t1020,1060,\t0\tGENEB\tcmpl\tcmpl\t0,0,",
+]
+cds1 = "ATGAAATGGGGCCCCTTTCAGTACGACAACATCCTGCATCGTAGCACCGTTGAGAAGTAA"
+cds2 = "ATGGCTGAATGCAAACCGTTAGGTCACTGGATCCGAAACTGA"
+mrna = {"NM_0001": "C" * 10 + cds1 + "A" * 10, "NM_0002": "GGG" + cds2 + "TTTTT"}
+
+# the annovar (table_annovar.pl) output for these SNVs
+multianno = [
+    ("114", "A", "G", "exonic", "GENEA", ".", "nonsynonymous SNV", "GENEA:NM_0001:exon1:c.A4G:p.K2E"),
+    ("116", "A", "G", "exonic", "GENEA", ".", "synonymous SNV", "GENEA:NM_0001:exon1:c.A6G:p.K2K"),
+    ("118", "G", "A", "exonic", "GENEA", ".", "stopgain", "GENEA:NM_0001:exon1:c.G8A:p.W3X"),
+    ("188", "T", "C", "exonic", "GENEA", ".", "stoploss", "GENEA:NM_0001:exon2:c.T58C:p.X20Q"),
+    ("111", "A", "G", "exonic", "GENEA", ".", "startloss", "GENEA:NM_0001:exon1:c.A1G:p.M1V"),
+    ("140", "T", "C", "intronic", "GENEA", ".", ".", "."),
+    ("131", "G", "A", "splicing", "GENEA", "NM_0001:exon1:c.20+1G>A", ".", "."),
+    ("150", "G", "A", "splicing", "GENEA", "NM_0001:exon2:c.21-1G>A", ".", "."),
+    ("105", "C", "T", "UTR5", "GENEA", "NM_0001:c.-6C>T", ".", "."),
+    ("195", "A", "G", "UTR3", "GENEA", "NM_0001:c.*5A>G", ".", "."),
+    ("1054", "C", "T", "exonic", "GENEB", ".", "nonsynonymous SNV", "GENEB:NM_0002:exon1:c.G4A:p.A2T"),
+    ("1020", "A", "G", "exonic", "GENEB", ".", "nonsynonymous SNV", "GENEB:NM_0002:exon2:c.T28C:p.W10R"),
+    ("1018", "C", "T", "exonic", "GENEB", ".", "stopgain", "GENEB:NM_0002:exon2:c.G30A:p.W10X"),
+]
+anno_cols = ["Func.refGene", "Gene.refGene", "GeneDetail.refGene", "ExonicFunc.refGene", "AAChange.refGene"]
+
+
+def write_mrna(folder, mrna):
+    mrna_file = os.path.join(folder, "hg38_refGeneMrna.fa")
+    with open(mrna_file, "w") as stream:
+        for name, seq in mrna.items():
+            stream.write(f">{name} #chr1\n{seq[:30]}\n{seq[30:]}\n")
+    return mrna_file
+
+
+def write_gene_db(folder, mrna):
+    db_file = os.path.join(folder, "hg38_refGene.txt")
+    with open(db_file, "w") as stream:
+        stream.write("\n".join(gene_pred) + "\n")
+    write_mrna(folder, mrna)
+    return db_file
+
+
+def test_annotate_gene_matches_annovar(tmp_path):
+    db_file = write_gene_db(str(tmp_path), mrna)
+    multianno_file = str(tmp_path / "hg38_multianno.txt")
+    df = pd.DataFrame([("chr1", pos, pos, ref, alt, *anno) for pos, ref, alt, *anno in multianno], columns=["Chr", "Start", "End", "Ref", "Alt"] + anno_cols)
+    # indels are left to annovar and not compared
+    pd.concat([df, pd.DataFrame([["chr1", "114", "115", "AA", "-"] + ["x"] * 5], columns=df.columns)]).to_csv(multianno_file, sep="\t", index=False)
+    assert validate_gene_anno(multianno_file, db_file, "refGene").empty
+    indel = annotate_gene(pd.DataFrame(dict(Chr=["chr1"], Start=[114], End=[115], Ref=["AA"], Alt=["-"])), db_file, "refGene", verbose=0)
+    assert (indel.values == ".").all()
+
+
+def test_gene_model_reloads_changed_mrna(tmp_path):
+    db_file = write_gene_db(str(tmp_path), mrna)
+    snv = pd.DataFrame(dict(Chr=["chr1"], Start=[114], End=[114], Ref=["A"], Alt=["G"]))
+    assert annotate_gene(snv, db_file, "refGene", verbose=0)["AAChange.refGene"].iloc[0].endswith("c.A4G:p.K2E")
+    # codon 2 AAA --> CAA in a newer Mrna.fa
+    mrna_file = write_mrna(str(tmp_path), {**mrna, "NM_0001": mrna["NM_0001"][:13] + "C" + mrna["NM_0001"][14:]})
+    os.utime(mrna_file, (os.path.getmtime(db_file) + 10,) * 2)
+    assert annotate_gene(snv, db_file, "refGene", verbose=0)["AAChange.refGene"].iloc[0].endswith("c.C4G:p.Q2E")
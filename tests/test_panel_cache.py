@@ -0,0 +1,80 @@
+import os
+import sys
+from functools import wraps
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "code"))
+import cosmic_panel
+from panel_cache import clear_cache, set_cache_size, set_cached, get_cached, frame_size, cache_state
+
+filter_setting = dict(cosmic_rolling_min=2, rolling_window_size=5, cosmic_min=20, cosmic_density_min=0.5, padding=50)
+
+
+def scored_df(n=500, seed=0):
+    rng = np.random.default_rng(seed)
+    start = rng.integers(1000, 50000, n)
+    return pd.DataFrame(dict(
+        Chr=rng.choice(["chr1", "chr2"], n),
+        Start=start,
+        End=start + rng.integers(0, 3, n),
+        Gene=rng.choice(["RB1", "TP53"], n),
+        cytoband="1p",
+        gnomAD=0.0,
+        Func="exonic",
+        cosmic_score=rng.integers(0, 50, n)
+    ))
+
+
+def count_stages(monkeypatch):
+    calls = []
+    for name in ["compute_cosmic_density", "filter_cosmic", "full_collapse"]:
+        func = getattr(cosmic_panel, name)
+        counted = wraps(func)(lambda *args, func=func, name=name, **kwargs: calls.append(name) or func(*args, **kwargs))
+        monkeypatch.setattr(cosmic_panel, name, counted)
+    return calls
+
+
+def test_stage_keys_invalidate_changed_stages(monkeypatch):
+    clear_cache()
+    calls = count_stages(monkeypatch)
+    df = scored_df()
+
+    def run(df=df, use_cache=True, **setting):
+        calls.clear()
+        result = cosmic_panel.cosmic_panel_master(df, filter_setting={**filter_setting, **setting}, threads=1, verbose=0, use_cache=use_cache)
+        return result, sorted(calls)
+
+    expected, stages = run()
+    assert stages == ["compute_cosmic_density", "filter_cosmic", "full_collapse"]
+    result, stages = run()
+    assert stages == []
+    for cached, computed in zip(result, expected):
+        pd.testing.assert_frame_equal(cached, computed)
+    # only the changed stage and the stages after it are rerun
+    assert run(padding=20)[1] == ["full_collapse"]
+    assert run(cosmic_min=30)[1] == ["filter_cosmic", "full_collapse"]
+    assert run(rolling_window_size=3)[1] == ["compute_cosmic_density", "filter_cosmic", "full_collapse"]
+    assert run(df=df.assign(cosmic_score=df['cosmic_score'] + 1))[1] == ["compute_cosmic_density", "filter_cosmic", "full_collapse"]
+    assert run(use_cache=False)[1] == ["compute_cosmic_density", "filter_cosmic", "full_collapse"]
+    # changes to returned results do not reach the cache
+    result[1]['Start'] = 0
+    result, stages = run()
+    assert stages == [] and (result[1]['Start'] > 0).all()
+    clear_cache()
+
+
+def test_cache_evicts_least_recently_used():
+    clear_cache()
+    dfs = {key: pd.DataFrame(dict(x=np.arange(1000) + i)) for i, key in enumerate("abc")}
+    size = frame_size(dfs['a'])
+    set_cache_size(2.5 * size / 1024 ** 3)
+    set_cached("a", dfs['a'])
+    set_cached("b", dfs['b'])
+    # a was used last, so b is evicted
+    assert get_cached("a").equals(dfs['a'])
+    set_cached("c", dfs['c'])
+    assert list(cache_state['entries']) == ["a", "c"] and cache_state['size'] == 2 * size
+    assert get_cached("b") is None
+    set_cache_size()
+    clear_cache()
@@ -0,0 +1,91 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "code"))
+from pyseq_utils import remove_gene_dups, remove_cosmic_dups, load_anno, anno_chroms, merge_intervals, get_bedsize
+
+
+def test_remove_gene_dups():
+    genes = ["RB1;RB1", "RB1;RB1-AS1", "X-RB1;RB1", "A;A;A;B;B", "TP53", np.nan, "MT-ND1;MT-ND1", "TP53;TP53"]
+    df = remove_gene_dups(pd.DataFrame(dict(Gene=pd.Categorical(genes))))
+    assert isinstance(df['Gene'].dtype, pd.CategoricalDtype)
+    assert df['Gene'].astype(object).where(df['Gene'].notna(), None).tolist() == [
+        "RB1", "RB1;RB1-AS1", "X-RB1;RB1", "A;B", "TP53", None, "MT-ND1", "TP53"
+    ]
+
+
+def test_remove_cosmic_dups_rows_without_key():
+    df = pd.DataFrame(dict(
+        Chr=["chr1", "1", "chr1", "chrUn_x", "chrUn_x", "chrUn_x"],
+        Start=[5, 5, 6, 7, 7, 8], End=[5, 5, 6, 7, 7, 8], Ref=list("AAAGGG"), Alt=list("CCCTTT"),
+        Gene=["G"] * 6, Mut_ID=[f"m{i}" for i in range(6)], type=list("abcdef")
+    ))
+    df = remove_cosmic_dups(df)
+    # the unplaced contig has no variant key, so only its identical variants are merged
+    assert sorted(zip(df['Mut_ID'], df['type'])) == [("m0", "a+b"), ("m2", "c"), ("m3", "d+e"), ("m5", "f")]
+
+
+anno_text = """Chr\tStart\tEnd\tRef\tAlt\tFunc.refGene\tGene.refGene\tExonicFunc.refGene\tAAChange.refGene\tcytoband\tgnomAD_exome_ALL\tOtherinfo\tOther2
+Chr\tStart\tEnd\tRef\tAlt\t.\t.\t.\t.\t.\t.\tMut_ID\ttype
+chr1\t5\t5\tA\tG\texonic\tNA\tnonsynonymous SNV\tNA\t1p\tNA\tCOSV1\t1x(carcinoma)
+chr2\t7\t7\tA\tT\texonic\tKRAS\tnonsynonymous SNV\t\t2q\t0.5\tCOSV2\tnan
+"""
+
+
+def test_load_anno_cached_and_uncached_match(tmp_path, capsys):
+    anno_file = tmp_path / "anno.txt"
+    anno_file.write_text(anno_text)
+    uncached = load_anno(str(anno_file), use_cache=False)
+    cached = load_anno(str(anno_file), use_cache=True)
+    pd.testing.assert_frame_equal(cached, uncached, check_categorical=False)
+    # only empty fields are missing
+    assert uncached['Gene'].astype(str).tolist() == ["NA", "KRAS"] and uncached['type'].tolist()[1] == "nan"
+    assert uncached['AAChange'].isna().tolist() == [False, True]
+    assert uncached['gnomAD'].tolist() == [0, 0.5]
+    # the cache location is reported
+    assert str(tmp_path / ".table_cache") in capsys.readouterr().out
+    assert anno_chroms(str(anno_file), use_cache=False) == anno_chroms(str(anno_file), use_cache=True) == ["1", "2"]
+
+
+# contained, chained, adjacent and isolated intervals (half-open like bed)
+intervals = [(10, 100), (20, 30), (40, 50), (110, 120), (115, 130), (125, 140), (140, 150), (300, 310)]
+
+
+def union_size(df):
+    return sum(len(set().union(*[range(s, e) for s, e in zip(chrom_df['Start'], chrom_df['End'])])) for _, chrom_df in df.groupby("Chr"))
+
+
+def interval_df():
+    df = pd.DataFrame(
+        [("chr1", s, e) for s, e in intervals] + [("chr2", s + 1000, e + 1000) for s, e in intervals[:3]],
+        columns=['Chr', 'Start', 'End']
+    )
+    return df.assign(Gene=["G" + str(i % 4) for i in range(len(df.index))], score=range(len(df.index)))
+
+
+def test_merge_intervals_contained_and_chained():
+    df = interval_df()
+    merged, groups = merge_intervals(df.iloc[::-1], agg=dict(Gene="min", score="sum"))
+    assert groups.loc[:, ['Chr', 'Start', 'End', 'stretch']].values.tolist() == [
+        ["chr1", 10, 100, 90], ["chr1", 110, 140, 30], ["chr1", 140, 150, 10], ["chr1", 300, 310, 10], ["chr2", 1010, 1100, 90]
+    ]
+    assert groups['Gene'].tolist() == ["G0", "G0", "G2", "G3", "G0"] and groups['score'].tolist() == [3, 12, 6, 7, 27]
+    assert merged['ovgroup'].tolist() == [1, 1, 1, 2, 2, 2, 3, 4, 5, 5, 5]
+    # the contained (40, 50) is not counted twice, unlike the neighbour-based overlaps before
+    assert groups['stretch'].sum() == union_size(df)
+    # padding merges the adjacent groups
+    groups = merge_intervals(df, pad=10)[1]
+    assert groups.loc[:, ['Start', 'End']].values.tolist() == [[0, 160], [290, 320], [1000, 1110]]
+
+
+def test_get_bedsize_contained_and_chained(tmp_path):
+    df = interval_df().loc[:, ['Chr', 'Start', 'End']]
+    bed_file = tmp_path / "regions.bed"
+    bed_file.write_text("track name=panel\n#Chr\tStart\tEnd\n" + df.to_csv(sep="\t", header=False, index=False))
+    # chunks of 2 rows carry the open region over the chunk borders
+    assert get_bedsize(str(bed_file)) == get_bedsize(str(bed_file), chunksize=2) == union_size(df) == 230
+    unsorted_file = tmp_path / "unsorted.bed"
+    unsorted_file.write_text(df.sample(frac=1, random_state=0).to_csv(sep="\t", header=False, index=False))
+    assert get_bedsize(str(unsorted_file), chunksize=3) == get_bedsize(str(unsorted_file), chunksize=3, threads=2) == 230
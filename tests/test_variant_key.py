@@ -0,0 +1,67 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "code"))
+from script_utils import chrom_order
+from variant_key import merge_on_key, variant_keys, decode_keys
+
+
+def variant_df():
+    return pd.DataFrame(dict(
+        Chr=['chr1', 'chr1', 'chr2', 'chr2', 'chr2', 'chr1'],
+        Start=[10, 10, np.nan, -1, np.nan, 20],
+        End=[10, 10, np.nan, -1, np.nan, 20],
+        Ref=list('AAGGTC'),
+        Alt=list('CCTTAG')
+    ))
+
+
+def test_merge_on_key_rows_without_key():
+    left = variant_df().assign(L=range(6))
+    right = variant_df().assign(R=range(6)).iloc[::-1]
+    merged = merge_on_key(left, right)
+    # rows without a valid key only match rows with the same variant columns
+    assert merged['L'].tolist() == [0, 0, 1, 1, 2, 3, 4, 5]
+    assert merged.loc[merged['L'] >= 2, 'R'].tolist() == [2, 3, 4, 5]
+
+
+def test_merge_on_key_one_to_one():
+    left = variant_df().assign(L=range(6))
+    right = variant_df().assign(R=range(6))
+    merged = merge_on_key(left, right, how="left", one_to_one=True)
+    assert merged['L'].tolist() == merged['R'].tolist() == list(range(6))
+    pd.testing.assert_frame_equal(merged.loc[:, left.columns], left)
+
+
+def random_variants(n=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    start = rng.integers(1, 5000, n)
+    alleles = rng.choice(['A', 'C', 'G', 'T', 'AC', 'GTT', '-'], size=(n, 2))
+    length = np.where(alleles[:, 0] == '-', 0, np.char.str_len(alleles[:, 0].astype(str)) - 1)
+    return pd.DataFrame(dict(
+        Chr=rng.choice(['chr1', 'chr2', 'chr10', 'chrX', 'chrM', '3'], n),
+        Start=start, End=start + length, Ref=alleles[:, 0], Alt=alleles[:, 1]
+    ))
+
+
+def test_variant_keys_roundtrip():
+    df = random_variants()
+    keys, key_table = variant_keys(df)
+    assert (keys >= 0).all()
+    decoded = decode_keys(keys, key_table)
+    expected = df.assign(Chr=df['Chr'].str.replace("chr", ""))
+    pd.testing.assert_frame_equal(decoded.astype({'Start': np.int64, 'End': np.int64}), expected, check_dtype=False)
+    # equal keys are equal variants
+    assert pd.Series(keys).duplicated().tolist() == expected.duplicated().tolist()
+
+
+def test_variant_keys_sort_like_variants():
+    df = random_variants(seed=1)
+    keys = variant_keys(df)[0]
+    by_keys = df.iloc[np.argsort(keys, kind="mergesort")].reset_index(drop=True)
+    by_cols = df.assign(chrom=df['Chr'].map(chrom_order)).sort_values(
+        ['chrom', 'Start', 'End', 'Ref', 'Alt'], kind="mergesort"
+    ).drop(columns="chrom").reset_index(drop=True)
+    pd.testing.assert_frame_equal(by_keys, by_cols)
@@ -0,0 +1,79 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "code"))
+import anno
+from vcf_utils import trim_allele, trim_alleles, vcf2annovar, iter_vcf
+
+# vcf alleles --> convert2annovar.pl -format vcf4 output
+convert2annovar_cases = [
+    ((100, "A", "G"), (100, 100, "A", "G")),
+    ((100, "ACG", "A"), (101, 102, "CG", "-")),
+    ((100, "A", "ATT"), (100, 100, "-", "TT")),
+    ((100, "AC", "GT"), (100, 101, "AC", "GT")),
+    ((100, "AC", "AT"), (101, 101, "C", "T")),
+    ((100, "ACT", "GT"), (100, 101, "AC", "G")),
+    ((100, "ATG", "AC"), (101, 102, "TG", "C")),
+    ((100, "AGTG", "AG"), (102, 103, "TG", "-")),
+    ((100, "CAT", "CT"), (101, 101, "A", "-")),
+    ((100, "CT", "CAT"), (100, 100, "-", "A")),
+    ((100, "GTC", "GAAC"), (101, 101, "T", "AA")),
+]
+
+vcf_text = """##fileformat=VCFv4.2
+#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO
+chr1\t100\trs1\tA\tG,A,*\t50\tPASS\tDP=10
+chr1\t200\trs2\tC\tC\t50\tPASS\tDP=11
+chr1\t300\trs3\tACG\tA\t50\tPASS\tDP=12
+chr2\t400\trs4\tT\tTA,<DEL>\t50\tPASS\tDP=13
+chr2\t500\trs5\tcat\tCAT,CT\t50\tPASS\tDP=14
+"""
+
+
+def test_trim_allele_matches_convert2annovar():
+    for (pos, ref, alt), expected in convert2annovar_cases:
+        assert trim_allele(pos, ref, alt) == expected
+
+
+def test_trim_alleles_matches_trim_allele():
+    pos = np.array([case[0][0] for case in convert2annovar_cases], dtype=np.int64)
+    ref = [case[0][1] for case in convert2annovar_cases]
+    alt = [case[0][2] for case in convert2annovar_cases]
+    start, end, ref, alt = trim_alleles(pos, ref, alt)
+    assert list(zip(start.tolist(), end.tolist(), ref, alt)) == [expected for _, expected in convert2annovar_cases]
+
+
+def test_vcf2annovar_drops_uncalled_and_ref_alleles(tmp_path):
+    vcf_file = tmp_path / "test.vcf"
+    vcf_file.write_text(vcf_text)
+    anno_df = pd.concat(list(iter_vcf(str(vcf_file), chunksize=2)), ignore_index=True)
+    assert anno_df.loc[:, ['Chr', 'Start', 'End', 'Ref', 'Alt']].values.tolist() == [
+        ["chr1", 100, 100, "A", "G"],
+        ["chr1", 301, 302, "CG", "-"],
+        ["chr2", 400, 400, "-", "A"],
+        ["chr2", 501, 501, "A", "-"],
+    ]
+    assert anno_df['AltIndex'].tolist() == [1, 1, 1, 2]
+    assert anno_df['ID'].tolist() == ["rs1", "rs3", "rs4", "rs5"]
+
+
+def test_run_annovar_streams_vcf_chunks(tmp_path, monkeypatch):
+    chunks = []
+
+    def fake_annotate_variants(df, annovar_config, temp_folder="", **kwargs):
+        chunks.append(len(df.index))
+        return df.loc[:, anno.variant_cols].assign(Func="exonic", anno_row=np.arange(len(df.index)))
+
+    monkeypatch.setattr(anno, "annotate_variants", fake_annotate_variants)
+    vcf_file = tmp_path / "test.vcf"
+    vcf_file.write_text(vcf_text)
+    anno_df = anno.run_annovar(str(vcf_file), "config.yaml", use_cache=False, vcf_chunksize=2)
+    # every chunk of vcf records is annotated on its own
+    assert chunks == [1, 2, 1]
+    assert anno_df['Start'].tolist() == [100, 301, 400, 501]
+    assert anno_df['Func'].tolist() == ["exonic"] * 4
+    assert anno_df['ID'].tolist() == ["rs1", "rs3", "rs4", "rs5"]
+    assert anno_df.index.tolist() == [0, 1, 2, 3]
+    assert not [file for file in os.listdir(tmp_path) if file.startswith("anno_temp_")]